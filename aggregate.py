@@ -0,0 +1,211 @@
+"""
+Streaming aggregation for PyDBMS
+
+Rows are folded into per-group accumulators as they stream past, so memory
+grows with the number of groups, not the number of rows. Aggregates are given
+as {alias: (function, column)}, e.g.
+    {'orders': ('count', '*'), 'revenue': ('sum', 'price'), 'top': ('max', 'price')}
+Like SQL, every function but COUNT(*) skips missing (None) values.
+"""
+
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from storage import MISSING
+
+
+class Count:
+    """COUNT(column): rows where the column has a value"""
+
+    __slots__ = ('n',)
+
+    def __init__(self):
+        self.n = 0
+
+    def add(self, value: Any) -> None:
+        if value is not None:
+            self.n += 1
+
+    def merge(self, other: 'Count') -> None:
+        """Fold in an accumulator of the same kind, filled from other rows"""
+        self.n += other.n
+
+    def result(self) -> int:
+        return self.n
+
+
+class CountRows(Count):
+    """COUNT(*): every row"""
+
+    __slots__ = ()
+
+    def add(self, value: Any) -> None:
+        self.n += 1
+
+
+class Sum:
+    __slots__ = ('total', 'seen')
+
+    def __init__(self):
+        self.total = 0
+        self.seen = False
+
+    def add(self, value: Any) -> None:
+        if value is not None:
+            self.total += value
+            self.seen = True
+
+    def merge(self, other: 'Sum') -> None:
+        if other.seen:
+            self.add(other.total)
+
+    def result(self) -> Any:
+        return self.total if self.seen else None
+
+
+class Avg:
+    __slots__ = ('total', 'n')
+
+    def __init__(self):
+        self.total = 0
+        self.n = 0
+
+    def add(self, value: Any) -> None:
+        if value is not None:
+            self.total += value
+            self.n += 1
+
+    def merge(self, other: 'Avg') -> None:
+        self.total += other.total
+        self.n += other.n
+
+    def result(self) -> Optional[float]:
+        return self.total / self.n if self.n else None
+
+
+class Min:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = None
+
+    def add(self, value: Any) -> None:
+        if value is not None and (self.value is None or value < self.value):
+            self.value = value
+
+    def merge(self, other: 'Min') -> None:
+        self.add(other.value)
+
+    def result(self) -> Any:
+        return self.value
+
+
+class Max(Min):
+    __slots__ = ()
+
+    def add(self, value: Any) -> None:
+        if value is not None and (self.value is None or value > self.value):
+            self.value = value
+
+
+AGGREGATES = {'count': Count, 'sum': Sum, 'avg': Avg, 'min': Min, 'max': Max}
+
+
+def parse_aggs(aggs: Dict[str, Any]) -> List[Tuple[str, str, Optional[str]]]:
+    """Normalise {alias: (function, column)} into (alias, function, column) triples
+
+    A bare 'count' means COUNT(*); column is None for COUNT(*).
+    """
+    specs = []
+    for alias, spec in aggs.items():
+        if isinstance(spec, str):
+            func, column = spec, '*'
+        else:
+            func, column = spec
+        func = func.lower()
+        if func not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate '{func}'. Use: {', '.join(AGGREGATES)}")
+        if column == '*':
+            if func != 'count':
+                raise ValueError(f"{func.upper()}(*) is not allowed, only COUNT(*)")
+            column = None
+        specs.append((alias, func, column))
+    return specs
+
+
+def aggregate(rows: Iterable, group_by: Sequence[str],
+              specs: List[Tuple[str, str, Optional[str]]],
+              layout: Optional[Dict[str, int]] = None) -> List[Dict]:
+    """One pass over rows with hash grouping; groups come out in first-seen order
+
+    With a layout (column -> position) rows are stored row tuples instead of dicts.
+    """
+    return finish(fold(rows, group_by, specs, layout), group_by, specs)
+
+
+def fold(rows: Iterable, group_by: Sequence[str], specs: List[Tuple[str, str, Optional[str]]],
+         layout: Optional[Dict[str, int]] = None) -> Dict[Tuple, List]:
+    """Accumulators of every group in rows, keyed by the group's GROUP BY values"""
+    makers = [CountRows if column is None else AGGREGATES[func] for _, func, column in specs]
+    group_by = list(group_by)
+    # The GROUP BY values then the aggregated ones (None for COUNT(*), which ignores it)
+    needed = group_by + [column for _, _, column in specs]
+    split = len(group_by)
+
+    if layout is None:
+        fields = lambda row: tuple(map(row.get, needed))
+    else:
+        # COUNT(*) reads _id, which every row has
+        pick = itemgetter(*[layout[col] if col is not None else 0 for col in needed])
+        single = len(needed) == 1
+
+        def fields(row: Tuple) -> Tuple:
+            values = (pick(row),) if single else pick(row)
+            if MISSING in values:
+                values = tuple([None if value is MISSING else value for value in values])
+            return values
+
+    groups: Dict[Tuple, List] = {}
+    try:
+        for values in map(fields, rows):
+            key = values[:split]
+            accumulators = groups.get(key)
+            if accumulators is None:
+                accumulators = groups[key] = [make() for make in makers]
+            for accumulator, value in zip(accumulators, values[split:]):
+                accumulator.add(value)
+    except TypeError as e:
+        raise ValueError(f"Can't aggregate values of mixed or non-numeric types: {e}")
+    return groups
+
+
+def merge(groups: Dict[Tuple, List], other: Dict[Tuple, List]) -> None:
+    """Fold the groups of other (from fold() over later rows) into groups"""
+    try:
+        for key, accumulators in other.items():
+            mine = groups.get(key)
+            if mine is None:
+                groups[key] = accumulators
+                continue
+            for accumulator, theirs in zip(mine, accumulators):
+                accumulator.merge(theirs)
+    except TypeError as e:
+        raise ValueError(f"Can't aggregate values of mixed or non-numeric types: {e}")
+
+
+def finish(groups: Dict[Tuple, List], group_by: Sequence[str],
+           specs: List[Tuple[str, str, Optional[str]]]) -> List[Dict]:
+    """Result rows of the groups fold() collected"""
+    group_by = list(group_by)
+    # Without GROUP BY there is always exactly one result row, even for no rows
+    if not group_by and not groups:
+        makers = [CountRows if column is None else AGGREGATES[func] for _, func, column in specs]
+        groups[()] = [make() for make in makers]
+
+    results = []
+    for key, accumulators in groups.items():
+        result = dict(zip(group_by, key))
+        for (alias, _, _), accumulator in zip(specs, accumulators):
+            result[alias] = accumulator.result()
+        results.append(result)
+    return results
@@ -0,0 +1,279 @@
+"""
+Benchmarks for PyDBMS core operations
+
+    python bench.py [--sizes 1000,10000,100000,1000000] [--storage row,column]
+                    [--ops 1000] [--no-sync] [--output results.json]
+                    [--compare old.json]
+
+For each storage engine and table size a synthetic table is bulk-loaded, then
+every operation is timed call by call: ops/sec, p50 and p99 latency. Each
+configuration runs in its own process, so its peak RSS is its own, and in a
+scratch directory that is measured for on-disk size and deleted afterwards.
+Results go to a JSON file; --compare prints the ops/sec change against an
+earlier one, so a regression between versions shows up as a ratio below 1.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+COLUMNS = {'name': 'str', 'city': 'str', 'age': 'int', 'score': 'float', 'active': 'bool'}
+CITIES = ['Berlin', 'Lagos', 'Lima', 'Osaka', 'Oslo', 'Perth', 'Pune', 'Quito', 'Riga', 'Tunis']
+
+
+def make_row(rng: random.Random, i: int) -> Dict[str, Any]:
+    return {
+        'name': f"user{i}",
+        'city': rng.choice(CITIES),
+        'age': rng.randint(18, 90),
+        'score': round(rng.random() * 100, 2),
+        'active': rng.random() < 0.5
+    }
+
+
+def summarize(latencies: List[float], total: Optional[float] = None) -> Dict[str, Any]:
+    """ops/sec plus p50/p99 latency in milliseconds"""
+    ordered = sorted(latencies)
+    n = len(ordered)
+    total = sum(ordered) if total is None else total
+    return {
+        'count': n,
+        'ops_per_sec': round(n / total, 1) if total else None,
+        'p50_ms': round(ordered[(n - 1) // 2] * 1000, 4),
+        'p99_ms': round(ordered[int((n - 1) * 0.99)] * 1000, 4)
+    }
+
+
+def timed(calls: Iterable[Callable[[], Any]]) -> Dict[str, Any]:
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def disk_usage(path: str) -> int:
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(directory, name))
+    return total
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+# ============ ONE CONFIGURATION ============
+
+def run_config(storage: str, rows: int, ops: int, sync: bool, seed: int) -> Dict[str, Any]:
+    """Benchmark one storage engine at one table size (in the current directory)"""
+    # Imported here so that --help and the parent process stay light
+    from pydbms import PyDBMS
+
+    rng = random.Random(seed)
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    results: Dict[str, Any] = {}
+    # Full scans cost O(rows) each, so run fewer of them on big tables
+    scans = max(3, min(ops, 2_000_000 // rows))
+
+    with quiet:
+        db = PyDBMS('bench', sync=sync)
+        db.create_table('people', COLUMNS, storage=storage)
+        data = [make_row(rng, i) for i in range(rows)]
+        start = time.perf_counter()
+        db.insert_many('people', data)
+        elapsed = time.perf_counter() - start
+        results['load'] = {'count': rows, 'ops_per_sec': round(rows / elapsed, 1),
+                           'seconds': round(elapsed, 3)}
+        del data
+        db.create_index('people', 'city')
+        db.create_index('people', 'age', 'sorted')
+
+        ids = [rng.randint(1, rows) for _ in range(ops)]
+        new_rows = [make_row(rng, rows + i) for i in range(ops)]
+        results['insert'] = timed((lambda row=row: db.insert('people', row)) for row in new_rows)
+        results['select_id'] = timed(
+            (lambda i=i: db.select('people', {'_id': i})) for i in ids)
+        results['select_index_eq'] = timed(
+            (lambda c=rng.choice(CITIES): db.select('people', {'city': c}, limit=100))
+            for _ in range(ops))
+        results['select_index_range'] = timed(
+            (lambda a=rng.randint(18, 85): db.select('people', {'age': {'between': (a, a + 2)}},
+                                                     limit=100))
+            for _ in range(ops))
+        results['select_scan'] = timed(
+            (lambda s=rng.random() * 100: db.select('people', {'score': {'>': s}}, limit=10,
+                                                    order_by='score'))
+            for _ in range(scans))
+        results['aggregate'] = timed(
+            (lambda: db.aggregate('people', ['city'], {'n': ('count', '*'),
+                                                       'avg_age': ('avg', 'age')}))
+            for _ in range(scans))
+        results['update'] = timed(
+            (lambda i=i: db.update('people', {'score': 1.0}, {'_id': i})) for i in ids)
+        results['delete'] = timed(
+            (lambda i=i: db.delete('people', {'_id': i})) for i in set(ids))
+
+        start = time.perf_counter()
+        db.checkpoint()
+        results['checkpoint'] = {'seconds': round(time.perf_counter() - start, 3)}
+        disk_bytes = disk_usage(db.db_path)
+
+        export_file = os.path.abspath('people.ndjson')
+        start = time.perf_counter()
+        db.export_table('people', export_file)
+        elapsed = time.perf_counter() - start
+        results['export'] = {'count': rows, 'ops_per_sec': round(rows / elapsed, 1),
+                             'seconds': round(elapsed, 3)}
+        db.create_table('imported', COLUMNS, storage=storage)
+        start = time.perf_counter()
+        db.import_table('imported', export_file)
+        elapsed = time.perf_counter() - start
+        results['import'] = {'count': rows, 'ops_per_sec': round(rows / elapsed, 1),
+                             'seconds': round(elapsed, 3)}
+        db.drop_table('imported')
+        os.remove(export_file)
+        db.close()
+
+        # Startup reads only the catalog; the first query loads the table
+        start = time.perf_counter()
+        db = PyDBMS('bench', sync=sync)
+        opened = time.perf_counter()
+        db.select('people', {'_id': 1})
+        loaded = time.perf_counter()
+        results['open'] = {'seconds': round(opened - start, 4)}
+        results['first_query'] = {'seconds': round(loaded - opened, 4)}
+        db.close()
+
+    return {
+        'storage': storage,
+        'rows': rows,
+        'benchmarks': results,
+        'peak_rss_mb': peak_rss_mb(),
+        'disk_bytes': disk_bytes
+    }
+
+
+def run_isolated(storage: str, rows: int, ops: int, sync: bool, seed: int) -> Dict[str, Any]:
+    """run_config in a fresh process and scratch directory"""
+    scratch = tempfile.mkdtemp(prefix='pydbms-bench-')
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.abspath(__file__), '--worker', storage, str(rows),
+               '--ops', str(ops), '--seed', str(seed)]
+    if not sync:
+        command.append('--no-sync')
+    path = os.pathsep.join(filter(None, [here, os.environ.get('PYTHONPATH')]))
+    env = dict(os.environ, PYTHONPATH=path)
+    try:
+        done = subprocess.run(command, cwd=scratch, env=env, capture_output=True, text=True)
+        if done.returncode != 0:
+            raise RuntimeError(f"Benchmark {storage}/{rows} failed:\n{done.stderr}")
+        return json.loads(done.stdout)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+# ============ REPORTING ============
+
+def print_result(result: Dict[str, Any]) -> None:
+    print(f"\n{result['storage']} storage, {result['rows']:,} rows "
+          f"(peak RSS {result['peak_rss_mb']} MB, {result['disk_bytes'] / 1e6:.1f} MB on disk)")
+    print(f"  {'operation':<20} {'ops/sec':>12} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, stats in result['benchmarks'].items():
+        if 'p50_ms' in stats:
+            print(f"  {name:<20} {stats['ops_per_sec']:>12,.0f} {stats['p50_ms']:>10.3f} "
+                  f"{stats['p99_ms']:>10.3f}")
+        elif 'ops_per_sec' in stats:
+            print(f"  {name:<20} {stats['ops_per_sec']:>12,.0f} "
+                  f"{'(' + str(stats['seconds']) + ' s total)':>21}")
+        else:
+            print(f"  {name:<20} {stats['seconds']:>12} s")
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    """Print new/old ops/sec ratios for every benchmark both runs have"""
+    before = {(r['storage'], r['rows']): r['benchmarks'] for r in old['results']}
+    print("\nChange in ops/sec against the earlier run (below 1.00 is slower):")
+    for result in new['results']:
+        previous = before.get((result['storage'], result['rows']))
+        if previous is None:
+            continue
+        ratios = []
+        for name, stats in result['benchmarks'].items():
+            old_rate = previous.get(name, {}).get('ops_per_sec')
+            if old_rate and stats.get('ops_per_sec'):
+                ratios.append(f"{name} {stats['ops_per_sec'] / old_rate:.2f}")
+        print(f"  {result['storage']}/{result['rows']:,}: {', '.join(ratios)}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark PyDBMS core operations')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma-separated table sizes in rows')
+    parser.add_argument('--storage', default='row,column',
+                        help='comma-separated storage engines (row, column, paged)')
+    parser.add_argument('--ops', type=int, default=1000, help='calls timed per operation')
+    parser.add_argument('--no-sync', action='store_true', help="don't fsync the log on writes")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--compare', metavar='OLD_JSON', help='earlier results to compare with')
+    parser.add_argument('--worker', nargs=2, metavar=('STORAGE', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    sync = not args.no_sync
+
+    if args.worker:
+        storage, rows = args.worker
+        print(json.dumps(run_config(storage, int(rows), args.ops, sync, args.seed)))
+        return
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'ops': args.ops,
+            'sync': sync,
+            'seed': args.seed
+        },
+        'results': []
+    }
+    for storage in args.storage.split(','):
+        for rows in (int(size) for size in args.sizes.split(',')):
+            result = run_isolated(storage, rows, args.ops, sync, args.seed)
+            report['results'].append(result)
+            print_result(result)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results written to '{args.output}'")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Query result cache
+
+Results of PyDBMS.select are kept under a key made of the table, its version
+and the normalised query. Every write to a table bumps its version and drops
+its entries, so a cached result is never stale. Entries are evicted least
+recently used first once the memory budget is exceeded.
+"""
+
+import json
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+
+def _normalise(where: Optional[Dict]) -> Optional[str]:
+    """Canonical text for a WHERE dict, or None if it can't be used as a key"""
+    if not where:
+        return ''
+    try:
+        # Tuples and lists compare the same ('between': (1, 5) == [1, 5])
+        return json.dumps(where, sort_keys=True, separators=(',', ':'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _estimate_size(rows: List[Dict]) -> int:
+    """Rough size of a result in bytes (keys are shared with the table and not counted)"""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row.values():
+            size += sys.getsizeof(value)
+    return size
+
+
+class QueryCache:
+    """LRU cache of select results with a memory budget and per-table versions"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: 'OrderedDict[Tuple, Tuple[List[Dict], int]]' = OrderedDict()
+        self.keys_by_table: Dict[str, Set[Tuple]] = {}
+        self.versions: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, table_name: str, where: Optional[Dict], limit: Optional[int],
+            order_by: Optional[str], desc: bool) -> Optional[Hashable]:
+        """Cache key for a query, or None if the query can't be cached"""
+        predicate = _normalise(where)
+        if predicate is None:
+            return None
+        return (table_name, self.versions.get(table_name, 0), predicate, limit, order_by, desc)
+
+    def get(self, key: Hashable) -> Optional[List[Dict]]:
+        """Copy of a cached result, or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        # Rows are copied so callers can't change what later hits return
+        return [dict(row) for row in entry[0]]
+
+    def put(self, key: Hashable, rows: List[Dict]) -> None:
+        """Remember a result, evicting the least recently used ones to stay in budget"""
+        size = _estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        rows = [dict(row) for row in rows]
+        with self.lock:
+            if key[1] != self.versions.get(key[0], 0):
+                # The table changed while the query ran
+                return
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (rows, size)
+            self.keys_by_table.setdefault(key[0], set()).add(key)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, table_name: str) -> None:
+        """A table changed: bump its version and forget its results"""
+        with self.lock:
+            self.versions[table_name] = self.versions.get(table_name, 0) + 1
+            for key in self.keys_by_table.pop(table_name, ()):
+                entry = self.entries.pop(key, None)
+                if entry is not None:
+                    self.bytes -= entry[1]
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        """Forget every result"""
+        for table_name in list(self.keys_by_table):
+            self.invalidate(table_name)
+
+    def _drop(self, key: Tuple) -> None:
+        _, size = self.entries.pop(key)
+        self.bytes -= size
+        keys = self.keys_by_table.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_table[key[0]]
+
+    def stats(self) -> Dict:
+        """Hit/miss/eviction counters and memory use"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
@@ -0,0 +1,260 @@
+"""
+Table catalog with lazy, per-table storage files
+
+Every table lives in its own tables/<name>.tbl snapshot (plus a
+tables/<name>.pages data file for paged tables), in the binary format of
+tablefile.py. Opening a database only reads the catalog; a table's snapshot
+is read (and any log records written since are replayed) the first time the
+table is used. Snapshots pickled by older versions (tables/<name>.pkl) are
+still read, and replaced at the next checkpoint.
+"""
+
+import os
+import pickle
+import threading
+from typing import Dict, Iterator, List, Optional, Set
+from urllib.parse import quote
+
+from metrics import NullMetrics
+from pager import BufferPool, remove_data_files
+from table import Tbl
+from tablefile import read_table, write_table
+from wal import atomic_open
+
+
+class TableCatalog:
+    """Dict-like view of a database's tables that loads each one on first access"""
+
+    def __init__(self, directory: str, entries: Optional[Dict[str, Dict]] = None,
+                 pool: Optional[BufferPool] = None, metrics=None, compress: bool = True,
+                 parallel=None):
+        self.directory = directory
+        # Shared by the data files of every paged table
+        self.pool = pool or BufferPool()
+        # Catalog entries as kept in metadata.json: columns, storage, row_count, indexes
+        self.entries: Dict[str, Dict] = dict(entries or {})
+        self.loaded: Dict[str, Tbl] = {}
+        # Log records for tables that haven't been loaded yet
+        self.pending: Dict[str, List[Dict]] = {}
+        # Tables whose snapshot file can't be trusted because they were (re)created in the log
+        self.fresh: Set[str] = set()
+        # Tables changed since their snapshot was last written
+        self.dirty: Set[str] = set()
+        # Two threads touching a cold table at once must not both load it
+        self.load_lock = threading.Lock()
+        # Identity of the snapshot file each loaded table was read from
+        self.stamps: Dict[str, Optional[tuple]] = {}
+        # Times loading and writing snapshots (see metrics.py)
+        self.metrics = metrics or NullMetrics()
+        # zlib-compress snapshot blocks
+        self.compress = compress
+        # Splits big scans of every table across processes (see parallel.py)
+        self.parallel = parallel
+
+    def path(self, name: str) -> str:
+        """Snapshot file of a table"""
+        return os.path.join(self.directory, quote(name, safe='') + '.tbl')
+
+    def legacy_path(self, name: str) -> str:
+        """Pickled snapshot written by older versions"""
+        return os.path.join(self.directory, quote(name, safe='') + '.pkl')
+
+    def data_path(self, name: str) -> str:
+        """Data file of a paged table"""
+        return os.path.join(self.directory, quote(name, safe='') + '.pages')
+
+    def _attach(self, table: Tbl) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        table.rows.attach(self.data_path(table.name), self.pool)
+        table.parallel = self.parallel
+
+    # ---- mapping protocol used by PyDBMS ----
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def __getitem__(self, name: str) -> Tbl:
+        table = self.loaded.get(name)
+        if table is None:
+            with self.load_lock:
+                table = self.loaded.get(name)
+                if table is None:
+                    if name not in self.entries:
+                        raise KeyError(name)
+                    table = self._load(name)
+        return table
+
+    def get(self, name: str, default: Optional[Tbl] = None) -> Optional[Tbl]:
+        return self[name] if name in self.entries else default
+
+    def values(self) -> Iterator[Tbl]:
+        """Every table (loading them all)"""
+        for name in list(self.entries):
+            yield self[name]
+
+    def items(self) -> Iterator:
+        """(name, table) for every table (loading them all)"""
+        for name in list(self.entries):
+            yield name, self[name]
+
+    # ---- catalog changes ----
+
+    def add(self, table: Tbl, fresh: bool = False) -> None:
+        """Register a new table"""
+        self._attach(table)
+        self.entries[table.name] = self._entry(table)
+        self.loaded[table.name] = table
+        self.pending.pop(table.name, None)
+        self.dirty.add(table.name)
+        if fresh:
+            self.fresh.add(table.name)
+
+    def remove(self, name: str) -> None:
+        """Forget a table and delete its files"""
+        self.entries.pop(name, None)
+        table = self.loaded.pop(name, None)
+        self.stamps.pop(name, None)
+        if table is not None:
+            table.rows.destroy()
+        remove_data_files(self.data_path(name))
+        self.pending.pop(name, None)
+        self.dirty.discard(name)
+        self.fresh.discard(name)
+        for path in (self.path(name), self.legacy_path(name)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def defer(self, name: str, record: Dict) -> None:
+        """Queue a log record until the table is loaded (or apply it now if it is)"""
+        if name in self.loaded:
+            self.loaded[name].apply(record)
+        else:
+            self.pending.setdefault(name, []).append(record)
+
+    def unload(self, name: str) -> None:
+        """Drop a table's in-memory state; it is read again (snapshot plus log) on next use"""
+        table = self.loaded.pop(name, None)
+        if table is not None:
+            table.rows.close()
+        self.pending.pop(name, None)
+        self.stamps.pop(name, None)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self.loaded
+
+    def close(self) -> None:
+        """Write back and release the files of every loaded table"""
+        for table in self.loaded.values():
+            table.rows.close()
+
+    # ---- snapshots ----
+
+    def _stamp(self, name: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path(name))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _load(self, name: str) -> Tbl:
+        entry = self.entries[name]
+        path = self.path(name)
+        with self.metrics.timer('table.load') as timer:
+            if name not in self.fresh and os.path.exists(path):
+                self.stamps[name] = self._stamp(name)
+                with open(path, 'rb') as f:
+                    table = read_table(f)
+            elif name not in self.fresh and os.path.exists(self.legacy_path(name)):
+                with open(self.legacy_path(name), 'rb') as f:
+                    table = pickle.load(f)
+                # Rewritten in the current format at the next checkpoint
+                self.dirty.add(name)
+            else:
+                table = Tbl(name, entry['columns'], entry.get('storage', 'row'))
+            self._attach(table)
+
+            records = self.pending.pop(name, [])
+            for record in records:
+                table.apply(record)
+            if records:
+                self.dirty.add(name)
+            timer.returned = table.count()
+
+        self.loaded[name] = table
+        return table
+
+    def freeze(self, name: str) -> Tbl:
+        """Copy of a table to write as its snapshot (writers must be held off meanwhile)"""
+        table = self[name]
+        # Pages first, so the snapshot never points at rows that aren't on disk
+        table.rows.flush()
+        frozen = table.copy()
+        self.entries[name] = self._entry(table)
+        self.dirty.discard(name)
+        self.fresh.discard(name)
+        return frozen
+
+    def write(self, name: str, frozen: Tbl) -> None:
+        """Write a snapshot taken by freeze(); writers may carry on meanwhile"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self.metrics.timer('snapshot.write') as timer:
+            with atomic_open(self.path(name)) as f:
+                write_table(f, frozen, self.compress)
+            self.stamps[name] = self._stamp(name)
+            timer.written = self.stamps[name][1] if self.stamps[name] else 0
+        if os.path.exists(self.legacy_path(name)):
+            os.remove(self.legacy_path(name))
+
+    def after_write(self, name: str, frozen: Tbl) -> None:
+        """Clean up after write() (writers must be held off meanwhile)"""
+        if name in self.loaded:
+            # Older generations of its data file may not be needed any more
+            self.loaded[name].rows.after_checkpoint(frozen.rows)
+        elif name not in self.entries and os.path.exists(self.path(name)):
+            # Dropped while its snapshot was being written
+            os.remove(self.path(name))
+
+    def refresh(self, entries: Dict[str, Dict]) -> None:
+        """Adopt a checkpoint taken by another process
+
+        Every log record up to that checkpoint is in its snapshots now, so queued
+        records are dropped, and loaded tables whose snapshot was rewritten (or
+        that were dropped) are unloaded to be read again on next use.
+        """
+        self.entries = dict(entries)
+        self.pending.clear()
+        self.fresh.clear()
+        self.dirty.clear()
+        for name in list(self.loaded):
+            if name not in self.entries or self._stamp(name) != self.stamps.get(name):
+                self.unload(name)
+
+    def needs_checkpoint(self) -> List[str]:
+        """Tables whose latest state exists only in memory and the log"""
+        return sorted(set(self.dirty) | set(self.pending) | self.fresh)
+
+    # ---- cheap metadata ----
+
+    def describe(self, name: str) -> Dict:
+        """Catalog entry, straight from metadata unless the table is already in memory"""
+        if name in self.loaded or name in self.pending:
+            self.entries[name] = self._entry(self[name])
+        return self.entries[name]
+
+    @staticmethod
+    def _entry(table: Tbl) -> Dict:
+        return {
+            'columns': table.columns,
+            'storage': table.storage,
+            'row_count': table.count(),
+            'indexes': {col: index.kind for col, index in table.indexes.items()}
+        }
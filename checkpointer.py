@@ -0,0 +1,70 @@
+"""
+Background checkpointing
+
+A Checkpointer thread takes checkpoints off the writers' path: every interval
+seconds when something was logged since the last one, and straight away when
+a writer finds the log has outgrown checkpoint_size. A checkpoint that fails
+is reported and tried again at the next wake-up; the thread keeps running,
+and stats() says what went wrong last.
+"""
+
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+
+class Checkpointer(threading.Thread):
+    """Daemon thread that checkpoints one PyDBMS"""
+
+    def __init__(self, db, interval: float):
+        super().__init__(name=f"checkpoint-{db.db_name}", daemon=True)
+        self.db = db
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = False
+        # Log position covered by the last checkpoint
+        self._done = db.wal.written
+        self.checkpoints = 0
+        self.failures = 0
+        self.last_error: Optional[Exception] = None
+        self.last_error_at: Optional[str] = None
+
+    def run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping:
+                return
+            written = self.db.wal.written
+            if written > self._done:
+                try:
+                    self.db.checkpoint()
+                except Exception as e:
+                    # The log is kept, so nothing is lost; the next wake-up tries again
+                    self.failures += 1
+                    self.last_error, self.last_error_at = e, datetime.now().isoformat()
+                    print(f"Error checkpointing database: {e}")
+                    continue
+                self.checkpoints += 1
+                self._done = written
+
+    def wake(self) -> None:
+        """Checkpoint now instead of waiting for the interval"""
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Checkpoints taken and failed, and the last failure (kept after later successes)"""
+        return {
+            'interval': self.interval,
+            'checkpoints': self.checkpoints,
+            'failures': self.failures,
+            'last_error': None if self.last_error is None else repr(self.last_error),
+            'last_error_at': self.last_error_at,
+        }
+
+    def stop(self) -> None:
+        """Let a checkpoint in progress finish, then end the thread"""
+        self._stopping = True
+        self._wake.set()
+        if self.is_alive():
+            self.join()
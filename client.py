@@ -0,0 +1,254 @@
+"""
+Client for the PyDBMS network server
+
+    client = Client('127.0.0.1', 7734)
+    client.insert_many('users', [{'name': 'Ann'}, {'name': 'Bob'}])
+    for row in client.iter_select('users', where={'name': 'Ann'}):
+        ...
+
+Connections are opened on demand and kept in a pool, so back-to-back queries
+reuse them instead of paying for a new connection each time. A Client can be
+shared between threads; each call borrows a connection for its duration.
+"""
+
+import queue
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from protocol import DEFAULT_PORT, HEADER, decode, encode, frame_size
+
+
+class Connection:
+    """One socket to the server"""
+
+    def __init__(self, address: Any, timeout: Optional[float] = None):
+        if isinstance(address, str):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # Small requests go out right away instead of waiting to be batched
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self.stream = self.sock.makefile('rb')
+        self.next_id = 1
+
+    def send(self, requests: List[Dict[str, Any]]) -> List[int]:
+        """Send requests in one write and return their ids"""
+        ids = []
+        frames = []
+        for request in requests:
+            request['id'] = self.next_id
+            self.next_id += 1
+            ids.append(request['id'])
+            frames.append(encode(request))
+        self.sock.sendall(b''.join(frames))
+        return ids
+
+    def receive(self) -> Dict[str, Any]:
+        header = self.stream.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ConnectionError("Server closed the connection")
+        size = frame_size(header)
+        payload = self.stream.read(size)
+        if len(payload) < size:
+            raise ConnectionError("Server closed the connection")
+        return decode(payload)
+
+    def close(self) -> None:
+        self.stream.close()
+        self.sock.close()
+
+
+def _result(response: Dict[str, Any], request_id: int) -> Any:
+    if response.get('id') != request_id:
+        raise ConnectionError("Response out of step with requests")
+    if response['ok']:
+        return response['result']
+    if response['error'] == 'ValueError':
+        raise ValueError(response['message'])
+    raise RuntimeError(f"{response['error']}: {response['message']}")
+
+
+class Client:
+    """Pooled connections to a PyDBMS server, with the PyDBMS call signatures
+
+    Pass path to connect over a Unix socket instead of TCP.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT,
+                 path: Optional[str] = None, pool_size: int = 8,
+                 timeout: Optional[float] = None):
+        self.address = path if path else (host, port)
+        self.timeout = timeout
+        # One slot per connection allowed; None marks a slot not yet connected
+        self._pool: queue.LifoQueue = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(None)
+        self._open: List[Connection] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        """Borrow a pooled connection (waiting if all of them are busy)"""
+        conn = self._pool.get()
+        try:
+            if conn is None:
+                conn = Connection(self.address, self.timeout)
+                with self._lock:
+                    self._open.append(conn)
+            yield conn
+        except BaseException:
+            # Half-read responses would confuse the next borrower
+            if conn is not None:
+                self._discard(conn)
+            self._pool.put(None)
+            raise
+        self._pool.put(conn)
+
+    def _discard(self, conn: Connection) -> None:
+        conn.close()
+        with self._lock:
+            if conn in self._open:
+                self._open.remove(conn)
+
+    def call(self, op: str, *args, **kwargs) -> Any:
+        """Run one PyDBMS operation on the server and return its result"""
+        with self.connection() as conn:
+            (request_id,) = conn.send([{'op': op, 'args': args, 'kwargs': kwargs}])
+            response = conn.receive()
+        return _result(response, request_id)
+
+    def pipeline(self) -> 'Pipeline':
+        """Queue up calls and send them together: one round trip for the lot"""
+        return Pipeline(self)
+
+    # ---- PyDBMS operations ----
+
+    def create_table(self, table_name: str, columns: Dict[str, str], storage: str = 'row') -> None:
+        return self.call('create_table', table_name, columns, storage)
+
+    def drop_table(self, table_name: str) -> None:
+        return self.call('drop_table', table_name)
+
+    def list_tables(self) -> List[str]:
+        return self.call('list_tables')
+
+    def describe(self, table_name: str) -> Dict:
+        return self.call('describe', table_name)
+
+    def create_index(self, table_name: str, column: str, kind: str = 'hash') -> None:
+        return self.call('create_index', table_name, column, kind)
+
+    def drop_index(self, table_name: str, column: str) -> None:
+        return self.call('drop_index', table_name, column)
+
+    def insert(self, table_name: str, data: Dict[str, Any]) -> int:
+        return self.call('insert', table_name, data)
+
+    def insert_many(self, table_name: str, rows: List[Dict[str, Any]],
+                    batch_size: Optional[int] = None) -> List[int]:
+        return self.call('insert_many', table_name, list(rows), batch_size)
+
+    def select(self, table_name: str, where: Optional[Dict] = None, limit: Optional[int] = None,
+               order_by: Optional[str] = None, desc: bool = False) -> List[Dict]:
+        return self.call('select', table_name, where, limit, order_by, desc)
+
+    def iter_select(self, table_name: str, where: Optional[Dict] = None,
+                    limit: Optional[int] = None, order_by: Optional[str] = None,
+                    desc: bool = False, batch_size: int = 1000) -> Iterator[Dict]:
+        """Stream a query's rows, batch_size at a time (holds a connection until done)"""
+        return self._stream('iter_select', (table_name, where, limit, order_by, desc), batch_size)
+
+    def join(self, left: str, right: str, on: Tuple[str, str], how: str = 'inner',
+             where: Optional[Dict] = None, batch_size: int = 1000) -> Iterator[Dict]:
+        """Stream the rows of a join, batch_size at a time (holds a connection until done)"""
+        return self._stream('join', (left, right, list(on), how, where), batch_size)
+
+    def update(self, table_name: str, data: Dict[str, Any], where: Dict[str, Any]) -> int:
+        computed = [col for col, value in data.items() if callable(value)]
+        if computed:
+            raise ValueError(f"Computed SET values ({', '.join(computed)}) can't be sent to the "
+                             f"server; use execute() with UPDATE ... SET col = expr instead")
+        return self.call('update', table_name, data, where)
+
+    def delete(self, table_name: str, where: Dict[str, Any]) -> int:
+        return self.call('delete', table_name, where)
+
+    def aggregate(self, table_name: str, group_by: Optional[List[str]] = None,
+                  aggs: Optional[Dict[str, Any]] = None,
+                  where: Optional[Dict] = None) -> List[Dict]:
+        return self.call('aggregate', table_name, group_by, aggs, where)
+
+    def explain(self, table_name: str, where: Optional[Dict] = None, limit: Optional[int] = None,
+                order_by: Optional[str] = None, desc: bool = False) -> Dict:
+        return self.call('explain', table_name, where, limit, order_by, desc)
+
+    def execute(self, sql: str) -> Any:
+        return self.call('execute', sql)
+
+    def get_database_info(self) -> Dict:
+        return self.call('get_database_info')
+
+    def get_stats(self, reset: bool = False) -> Dict:
+        return self.call('get_stats', reset)
+
+    def _stream(self, op: str, args: tuple, batch_size: int) -> Iterator[Dict]:
+        with self.connection() as conn:
+            (request_id,) = conn.send([{'op': op, 'args': args, 'kwargs': {}}])
+            cursor_id = _result(conn.receive(), request_id)
+            done = False
+            try:
+                while not done:
+                    (request_id,) = conn.send([{'op': 'fetch', 'args': [cursor_id, batch_size]}])
+                    rows = _result(conn.receive(), request_id)
+                    done = len(rows) < batch_size
+                    yield from rows
+            except GeneratorExit:
+                # Abandoned by the caller; the connection is still usable once the cursor is closed
+                pass
+            finally:
+                if not done:
+                    # Stopped early: free the cursor on the server
+                    (request_id,) = conn.send([{'op': 'close_cursor', 'args': [cursor_id]}])
+                    _result(conn.receive(), request_id)
+
+    def close(self) -> None:
+        """Close every pooled connection"""
+        with self._lock:
+            for conn in self._open:
+                conn.close()
+            self._open.clear()
+
+    def __enter__(self) -> 'Client':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class Pipeline:
+    """Calls collected by Client.pipeline() and sent as one batch by execute()"""
+
+    def __init__(self, client: Client):
+        self.client = client
+        self.requests: List[Dict[str, Any]] = []
+
+    def call(self, op: str, *args, **kwargs) -> 'Pipeline':
+        self.requests.append({'op': op, 'args': args, 'kwargs': kwargs})
+        return self
+
+    def execute(self) -> List[Any]:
+        """Send every queued call, then return their results in order
+
+        If any call failed, the first error is raised once all responses are in.
+        """
+        requests, self.requests = self.requests, []
+        if not requests:
+            return []
+        with self.client.connection() as conn:
+            ids = conn.send(requests)
+            responses = [conn.receive() for _ in ids]
+        return [_result(response, request_id) for response, request_id in zip(responses, ids)]
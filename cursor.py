@@ -0,0 +1,51 @@
+"""
+Lazy query cursors
+"""
+
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+
+
+class Cursor:
+    """Lazily produces the rows of a query, one at a time or in batches
+
+    Nothing is scanned until rows are asked for, and a LIMIT stops the scan
+    as soon as enough rows have been produced.
+    """
+
+    def __init__(self, rows: Iterator[Dict]):
+        self._rows = iter(rows)
+        self.rowcount = 0
+
+    def __iter__(self) -> 'Cursor':
+        return self
+
+    def __next__(self) -> Dict:
+        row = next(self._rows)
+        self.rowcount += 1
+        return row
+
+    def __enter__(self) -> 'Cursor':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def fetchone(self) -> Optional[Dict]:
+        """Next row, or None when the cursor is exhausted"""
+        return next(self, None)
+
+    def fetchmany(self, size: int = 100) -> List[Dict]:
+        """Up to size more rows (an empty list once exhausted)"""
+        return list(islice(self, size))
+
+    def fetchall(self) -> List[Dict]:
+        """Every remaining row"""
+        return list(self)
+
+    def close(self) -> None:
+        """Stop the underlying scan early"""
+        close = getattr(self._rows, 'close', None)
+        if close is not None:
+            close()
+        self._rows = iter(())
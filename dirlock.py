@@ -0,0 +1,86 @@
+"""
+Cross-process coordination for a database directory
+
+Processes sharing databases/<name> take an advisory fcntl lock on its LOCK
+file: shared while catching up on other processes' changes, exclusive while
+writing. The same file holds a generation counter that every checkpoint
+bumps, so noticing that the log was folded into fresh snapshots is one tiny
+read instead of a reload.
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# The counter is stored as fixed-width text so it can be rewritten in place
+GENERATION_WIDTH = 20
+
+
+class DirectoryLock:
+    """Advisory lock and checkpoint generation counter of one database directory
+
+    Not for use by several threads at once: PyDBMS only calls it while holding
+    its writer lock. Holding the exclusive lock also allows shared sections.
+    """
+
+    def __init__(self, path: str):
+        if fcntl is None:
+            raise ValueError("Sharing a database between processes needs fcntl (POSIX only)")
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.mode: Optional[str] = None
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        """Keep writers in other processes out"""
+        if self.mode is not None:
+            yield
+            return
+        fcntl.flock(self.fd, fcntl.LOCK_SH)
+        self.mode = 'shared'
+        try:
+            yield
+        finally:
+            self.mode = None
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        """Keep every other process out"""
+        if self.mode == 'exclusive':
+            yield
+            return
+        if self.mode == 'shared':
+            raise RuntimeError("Can't upgrade a shared directory lock to exclusive")
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        self.mode = 'exclusive'
+        try:
+            yield
+        finally:
+            self.mode = None
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def generation(self) -> int:
+        """Number of checkpoints taken so far (readable without the lock)"""
+        data = os.pread(self.fd, GENERATION_WIDTH, 0).strip()
+        try:
+            return int(data) if data else 0
+        except ValueError:
+            # Caught mid-rewrite; the caller re-checks under the lock
+            return -1
+
+    def bump(self) -> int:
+        """Record a checkpoint (call with the exclusive lock held) and return the new generation"""
+        generation = max(self.generation(), 0) + 1
+        os.pwrite(self.fd, str(generation).ljust(GENERATION_WIDTH).encode('ascii'), 0)
+        return generation
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -35,9 +35,11 @@ print("\n5. Checking storage location:")
 print(f"    Database path: {db.db_path}")
 print(f"    Files exist: {os.path.exists(db.db_path)}")
 
-db_file = os.path.join(db.db_path, 'database.pkl')
+table_file = os.path.join(db.db_path, 'tables', 'products.tbl')
+wal_file = os.path.join(db.db_path, 'database.wal')
 metadata_file = os.path.join(db.db_path, 'metadata.json')
-print(f"    database.pkl: {os.path.exists(db_file)}")
+print(f"    tables/products.tbl: {os.path.exists(table_file)} (snapshot, written at checkpoints)")
+print(f"    database.wal: {os.path.exists(wal_file)} ({os.path.getsize(wal_file)} bytes of logged writes)")
 print(f"    metadata.json: {os.path.exists(metadata_file)}")
 
 # Example 2: Get database info
@@ -58,6 +60,7 @@ print(f"    Laptop stock: {laptop[0]['stock']}")
 # Example 4: Show what persistence looks like
 print("\n9. Simulating program restart...")
 print("    Closing database...")
+db.close()
 del db
 
 print("    Opening database again...")
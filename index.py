@@ -0,0 +1,280 @@
+"""
+Secondary indexes for Tbl columns
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from query import bounds
+
+
+class HashIndex:
+    """Maps each value of a column to the IDs of the rows holding it"""
+
+    kind = 'hash'
+
+    def __init__(self, column: str):
+        self.column = column
+        self.buckets: Dict[Any, Set[int]] = {}
+
+    def build(self, rows: Iterable[Dict]) -> None:
+        """(Re)build the index from scratch"""
+        self.buckets = {}
+        for row in rows:
+            self.add(row.get(self.column), row['_id'])
+
+    def check(self, values: Iterable[Any]) -> None:
+        """Raise ValueError unless every one of values can go into the index"""
+        for value in values:
+            try:
+                hash(value)
+            except TypeError:
+                raise ValueError(f"Value {value!r} can't go in the hash index on column "
+                                 f"'{self.column}': it isn't hashable")
+
+    def add(self, value: Any, row_id: int) -> None:
+        """Record that row_id holds value"""
+        bucket = self.buckets.get(value)
+        if bucket is None:
+            self.buckets[value] = {row_id}
+        else:
+            bucket.add(row_id)
+
+    def add_many(self, rows: List[Dict]) -> None:
+        """Record a batch of new rows"""
+        for row in rows:
+            self.add(row.get(self.column), row['_id'])
+
+    def remove(self, value: Any, row_id: int) -> None:
+        """Forget that row_id holds value"""
+        try:
+            bucket = self.buckets.get(value)
+        except TypeError:
+            # Unhashable, so never indexed
+            return
+        if bucket is not None:
+            bucket.discard(row_id)
+            if not bucket:
+                del self.buckets[value]
+
+    def lookup(self, value: Any) -> Optional[Set[int]]:
+        """IDs of rows whose column equals value, or None if value can't be looked up
+
+        An unhashable value (a list, say) was never indexed; the caller scans
+        instead, so it finds the same rows it would without the index.
+        """
+        try:
+            return self.buckets.get(value, set())
+        except TypeError:
+            return None
+
+    def copy(self) -> 'HashIndex':
+        clone = HashIndex(self.column)
+        clone.buckets = {value: set(ids) for value, ids in self.buckets.items()}
+        return clone
+
+    def dump(self) -> Dict[str, List]:
+        """Value lists to write a snapshot from: each value, its bucket size, and every ID"""
+        return {
+            'values': list(self.buckets),
+            'sizes': [len(ids) for ids in self.buckets.values()],
+            'ids': [row_id for ids in self.buckets.values() for row_id in ids]
+        }
+
+    @classmethod
+    def restore(cls, column: str, lists: Dict[str, List]) -> 'HashIndex':
+        index = cls(column)
+        ids = iter(lists['ids'])
+        index.buckets = {value: set(islice(ids, size))
+                         for value, size in zip(lists['values'], lists['sizes'])}
+        return index
+
+    def search(self, pairs: List[Tuple[str, Any]]) -> Optional[Set[int]]:
+        """IDs satisfying an '=' or 'in' condition, or None if the index can't help"""
+        for op, operand in pairs:
+            if op == '=':
+                return self.lookup(operand)
+            if op == 'in':
+                ids = set()
+                for value in operand:
+                    found = self.lookup(value)
+                    if found is None:
+                        return None
+                    ids |= found
+                return ids
+        return None
+
+
+class SortedIndex:
+    """Keeps (value, row ID) pairs in order for range lookups and ORDER BY"""
+
+    kind = 'sorted'
+
+    def __init__(self, column: str):
+        self.column = column
+        self.entries: List[Tuple[Any, int]] = []
+        # Rows without a value can't be ordered against the rest
+        self.nulls: Set[int] = set()
+
+    def build(self, rows: Iterable[Dict]) -> None:
+        """(Re)build the index from scratch"""
+        self.entries = []
+        self.nulls = set()
+        for row in rows:
+            value = row.get(self.column)
+            if value is None:
+                self.nulls.add(row['_id'])
+            else:
+                self.entries.append((value, row['_id']))
+        try:
+            self.entries.sort()
+        except TypeError:
+            raise ValueError(f"Column '{self.column}' holds values that can't be ordered")
+
+    def check(self, values: Iterable[Any]) -> None:
+        """Raise ValueError unless every one of values can go into the index
+
+        Each is compared with one value already indexed (or the first of them),
+        which catches a value of a type that doesn't order with the column's.
+        """
+        reference = self.entries[0][0] if self.entries else None
+        for value in values:
+            if value is None:
+                continue
+            if reference is None:
+                reference = value
+            try:
+                value < reference
+            except TypeError:
+                raise ValueError(f"Value {value!r} can't be ordered with the rest of column "
+                                 f"'{self.column}'")
+
+    def add(self, value: Any, row_id: int) -> None:
+        """Record that row_id holds value"""
+        if value is None:
+            self.nulls.add(row_id)
+            return
+        try:
+            insort(self.entries, (value, row_id))
+        except TypeError:
+            raise ValueError(f"Value {value!r} can't be ordered with the rest of column '{self.column}'")
+
+    def add_many(self, rows: List[Dict]) -> None:
+        """Record a batch of new rows with one sort instead of an insort per row"""
+        if len(rows) < 64:
+            for row in rows:
+                self.add(row.get(self.column), row['_id'])
+            return
+        old_entries = list(self.entries)
+        for row in rows:
+            value = row.get(self.column)
+            if value is None:
+                self.nulls.add(row['_id'])
+            else:
+                self.entries.append((value, row['_id']))
+        try:
+            # Timsort merges the already-sorted prefix with the new run cheaply
+            self.entries.sort()
+        except TypeError:
+            self.entries = old_entries
+            self.nulls.difference_update(row['_id'] for row in rows)
+            raise ValueError(f"Column '{self.column}' would hold values that can't be ordered")
+
+    def remove(self, value: Any, row_id: int) -> None:
+        """Forget that row_id holds value"""
+        if value is None:
+            self.nulls.discard(row_id)
+            return
+        try:
+            pos = bisect_left(self.entries, (value, row_id))
+        except TypeError:
+            # Never indexed (it can't be ordered with the rest), unless it slipped in
+            # when the index was empty: then it is found by row ID
+            pos = next((pos for pos, (_, entry_id) in enumerate(self.entries)
+                        if entry_id == row_id), len(self.entries))
+        if pos < len(self.entries) and self.entries[pos] == (value, row_id):
+            del self.entries[pos]
+
+    def copy(self) -> 'SortedIndex':
+        clone = SortedIndex(self.column)
+        clone.entries = list(self.entries)
+        clone.nulls = set(self.nulls)
+        return clone
+
+    def dump(self) -> Dict[str, List]:
+        """Value lists to write a snapshot from: the entries in order, and the IDs without a value"""
+        return {
+            'values': [value for value, _ in self.entries],
+            'ids': [row_id for _, row_id in self.entries],
+            'nulls': sorted(self.nulls)
+        }
+
+    @classmethod
+    def restore(cls, column: str, lists: Dict[str, List]) -> 'SortedIndex':
+        index = cls(column)
+        index.entries = list(zip(lists['values'], lists['ids']))
+        index.nulls = set(lists['nulls'])
+        return index
+
+    def lookup(self, value: Any) -> List[int]:
+        """IDs of rows whose column equals value"""
+        return self.range(value, True, value, True)
+
+    def range(self, low: Any = None, low_inc: bool = True,
+              high: Any = None, high_inc: bool = True) -> List[int]:
+        """IDs of rows with low <(=) value <(=) high in value order, None meaning unbounded"""
+        entries = self.entries
+        try:
+            if low is None:
+                start = 0
+            elif low_inc:
+                start = bisect_left(entries, (low,))
+            else:
+                start = bisect_right(entries, (low, float('inf')))
+            if high is None:
+                stop = len(entries)
+            elif high_inc:
+                stop = bisect_right(entries, (high, float('inf')))
+            else:
+                stop = bisect_left(entries, (high,))
+        except TypeError:
+            # Operand of another type: nothing can compare equal or in range
+            return []
+        return [row_id for _, row_id in entries[start:stop]]
+
+    def search(self, pairs: List[Tuple[str, Any]]) -> Optional[List[int]]:
+        """IDs satisfying '=', 'in' or range conditions in value order, or None if the index can't help"""
+        for op, operand in pairs:
+            if op == 'in':
+                try:
+                    values = sorted(set(operand))
+                except TypeError:
+                    return None
+                ids = []
+                for value in values:
+                    ids.extend(self.lookup(value))
+                return ids
+
+        usable = [(op, operand) for op, operand in pairs if op in ('=', '<', '<=', '>', '>=')]
+        if not usable:
+            return None
+        for op, operand in usable:
+            if operand is None:
+                # '= None' matches rows without a value, comparisons with None match nothing
+                return sorted(self.nulls) if op == '=' else []
+        try:
+            return self.range(*bounds(usable))
+        except TypeError:
+            return []
+
+    def ordered(self, desc: bool = False) -> List[int]:
+        """Every row ID in value order, rows without a value last (first when descending)"""
+        ids = [row_id for _, row_id in self.entries]
+        if desc:
+            ids.reverse()
+            return sorted(self.nulls, reverse=True) + ids
+        return ids + sorted(self.nulls)
+
+
+INDEX_TYPES = {'hash': HashIndex, 'sorted': SortedIndex}
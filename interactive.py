@@ -5,6 +5,9 @@ from typing import List, Dict, Any
 from typing import Optional
 import json
 from pydbms import PyDBMS
+from query import coerce
+
+SQL_COMMANDS = ('select', 'insert', 'update', 'delete', 'explain')
 
 
 class DBMSCLI:
@@ -42,22 +45,31 @@ class DBMSCLI:
         parts = command.split()
         cmd = parts[0].lower()
         
-        if cmd == 'help':
+        # "select" on its own starts the prompts; with more words it is SQL
+        if cmd in SQL_COMMANDS and len(parts) > 1:
+            self.run_sql(command)
+        elif cmd == 'help':
             self.help()
         elif cmd == 'use':
             self.use_database(parts[1] if len(parts) > 1 else None)
         elif cmd == 'status':
             self.show_status()
+        elif cmd == 'stats':
+            self.show_stats(len(parts) > 1 and parts[1].lower() == 'reset')
         elif cmd == 'create':
             if len(parts) > 1 and parts[1].lower() == 'table':
                 self.create_table_interactive()
+            elif len(parts) > 3 and parts[1].lower() == 'index':
+                self.create_index(parts[2], parts[3], parts[4] if len(parts) > 4 else 'hash')
             else:
-                print("Usage: create table")
+                print("Usage: create table | create index <table_name> <column> [hash|sorted]")
         elif cmd == 'drop':
             if len(parts) > 2 and parts[1].lower() == 'table':
                 self.drop_table(parts[2])
+            elif len(parts) > 3 and parts[1].lower() == 'index':
+                self.drop_index(parts[2], parts[3])
             else:
-                print("Usage: drop table <table_name>")
+                print("Usage: drop table <table_name> | drop index <table_name> <column>")
         elif cmd == 'show':
             if len(parts) > 1 and parts[1].lower() == 'tables':
                 self.show_tables()
@@ -83,6 +95,8 @@ class DBMSCLI:
             self.update_interactive()
         elif cmd == 'delete':
             self.delete_interactive()
+        elif cmd == 'explain':
+            print("Usage: explain select ...")
         elif cmd == 'export':
             self.export_interactive()
         elif cmd == 'import':
@@ -107,21 +121,31 @@ class DBMSCLI:
         print("\nDATABASE COMMANDS:")
         print("  use <database>       - Open/create a database")
         print("  status               - Show current database status")
+        print("  stats [reset]        - Show timings per operation (reset clears them)")
         print("  show databases       - List all available databases")
         print("\nTABLE COMMANDS:")
         print("  create table         - Create a new table (interactive)")
         print("  drop table <name>    - Delete a table")
         print("  show tables          - List all tables")
         print("  describe <table>     - Show table structure")
+        print("  create index <t> <c> - Index column c of table t")
+        print("    [hash|sorted]        (sorted also serves ranges and ORDER BY)")
+        print("  drop index <t> <c>   - Remove the index on t.c")
         print("  view <table>         - Display all data in table")
         print("\nDATA COMMANDS:")
         print("  insert               - Insert data (interactive)")
         print("  select               - Query data (interactive)")
         print("  update               - Update data (interactive)")
         print("  delete               - Delete data (interactive)")
+        print("\nSQL:")
+        print("  select ... from ...  - SELECT cols FROM t [WHERE ...] [ORDER BY c [DESC]] [LIMIT n]")
+        print("  insert into ...      - INSERT INTO t [(cols)] VALUES (...)[, (...)]")
+        print("  update ... set ...   - UPDATE t SET c = expr[, ...] [WHERE ...]")
+        print("  delete from ...      - DELETE FROM t [WHERE ...]")
+        print("  explain select ...   - Show the query plan and estimated rows")
         print("\nIMPORT/EXPORT:")
-        print("  export               - Export table to JSON")
-        print("  import               - Import data from JSON")
+        print("  export               - Export table to JSON or NDJSON")
+        print("  import               - Import data from JSON or NDJSON")
         print("\nOTHER:")
         print("  help                 - Show this help menu")
         print("  clear                - Clear screen")
@@ -133,7 +157,8 @@ class DBMSCLI:
         if not db_name:
             db_name = input("Database name: ").strip()
         
-        self.db = PyDBMS(db_name)
+        # Timed, so that 'stats' has something to show
+        self.db = PyDBMS(db_name, metrics=True)
         print(f"✓ Using database '{db_name}'")
         print(f"  Location: {self.db.db_path}")
         
@@ -156,6 +181,13 @@ class DBMSCLI:
         print(f"Location: {info['path']}")
         print(f"Tables: {info['total_tables']}")
         print(f"Total Rows: {info['total_rows']}")
+        pool = info['buffer_pool']
+        print(f"Buffer Pool: {pool['cached_pages']}/{pool['capacity_pages']} pages, "
+              f"{pool['hit_rate']:.1%} hit rate")
+        if info['query_cache']:
+            cache = info['query_cache']
+            print(f"Query Cache: {cache['entries']} results, {cache['bytes']} bytes, "
+                  f"{cache['hit_rate']:.1%} hit rate")
         
         if info['tables']:
             print("\nTables:")
@@ -165,6 +197,37 @@ class DBMSCLI:
         
         print("=" * 70)
     
+    def show_stats(self, reset: bool = False):
+        """Show call counts and timings per operation"""
+        if not self.db:
+            print("No database selected. Use 'use <database_name>'")
+            return
+        
+        stats = self.db.get_stats(reset=reset)
+        if not stats['enabled']:
+            print("Metrics are off for this database")
+            return
+        
+        print("\n" + "=" * 70)
+        print(f"OPERATION STATS (since {stats['since'][:19]})")
+        print("=" * 70)
+        if not stats['operations']:
+            print("Nothing timed yet")
+        else:
+            print(f"{'operation':<16}{'calls':>8}{'total ms':>11}{'p50 ms':>9}{'p99 ms':>9}"
+                  f"{'scanned':>9}{'returned':>9}")
+            for op, op_stats in stats['operations'].items():
+                print(f"{op:<16}{op_stats['calls']:>8}{op_stats['total_ms']:>11.1f}"
+                      f"{op_stats['p50_ms']:>9.2f}{op_stats['p99_ms']:>9.2f}"
+                      f"{op_stats['rows_scanned']:>9}{op_stats['rows_returned']:>9}")
+            written = sum(op_stats['bytes_written'] for op_stats in stats['operations'].values())
+            print(f"\nBytes written: {written}")
+        if stats['slow_query_log']:
+            print(f"Slow queries (over {stats['slow_query_ms']} ms) go to {stats['slow_query_log']}")
+        if reset:
+            print("✓ Stats reset")
+        print("=" * 70)
+    
     def show_databases(self):
         """Show all available databases"""
         if not os.path.exists('databases'):
@@ -220,7 +283,9 @@ class DBMSCLI:
             print("Table must have at least one column")
             return
         
-        self.db.create_table(table_name, columns)
+        storage = input("Storage (row/column/paged, press Enter for row): ").strip().lower() or 'row'
+        
+        self.db.create_table(table_name, columns, storage)
         
         # Show the created table structure
         print("\nTable created with structure:")
@@ -236,6 +301,22 @@ class DBMSCLI:
         if confirm.lower() == 'yes':
             self.db.drop_table(table_name)
     
+    def create_index(self, table_name: str, column: str, kind: str = 'hash'):
+        """Create an index on a column"""
+        if not self.db:
+            print("Please use a database first")
+            return
+        
+        self.db.create_index(table_name, column, kind)
+    
+    def drop_index(self, table_name: str, column: str):
+        """Drop the index on a column"""
+        if not self.db:
+            print("Please use a database first")
+            return
+        
+        self.db.drop_index(table_name, column)
+    
     def show_tables(self):
         """Show all tables"""
         if not self.db:
@@ -267,9 +348,14 @@ class DBMSCLI:
         print(f"TABLE: {info['name']}")
         print("=" * 70)
         print(f"Rows: {info['row_count']}")
+        print(f"Storage: {info['storage']}")
         print("\nColumns:")
         for col, col_type in info['columns'].items():
             print(f"  • {col} ({col_type})")
+        if info['indexes']:
+            print("\nIndexes:")
+            for col, kind in info['indexes'].items():
+                print(f"  • {col} ({kind})")
         print("=" * 70)
     
     def view_table(self, table_name: str):
@@ -335,7 +421,7 @@ class DBMSCLI:
         if use_where == 'yes':
             col = input("  Column: ").strip()
             val = input("  Value: ").strip()
-            where = {col: val}
+            where = {col: self._coerce(table_name, col, val)}
         
         # Optional LIMIT
         limit_input = input("Limit results (press Enter for all): ").strip()
@@ -361,13 +447,13 @@ class DBMSCLI:
         print("\nWHERE condition:")
         where_col = input("  Column: ").strip()
         where_val = input("  Value: ").strip()
-        where = {where_col: where_val}
+        where = {where_col: self._coerce(table_name, where_col, where_val)}
         
         # SET clause
         print("\nSET values:")
         set_col = input("  Column: ").strip()
         set_val = input("  New value: ").strip()
-        data = {set_col: set_val}
+        data = {set_col: self._coerce(table_name, set_col, set_val)}
         
         count = self.db.update(table_name, data, where)
         print(f"✓ Updated {count} row(s)")
@@ -388,7 +474,7 @@ class DBMSCLI:
         print("\nWHERE condition:")
         col = input("  Column: ").strip()
         val = input("  Value: ").strip()
-        where = {col: val}
+        where = {col: self._coerce(table_name, col, val)}
         
         confirm = input(f"\nDelete rows where {col}='{val}'? (yes/no): ")
         if confirm.lower() == 'yes':
@@ -407,8 +493,9 @@ class DBMSCLI:
         
         table_name = input("Table name: ").strip()
         filename = input("Export to file: ").strip()
+        fmt = input("Format (json/ndjson, press Enter to use the file extension): ").strip().lower()
         
-        self.db.export_table(table_name, filename)
+        self.db.export_table(table_name, filename, format=fmt or None)
     
     def import_interactive(self):
         """Interactive table import"""
@@ -418,13 +505,63 @@ class DBMSCLI:
         
         table_name = input("Table name: ").strip()
         filename = input("Import from file: ").strip()
+        fmt = input("Format (json/ndjson, press Enter to detect): ").strip().lower()
         
-        self.db.import_table(table_name, filename)
+        self.db.import_table(table_name, filename, format=fmt or None)
         
         # Show imported data
         print("\nImported data:")
         self.view_table(table_name)
     
+    def run_sql(self, sql: str):
+        """Run a SQL statement and show its result"""
+        if not self.db:
+            print("Please use a database first")
+            return
+        
+        result = self.db.execute(sql)
+        cmd = sql.split()[0].lower()
+        if cmd == 'explain':
+            self._print_plan(result)
+        elif cmd == 'select':
+            if result:
+                print(f"\n{len(result)} row(s) found:")
+                self._print_table(result)
+            else:
+                print("No results found")
+        elif cmd == 'insert':
+            print(f"✓ Inserted {len(result)} row(s)")
+        elif cmd == 'update':
+            print(f"✓ Updated {result} row(s)")
+        else:
+            print(f"✓ Deleted {result} row(s)")
+    
+    def _print_plan(self, plan: Dict):
+        """Print a query plan from EXPLAIN"""
+        access = plan['access'].replace('_', ' ')
+        if plan['column']:
+            access += f" on {plan['column']}"
+            if plan['index']:
+                access += f" ({plan['index']} index)"
+        print("\nQUERY PLAN")
+        print(f"  Table:          {plan['table']}")
+        print(f"  Access:         {access}")
+        print(f"  Rows read:      ~{plan['rows_read']}")
+        print(f"  Sort:           {plan['sort']}")
+        if plan['limit'] is not None:
+            print(f"  Limit:          {plan['limit']}")
+        print(f"  Estimated rows: ~{plan['estimated_rows']}")
+        print(f"  Cost:           {plan['cost']}")
+    
+    def _coerce(self, table_name: str, col: str, value: str) -> Any:
+        """Convert a typed-in value to the column's type"""
+        columns = self.db.describe(table_name)['columns']
+        if col == '_id':
+            return coerce(value, 'int')
+        if col not in columns:
+            raise ValueError(f"Column '{col}' does not exist in table '{table_name}'")
+        return coerce(value, columns[col])
+    
     def _print_table(self, rows: List[Dict]):
         """Pretty print table results"""
         if not rows:
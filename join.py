@@ -0,0 +1,177 @@
+"""
+Hash joins between tables
+
+The smaller input is loaded into a hash table keyed by its join column and
+the larger one is streamed past it, so a join costs O(n + m) instead of the
+O(n * m) of a nested loop. When a table already has an index on its join
+column (or joins on _id) that index is probed directly and nothing has to be
+built.
+
+Joined rows use qualified column names ('orders.total', 'customers._id'), and
+WHERE conditions may name columns the same way (a bare name works when only
+one table has it). Rows whose join value is missing never match, as in SQL.
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from query import compile_where
+
+JOIN_TYPES = ('inner', 'left')
+
+
+def qualify(table_name: str, row: Dict) -> Dict:
+    """Row with every column prefixed by its table name"""
+    return {f"{table_name}.{col}": value for col, value in row.items()}
+
+
+def split_where(where: Optional[Dict], left, right) -> Tuple[Dict, Dict]:
+    """Split a WHERE dict into the conditions on each table, keyed by plain column names"""
+    sides: Tuple[Dict, Dict] = ({}, {})
+    for name, cond in (where or {}).items():
+        table_name, dot, col = name.rpartition('.')
+        if dot:
+            candidates = [i for i, table in enumerate((left, right)) if table.name == table_name]
+        else:
+            col = name
+            candidates = [i for i, table in enumerate((left, right))
+                          if col in table.columns or col == '_id']
+            if len(candidates) > 1:
+                raise ValueError(f"Column '{col}' is ambiguous; qualify it as table.{col}")
+        if not candidates:
+            raise ValueError(f"Unknown column '{name}' in join")
+        table = (left, right)[candidates[0]]
+        if col not in table.columns and col != '_id':
+            raise ValueError(f"Column '{col}' does not exist in table '{table.name}'")
+        sides[candidates[0]][col] = cond
+    return sides
+
+
+def _indexed(table, column: str) -> bool:
+    return column == '_id' or column in table.indexes
+
+
+def _probe_index(table, column: str, where: Dict):
+    """value -> matching rows of table, answered by its index on column (or by ID)"""
+    test = compile_where(where)
+    rows = table.rows
+    if column == '_id':
+        find = lambda value: [value] if value in rows else []
+    else:
+        find = table.indexes[column].lookup
+
+    def matches(value: Any) -> List[Dict]:
+        found = []
+        for row_id in sorted(find(value)):
+            row = rows.get(row_id)
+            if row is not None and test(row):
+                found.append(row)
+        return found
+    return matches
+
+
+def _build_hash(rows: Iterable[Dict], column: str) -> Dict[Any, List[Dict]]:
+    """Hash table of rows keyed by their join value
+
+    Rows without a value sit under None, which is never probed, so a LEFT join
+    can still find them when padding unmatched rows.
+    """
+    table: Dict[Any, List[Dict]] = {}
+    for row in rows:
+        table.setdefault(row.get(column), []).append(row)
+    return table
+
+
+def hash_join(left, right, on: Tuple[str, str], how: str = 'inner',
+              where: Optional[Dict] = None, snapshot: bool = False) -> Iterator[Dict]:
+    """Lazily yield the joined rows of two Tbl objects (WHERE is checked right away)
+
+    With snapshot=True both inputs are pinned before returning and joined
+    through a hash table, since live indexes would see later writes.
+    """
+    left_where, right_where = split_where(where, left, right)
+    sources = None
+    if snapshot:
+        # A LEFT join filters on right-side conditions after joining (see _join)
+        sources = (list(left.iter_select(left_where, snapshot=True)),
+                   list(right.iter_select({} if how == 'left' else right_where,
+                                          snapshot=True)))
+    return _join(left, right, on, how, left_where, right_where, sources)
+
+
+def _join(left, right, on: Tuple[str, str], how: str, left_where: Dict,
+          right_where: Dict, sources: Optional[Tuple[List, List]]) -> Iterator[Dict]:
+    left_col, right_col = on
+    right_nulls = {f"{right.name}.{col}": None for col in ['_id'] + list(right.columns)}
+
+    # Conditions on the right side of a LEFT join filter the joined rows, since
+    # pushing them down would turn filtered-out matches into NULL-padded rows
+    post_filter = None
+    if how == 'left' and right_where:
+        post_filter = compile_where({f"{right.name}.{col}": cond
+                                     for col, cond in right_where.items()})
+        right_where = {}
+
+    def scan(side: int):
+        if sources is not None:
+            return sources[side]
+        return left.iter_select(left_where) if side == 0 else right.iter_select(right_where)
+
+    def emit(left_row: Dict, right_row: Optional[Dict]) -> Optional[Dict]:
+        joined = qualify(left.name, left_row)
+        joined.update(qualify(right.name, right_row) if right_row is not None else right_nulls)
+        if post_filter is not None and not post_filter(joined):
+            return None
+        return joined
+
+    # Pick the side to look rows up in: an index beats a hash table, and a hash
+    # table goes on the smaller input. A LEFT join can only probe an index on the right
+    left_indexed = _indexed(left, left_col) and how == 'inner' and sources is None
+    right_indexed = _indexed(right, right_col) and sources is None
+    if left_indexed and (not right_indexed or left.count() >= right.count()):
+        lookup, build_left = _probe_index(left, left_col, left_where), True
+    elif right_indexed:
+        lookup, build_left = _probe_index(right, right_col, right_where), False
+    else:
+        build_left = left.count() < right.count()
+        if build_left:
+            hashed = _build_hash(scan(0), left_col)
+        else:
+            hashed = _build_hash(scan(1), right_col)
+        lookup = lambda value: hashed.get(value, ())
+
+    if not build_left:
+        # Stream the left table, probing the right
+        for left_row in scan(0):
+            value = left_row.get(left_col)
+            matches = lookup(value) if value is not None else ()
+            if matches:
+                for right_row in matches:
+                    joined = emit(left_row, right_row)
+                    if joined is not None:
+                        yield joined
+            elif how == 'left':
+                joined = emit(left_row, None)
+                if joined is not None:
+                    yield joined
+        return
+
+    # Stream the right table, probing the left; a LEFT join remembers which
+    # left rows found a partner and pads the rest at the end
+    matched = set()
+    for right_row in scan(1):
+        value = right_row.get(right_col)
+        if value is None:
+            continue
+        for left_row in lookup(value):
+            if how == 'left':
+                matched.add(left_row['_id'])
+            joined = emit(left_row, right_row)
+            if joined is not None:
+                yield joined
+    if how == 'left':
+        for rows in hashed.values():
+            for left_row in rows:
+                if left_row['_id'] not in matched:
+                    joined = emit(left_row, None)
+                    if joined is not None:
+                        yield joined
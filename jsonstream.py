@@ -0,0 +1,136 @@
+"""
+Streaming JSON readers and writers for import/export
+
+Rows are read and written one at a time, so memory stays flat no matter how
+big the file is. Two formats are supported:
+    json   - a single JSON array of row objects
+    ndjson - one row object per line (newline-delimited JSON, also .jsonl)
+"""
+
+import json
+from typing import Dict, IO, Iterable, Iterator, Optional
+
+FORMATS = ('json', 'ndjson')
+
+
+def guess_format(filename: str) -> str:
+    """Pick a format from the file extension"""
+    return 'ndjson' if filename.lower().endswith(('.ndjson', '.jsonl')) else 'json'
+
+
+# ============ READERS ============
+
+def iter_ndjson(f: IO[str]) -> Iterator[Dict]:
+    """Yield one row per non-blank line"""
+    for line_no, line in enumerate(f, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON on line {line_no}: {e}")
+
+
+def iter_json_array(f: IO[str], chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """Yield the elements of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        # Drop what has been consumed so the buffer never grows past a few chunks
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_ws() -> Optional[str]:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not more():
+                return None
+
+    if skip_ws() != '[':
+        raise ValueError("Expected a JSON array")
+    pos += 1
+
+    if skip_ws() == ']':
+        return
+
+    while True:
+        if skip_ws() is None:
+            raise ValueError("Unexpected end of file inside JSON array")
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if more():
+                    continue
+                raise
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(buf) and more():
+                continue
+            break
+        pos = end
+        yield item
+
+        sep = skip_ws()
+        if sep == ',':
+            pos += 1
+        elif sep == ']':
+            return
+        else:
+            raise ValueError(f"Expected ',' or ']' in JSON array, got {sep!r}")
+
+
+def iter_rows(f: IO[str], fmt: Optional[str] = None) -> Iterator[Dict]:
+    """Yield rows from either format, sniffing the first character when fmt is None"""
+    if fmt is None:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        fmt = 'json' if first == '[' else 'ndjson'
+
+    if fmt == 'json':
+        return iter_json_array(f)
+    if fmt == 'ndjson':
+        return iter_ndjson(f)
+    raise ValueError(f"Unknown format '{fmt}'. Use: {', '.join(FORMATS)}")
+
+
+# ============ WRITERS ============
+
+def write_rows(f: IO[str], rows: Iterable[Dict], fmt: str = 'json',
+               chunk_rows: int = 1000) -> int:
+    """Write rows in the given format, flushing every chunk_rows rows; returns the row count"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Use: {', '.join(FORMATS)}")
+
+    count = 0
+    chunk = []
+    if fmt == 'json':
+        f.write('[')
+    for row in rows:
+        if fmt == 'json':
+            chunk.append(('\n  ' if count == 0 else ',\n  ') + json.dumps(row))
+        else:
+            chunk.append(json.dumps(row) + '\n')
+        count += 1
+        if len(chunk) >= chunk_rows:
+            f.write(''.join(chunk))
+            chunk = []
+    f.write(''.join(chunk))
+    if fmt == 'json':
+        f.write('\n]\n' if count else ']\n')
+    return count
@@ -0,0 +1,106 @@
+"""
+Locks for sharing one PyDBMS between threads
+
+RWLock lets any number of readers in at once and writers in one at a time.
+Waiting writers are let in before new readers, so a steady stream of queries
+can't starve them. Both sides are re-entrant per thread, and a thread holding
+the write lock may also read.
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class RWLock:
+    """Reader-writer lock with writer preference"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    def _depth(self, kind: str) -> int:
+        return getattr(self._local, kind, 0)
+
+    def acquire_read(self) -> None:
+        depth = self._depth('read')
+        if depth or self._writer == threading.get_ident():
+            # Already inside: waiting here could deadlock behind a queued writer
+            self._local.read = depth + 1
+            return
+        with self._cond:
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        self._local.read = 1
+
+    def release_read(self) -> None:
+        depth = self._depth('read') - 1
+        self._local.read = depth
+        if depth or self._writer == threading.get_ident():
+            return
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        me = threading.get_ident()
+        if self._writer == me:
+            self._local.write = self._depth('write') + 1
+            return
+        if self._depth('read'):
+            raise RuntimeError("Can't take the write lock while holding the read lock")
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = me
+        self._local.write = 1
+
+    def release_write(self) -> None:
+        depth = self._depth('write') - 1
+        self._local.write = depth
+        if depth:
+            return
+        with self._cond:
+            self._writer = None
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class NullLock:
+    """Stand-in for RWLock when a database is only used from one thread"""
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        yield
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        yield
+
+    def __enter__(self) -> 'NullLock':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
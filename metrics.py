@@ -0,0 +1,207 @@
+"""
+Operation timers and the slow-query log
+
+With PyDBMS(metrics=True) every query and write is timed, along with the disk
+work behind it (log appends and fsyncs, snapshot and metadata writes, loading
+cold tables): call counts, total and percentile latencies, rows scanned versus
+returned and bytes written. Queries and writes slower than slow_query_ms also
+go to the slow-query log, one JSON line each. Without metrics PyDBMS uses
+NullMetrics, whose timers do nothing.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# Latencies kept per operation (the most recent ones) for percentiles
+SAMPLES = 1024
+
+
+class Timer:
+    """Times one operation; the caller fills in rows and bytes as it learns them"""
+
+    __slots__ = ('metrics', 'op', 'detail', 'start', 'scanned', 'returned', 'written')
+
+    def __init__(self, metrics: 'Metrics', op: str, detail: Optional[Dict]):
+        self.metrics = metrics
+        self.op = op
+        # What the slow-query log shows about the call (None: never logged)
+        self.detail = detail
+        self.scanned = 0
+        self.returned = 0
+        self.written = 0
+
+    def scan(self, rows: Iterable[Dict]) -> Iterable[Dict]:
+        """Pass rows through, counting them as scanned
+
+        A range stands for that many rows examined elsewhere (by the workers
+        of a parallel scan) and is counted at once.
+        """
+        if isinstance(rows, range):
+            self.scanned += len(rows)
+            return rows
+        return self._count(rows)
+
+    def _count(self, rows: Iterable[Dict]) -> Iterator[Dict]:
+        for row in rows:
+            self.scanned += 1
+            yield row
+
+    def __enter__(self) -> 'Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        self.metrics.record(self, time.perf_counter() - self.start, exc_type is not None)
+
+
+class OpStats:
+    """Running totals for one operation"""
+
+    __slots__ = ('calls', 'errors', 'seconds', 'max', 'samples', 'scanned', 'returned',
+                 'written')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLES)
+        self.scanned = 0
+        self.returned = 0
+        self.written = 0
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def percentile(p: float) -> float:
+            return round(ordered[int((len(ordered) - 1) * p)] * 1000, 3) if ordered else 0.0
+
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_ms': round(self.seconds * 1000, 3),
+            'mean_ms': round(self.seconds * 1000 / self.calls, 3) if self.calls else 0.0,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(self.max * 1000, 3),
+            'rows_scanned': self.scanned,
+            'rows_returned': self.returned,
+            'bytes_written': self.written
+        }
+
+
+class Metrics:
+    """Per-operation counters, shared by every thread using one PyDBMS"""
+
+    enabled = True
+
+    def __init__(self, slow_query_log: Optional[str] = None, slow_query_ms: float = 100.0):
+        self.slow_query_log = slow_query_log
+        self.slow_query_ms = slow_query_ms
+        self.ops: Dict[str, OpStats] = {}
+        self.since = datetime.now().isoformat()
+        self.lock = threading.Lock()
+        self.log_lock = threading.Lock()
+
+    def timer(self, op: str) -> Timer:
+        """Timer for an internal step, never written to the slow-query log"""
+        return Timer(self, op, None)
+
+    def query(self, op: str, table: Optional[str] = None, **detail) -> Timer:
+        """Timer for a call made by a user, written to the slow-query log if it is slow"""
+        return Timer(self, op, dict(table=table, **detail))
+
+    def record(self, timer: Timer, seconds: float, failed: bool) -> None:
+        with self.lock:
+            stats = self.ops.get(timer.op)
+            if stats is None:
+                stats = self.ops[timer.op] = OpStats()
+            stats.calls += 1
+            stats.errors += failed
+            stats.seconds += seconds
+            stats.max = max(stats.max, seconds)
+            stats.samples.append(seconds)
+            stats.scanned += timer.scanned
+            stats.returned += timer.returned
+            stats.written += timer.written
+        if (self.slow_query_log is not None and timer.detail is not None
+                and seconds * 1000 >= self.slow_query_ms):
+            self._log_slow(timer, seconds, failed)
+
+    def _log_slow(self, timer: Timer, seconds: float, failed: bool) -> None:
+        entry = {
+            'time': datetime.now().isoformat(),
+            'op': timer.op,
+            'ms': round(seconds * 1000, 3),
+            'rows_scanned': timer.scanned,
+            'rows_returned': timer.returned
+        }
+        if failed:
+            entry['error'] = True
+        entry.update((key, value) for key, value in timer.detail.items()
+                     if value is not None and value is not False)
+        # WHERE values may be tuples, dates...: anything JSON can't hold is written as text
+        line = json.dumps(entry, default=str) + '\n'
+        try:
+            with self.log_lock, open(self.slow_query_log, 'a') as f:
+                f.write(line)
+        except OSError as e:
+            print(f"Error writing slow-query log: {e}")
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Any]:
+        """Summary of every operation timed so far, optionally starting afresh"""
+        with self.lock:
+            summary = {
+                'enabled': True,
+                'since': self.since,
+                'slow_query_log': self.slow_query_log,
+                'slow_query_ms': self.slow_query_ms,
+                'operations': {op: stats.summary() for op, stats in sorted(self.ops.items())}
+            }
+            if reset:
+                self.ops = {}
+                self.since = datetime.now().isoformat()
+        return summary
+
+
+class NullTimer:
+    """Stand-in for Timer when metrics are off"""
+
+    __slots__ = ()
+
+    scanned = returned = written = 0
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        pass
+
+    def scan(self, rows: Iterable[Dict]) -> Iterable[Dict]:
+        return rows
+
+    def __enter__(self) -> 'NullTimer':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class NullMetrics:
+    """Stand-in for Metrics when a database isn't instrumented"""
+
+    enabled = False
+
+    def timer(self, op: str) -> NullTimer:
+        return NULL_TIMER
+
+    def query(self, op: str, table: Optional[str] = None, **detail) -> NullTimer:
+        return NULL_TIMER
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Any]:
+        return {'enabled': False, 'operations': {}}
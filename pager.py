@@ -0,0 +1,417 @@
+"""
+Paged on-disk storage engine
+
+Rows are appended as records to fixed-size pages in a per-table data file that
+is accessed through mmap. Pages are cached in a shared BufferPool with LRU
+eviction and dirty-page write-back, so a table can be much larger than memory:
+only the row directory (ID and record address, 16 bytes a row) stays in RAM.
+
+Pages are append-only. An update writes a new copy of the row and a delete only
+tombstones the directory entry, so the bytes a snapshot points at never change.
+vacuum() reclaims the dead space by writing the live rows to a new generation
+of the data file; the old one is deleted once a snapshot no longer needs it.
+"""
+
+import json
+import mmap
+import os
+import re
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import count
+from struct import pack_into, unpack_from
+from typing import Any, Dict, List, Optional, Tuple
+
+from storage import DenseStore
+
+PAGE_SIZE = 8192
+# Each page starts with the number of bytes used in it (header included)
+PAGE_HEADER = 4
+# Pages are added to the data file this many at a time to avoid remapping on every page
+GROW_PAGES = 128
+
+
+def remove_data_files(path: str, keep: Optional[int] = None) -> None:
+    """Delete every generation of a data file (path, path.1, path.2, ...) except keep"""
+    directory, name = os.path.split(path)
+    if not os.path.isdir(directory or '.'):
+        return
+    pattern = re.compile(re.escape(name) + r'(\.(\d+))?$')
+    for entry in os.listdir(directory or '.'):
+        match = pattern.match(entry)
+        if match and int(match.group(2) or 0) != keep:
+            os.remove(os.path.join(directory, entry))
+
+
+class PageFile:
+    """A data file of fixed-size pages, memory-mapped"""
+
+    _ids = count()
+
+    def __init__(self, path: str, page_size: int = PAGE_SIZE):
+        self.id = next(self._ids)
+        self.path = path
+        self.page_size = page_size
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        self.file = open(path, mode)
+        self.map = None
+        self.capacity = 0
+        self._remap()
+
+    def _remap(self) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        size = os.fstat(self.file.fileno()).st_size
+        self.capacity = size // self.page_size
+        if size:
+            self.map = mmap.mmap(self.file.fileno(), size)
+
+    def ensure(self, page_no: int) -> None:
+        """Grow the file so that page_no exists"""
+        if page_no < self.capacity:
+            return
+        pages = (page_no // GROW_PAGES + 1) * GROW_PAGES
+        self.file.truncate(pages * self.page_size)
+        self._remap()
+
+    def read(self, page_no: int) -> bytearray:
+        start = page_no * self.page_size
+        return bytearray(self.map[start:start + self.page_size])
+
+    def write(self, page_no: int, data: bytearray) -> None:
+        start = page_no * self.page_size
+        self.map[start:start + self.page_size] = data
+
+    def used(self, page_no: int) -> int:
+        """Bytes used in a page according to its header (0 for a never-written page)"""
+        return unpack_from('<I', self.map, page_no * self.page_size)[0]
+
+    def flush(self) -> None:
+        if self.map is not None:
+            self.map.flush()
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+class BufferPool:
+    """LRU cache of pages shared by every paged table of a database"""
+
+    def __init__(self, capacity: int = 1024):
+        if capacity < 1:
+            raise ValueError("Buffer pool needs room for at least one page")
+        self.capacity = capacity
+        # (file id, page number) -> [file, frame, dirty]
+        self.frames: 'OrderedDict[Tuple[int, int], List]' = OrderedDict()
+        # Readers on different threads share the pool
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0
+
+    def get(self, file: PageFile, page_no: int) -> bytearray:
+        """The cached frame for a page, reading it in (and evicting the LRU page) on a miss"""
+        key = (file.id, page_no)
+        with self.lock:
+            entry = self.frames.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.frames.move_to_end(key)
+                return entry[1]
+
+            self.misses += 1
+            file.ensure(page_no)
+            frame = file.read(page_no)
+            self.frames[key] = [file, frame, False]
+            while len(self.frames) > self.capacity:
+                (_, old_page_no), (old_file, old_frame, dirty) = self.frames.popitem(last=False)
+                self.evictions += 1
+                if dirty:
+                    old_file.write(old_page_no, old_frame)
+                    self.writebacks += 1
+            return frame
+
+    def mark_dirty(self, file: PageFile, page_no: int) -> None:
+        with self.lock:
+            self.frames[(file.id, page_no)][2] = True
+
+    def flush(self, file: Optional[PageFile] = None) -> None:
+        """Write dirty pages (of one file, or all) back to their files"""
+        files = {}
+        with self.lock:
+            for (file_id, page_no), entry in self.frames.items():
+                if entry[2] and (file is None or file_id == file.id):
+                    entry[0].write(page_no, entry[1])
+                    entry[2] = False
+                    self.writebacks += 1
+                    files[file_id] = entry[0]
+            for page_file in files.values():
+                page_file.flush()
+
+    def discard(self, file: PageFile) -> None:
+        """Drop every cached page of a file without writing it back"""
+        with self.lock:
+            for key in [key for key in self.frames if key[0] == file.id]:
+                del self.frames[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'capacity_pages': self.capacity,
+            'cached_pages': len(self.frames),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'writebacks': self.writebacks,
+        }
+
+
+class PagedStore(DenseStore):
+    """Disk-backed engine: rows are JSON records in mmap'd pages cached by a BufferPool"""
+
+    kind = 'paged'
+
+    def __init__(self, columns: Dict[str, str], rows: Optional[Dict] = None):
+        super().__init__()
+        self.columns = list(columns)
+        self.addrs = array('q')
+        self.page_size = PAGE_SIZE
+        self.generation = 0
+        self.retired: List[str] = []
+        self.file = None
+        self.pool = None
+        self.base_path = None
+        self.tail = 0
+        for row_id, row in (rows or {}).items():
+            self.put(row_id, {k: v for k, v in row.items() if k != '_id'})
+
+    def __getstate__(self) -> Dict:
+        # Only the directory is pickled; the rows themselves are in the data file
+        self.flush()
+        state = dict(self.__dict__)
+        state['file'] = None
+        state['pool'] = None
+        state['base_path'] = None
+        state['retired'] = []
+        return state
+
+    # ---- file handling ----
+
+    def _generation_path(self, generation: int) -> str:
+        return self.base_path if generation == 0 else f"{self.base_path}.{generation}"
+
+    def attach(self, path: str, pool: BufferPool) -> None:
+        """Open the table's data file through a buffer pool"""
+        self.close()
+        self.base_path = path
+        remove_data_files(path, keep=self.generation)
+        self.retired = []
+        self.file = PageFile(self._generation_path(self.generation), self.page_size)
+        self.pool = pool
+        # Appends continue after the last page that holds data
+        self.tail = 0
+        for page_no in range(self.file.capacity - 1, -1, -1):
+            if self.file.used(page_no):
+                self.tail = page_no
+                break
+
+    def after_checkpoint(self, snapshot: 'PagedStore') -> None:
+        """snapshot (a copy() of this store) is on disk: generations older than its own can go"""
+        # A vacuum may have run since the copy was taken, so newer ones stay
+        old = {self._generation_path(generation) for generation in range(snapshot.generation)}
+        for path in self.retired:
+            if path in old and os.path.exists(path):
+                os.remove(path)
+        self.retired = [path for path in self.retired if path not in old]
+
+    def destroy(self) -> None:
+        """Close and delete every data file of the table"""
+        if self.base_path is None:
+            return
+        self.close()
+        remove_data_files(self.base_path)
+        self.retired = []
+
+    def copy(self) -> 'PagedStore':
+        # Copying goes through __getstate__, so the copy holds no file
+        clone = super().copy()
+        clone.addrs = self.addrs[:]
+        return clone
+
+    def dump(self, columns: List[str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Engine state and the row directory ('_id' and '_addr') to write a snapshot from
+
+        The rows themselves stay in the data file.
+        """
+        state = {'generation': self.generation, 'page_size': self.page_size}
+        return state, {'_id': self._live(self.ids), '_addr': self._live(self.addrs)}
+
+    @classmethod
+    def restore(cls, columns: Dict[str, str], state: Dict[str, Any],
+                lists: Dict[str, Any]) -> 'PagedStore':
+        """Rebuild a store from what dump() returned (attach() opens its data file)"""
+        store = cls(columns)
+        store.generation = state['generation']
+        store.page_size = state['page_size']
+        store.ids = array('q', lists['_id'])
+        store.addrs = array('q', lists['_addr'])
+        store._reset_tombstones()
+        return store
+
+    def _ensure_attached(self) -> None:
+        # A Tbl used on its own (outside a PyDBMS catalog) gets a private temp file
+        if self.file is None:
+            fd, path = tempfile.mkstemp(suffix='.pages')
+            os.close(fd)
+            self.attach(path, BufferPool())
+
+    def flush(self) -> None:
+        """Write dirty pages back to the data file"""
+        if self.file is not None:
+            self.pool.flush(self.file)
+
+    def close(self) -> None:
+        """Write back and release the data file"""
+        if self.file is not None:
+            self.flush()
+            self.pool.discard(self.file)
+            self.file.close()
+            self.file = None
+
+    # ---- records ----
+
+    def _encode(self, data: Dict[str, Any]) -> bytes:
+        payload = json.dumps([data.get(col) for col in self.columns],
+                             separators=(',', ':')).encode('utf-8')
+        if 4 + len(payload) > self.page_size - PAGE_HEADER:
+            raise ValueError(f"Row is {len(payload)} bytes, too large for a {self.page_size}-byte page")
+        return payload
+
+    def _write_at(self, file: PageFile, tail: int, payload: bytes) -> Tuple[int, int]:
+        """Append a record to a file's tail page, returning the new tail and the record address"""
+        need = 4 + len(payload)
+        page = self.pool.get(file, tail)
+        used = unpack_from('<I', page, 0)[0] or PAGE_HEADER
+        if used + need > self.page_size:
+            tail += 1
+            page = self.pool.get(file, tail)
+            used = PAGE_HEADER
+
+        pack_into('<I', page, used, len(payload))
+        page[used + 4:used + need] = payload
+        pack_into('<I', page, 0, used + need)
+        self.pool.mark_dirty(file, tail)
+        return tail, tail * self.page_size + used
+
+    def _read_at(self, file: PageFile, addr: int) -> Dict[str, Any]:
+        page_no, offset = divmod(addr, self.page_size)
+        page = self.pool.get(file, page_no)
+        length = unpack_from('<I', page, offset)[0]
+        values = json.loads(page[offset + 4:offset + 4 + length])
+        return {col: value for col, value in zip(self.columns, values) if value is not None}
+
+    def _append(self, payload: bytes) -> int:
+        self._ensure_attached()
+        self.tail, addr = self._write_at(self.file, self.tail, payload)
+        return addr
+
+    def _read(self, addr: int) -> Dict[str, Any]:
+        self._ensure_attached()
+        return self._read_at(self.file, addr)
+
+    def _materialize(self, pos: int) -> Dict:
+        return {'_id': self.ids[pos], **self._read(self.addrs[pos])}
+
+    # ---- writes ----
+
+    def put(self, row_id: int, data: Dict[str, Any]) -> Dict:
+        """Store a new row (or replace an existing one) and return it"""
+        addr = self._append(self._encode(data))
+
+        if not self.ids or row_id > self.ids[-1]:
+            self.ids.append(row_id)
+            self.addrs.append(addr)
+            self.dead.append(False)
+        else:
+            pos = bisect_left(self.ids, row_id)
+            if pos < len(self.ids) and self.ids[pos] == row_id:
+                # Replaying a row we already hold: point it at the new copy
+                if self.dead.get(pos):
+                    self.dead.set(pos, False)
+                    self.dead_count -= 1
+                self.addrs[pos] = addr
+            else:
+                self.ids.insert(pos, row_id)
+                self.addrs.insert(pos, addr)
+                self.dead.insert(pos, False)
+        return {'_id': row_id, **{k: v for k, v in data.items() if v is not None}}
+
+    def put_many(self, first_id: int, batch: List[Dict[str, Any]]) -> List[Dict]:
+        """Store rows under consecutive IDs starting at first_id, all or nothing"""
+        # Encode everything first so a bad row fails before any page is touched
+        payloads = [self._encode(data) for data in batch]
+        if self.ids and first_id <= self.ids[-1]:
+            return [self.put(row_id, data) for row_id, data in enumerate(batch, first_id)]
+
+        for row_id, payload in enumerate(payloads, first_id):
+            self.ids.append(row_id)
+            self.addrs.append(self._append(payload))
+            self.dead.append(False)
+        return [{'_id': row_id, **{k: v for k, v in data.items() if v is not None}}
+                for row_id, data in enumerate(batch, first_id)]
+
+    def patch(self, row_id: int, data: Dict[str, Any]) -> Dict:
+        """Write a new copy of a row with some columns changed and return it"""
+        pos = self._position(row_id)
+        if pos < 0:
+            raise KeyError(row_id)
+        row = self._read(self.addrs[pos])
+        row.update(data)
+        self.addrs[pos] = self._append(self._encode(row))
+        return {'_id': row_id, **{k: v for k, v in row.items() if v is not None}}
+
+    def vacuum(self) -> None:
+        """Rewrite the data file with only the live rows"""
+        if self.file is None:
+            return
+        old_file = self.file
+        new_path = self._generation_path(self.generation + 1)
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        new_file = PageFile(new_path, self.page_size)
+
+        ids, addrs = array('q'), array('q')
+        tail = 0
+        try:
+            for pos in self._live_positions():
+                payload = self._encode(self._read_at(old_file, self.addrs[pos]))
+                tail, addr = self._write_at(new_file, tail, payload)
+                ids.append(self.ids[pos])
+                addrs.append(addr)
+            self.pool.flush(new_file)
+        except Exception:
+            self.pool.discard(new_file)
+            new_file.close()
+            os.remove(new_path)
+            raise
+
+        # The last snapshot still points into the old file, so keep it until the next one
+        self.pool.discard(old_file)
+        old_file.close()
+        self.retired.append(old_file.path)
+        self.generation += 1
+        self.file, self.tail = new_file, tail
+        self.ids, self.addrs = ids, addrs
+        self._reset_tombstones()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.pool.stats() if self.pool is not None else {}
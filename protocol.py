@@ -0,0 +1,55 @@
+"""
+Wire protocol shared by the PyDBMS server and client
+
+Every message is one frame: a 4-byte big-endian length followed by that many
+bytes of UTF-8 JSON. Requests look like
+    {"id": 7, "op": "select", "args": ["users"], "kwargs": {"where": {"age": 30}}}
+and each gets one response carrying the same id, in the order the requests
+were sent:
+    {"id": 7, "ok": true, "result": [...]}
+    {"id": 7, "ok": false, "error": "ValueError", "message": "Table 'x' does not exist"}
+A client may send any number of requests before reading the responses
+(pipelining), so a batch of small queries costs one round trip, not one each.
+"""
+
+import json
+import struct
+from typing import Any, Dict
+
+HEADER = struct.Struct('>I')
+# Refuse frames bigger than this rather than trying to buffer them
+MAX_FRAME = 256 * 1024 * 1024
+DEFAULT_PORT = 7734
+
+
+def _plain(value: Any) -> Any:
+    """JSON form of the non-JSON values a request may carry (sets, sent as lists)"""
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Can't send {type(value).__name__} values to the server: {value!r}")
+
+
+def encode(message: Dict[str, Any], lenient: bool = False) -> bytes:
+    """One message as a complete frame
+
+    A value JSON can't hold raises TypeError (sets go as lists), so a request
+    never reaches the server as something else. lenient (for responses) sends
+    it as text instead.
+    """
+    payload = json.dumps(message, separators=(',', ':'),
+                         default=str if lenient else _plain).encode('utf-8')
+    if len(payload) > MAX_FRAME:
+        raise ValueError(f"Message of {len(payload)} bytes is over the {MAX_FRAME} byte limit")
+    return HEADER.pack(len(payload)) + payload
+
+
+def frame_size(header: bytes) -> int:
+    """Payload length announced by a frame header"""
+    (size,) = HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"Frame of {size} bytes is over the {MAX_FRAME} byte limit")
+    return size
+
+
+def decode(payload: bytes) -> Dict[str, Any]:
+    return json.loads(payload)
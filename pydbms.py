@@ -6,193 +6,838 @@ Features: Robust storage, visual table display, data verification
 # Update wont work well
 # Select isnt working well with where clause
 
+import atexit
 import json
 import os
 import pickle
-from typing import Any, Dict, List, Optional
+import threading
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from datetime import datetime
 
+from cache import QueryCache
+from catalog import TableCatalog
+from checkpointer import Checkpointer
+from cursor import Cursor
+from dirlock import DirectoryLock
+from join import JOIN_TYPES, hash_join
+from jsonstream import guess_format, iter_rows, write_rows
+from locks import NullLock, RWLock
+from metrics import Metrics, NullMetrics
+from pager import BufferPool
+from parallel import DEFAULT_THRESHOLD, ParallelScan
+from query import coerce, coerce_where
+from sql import Expression, parse
 from table import Tbl
-from interactive import DBMSCLI
+from wal import WriteAheadLog, atomic_open, encode
 
 class PyDBMS:
     """Simple, yet functional database management system"""
     
-    def __init__(self, db_name: str = 'default'):
+    def __init__(self, db_name: str = 'default', sync: bool = True,
+                 checkpoint_size: int = 16 * 1024 * 1024,
+                 buffer_pool_pages: int = 1024, cache_bytes: int = 0,
+                 threadsafe: bool = False, multiprocess: bool = False,
+                 checkpoint_interval: Optional[float] = None, metrics: bool = False,
+                 slow_query_log: Optional[str] = None, slow_query_ms: float = 100.0,
+                 compress: bool = True, parallel_workers: int = 0,
+                 parallel_threshold: int = DEFAULT_THRESHOLD):
+        if parallel_workers > 1 and (threadsafe or checkpoint_interval):
+            # A scan forks its workers, and forking while other threads run can
+            # copy a lock one of them holds into a worker that then never gets it
+            raise ValueError("parallel_workers can't be combined with threadsafe or "
+                             "checkpoint_interval")
         self.db_name = db_name
         self.db_path = os.path.join('databases', db_name)
-        self.tables = {}
+        # Opt-in timers for every operation (see get_stats); calls slower than
+        # slow_query_ms are appended to slow_query_log, which implies metrics=True
+        if metrics or slow_query_log:
+            self.metrics = Metrics(slow_query_log, slow_query_ms)
+        else:
+            self.metrics = NullMetrics()
+        # Pages of paged tables cached in memory (8 KB each)
+        self.buffer_pool = BufferPool(buffer_pool_pages)
+        # Opt-in: full scans of tables with parallel_threshold rows or more are
+        # filtered and aggregated by parallel_workers forked processes
+        self.parallel = (ParallelScan(parallel_workers, parallel_threshold)
+                         if parallel_workers > 1 else None)
+        # Snapshots are written in a binary format, zlib-compressed unless compress=False
+        self.tables = TableCatalog(os.path.join(self.db_path, 'tables'), pool=self.buffer_pool,
+                                   metrics=self.metrics, compress=compress,
+                                   parallel=self.parallel)
+        # Opt-in cache of select results, up to cache_bytes of memory
+        self.cache = QueryCache(cache_bytes) if cache_bytes else None
+        self.created = None
+        
+        # With threadsafe=True, queries share a read lock and run in parallel while
+        # writers change memory under the write lock one at a time. The log write
+        # happens after the write lock is released (writers stay ordered by
+        # self.writer), so queries never wait on disk I/O.
+        self.threadsafe = threadsafe
+        self.lock = RWLock() if threadsafe else NullLock()
+        # A background checkpointer is a second thread that must not overlap writes
+        self.writer = threading.RLock() if threadsafe or checkpoint_interval else NullLock()
+        
+        # Records written inside transaction(), held back until it commits, and
+        # the tables it changed (re-read from disk if it is rolled back)
+        self.txn: Optional[List[Dict]] = None
+        self.txn_tables: Set[str] = set()
+        self.txn_owner: Optional[int] = None
+        
+        # Writes go to the log; a full snapshot is only taken once the log
+        # grows past checkpoint_size bytes. With checkpoint_interval set that
+        # happens on a background thread (also every checkpoint_interval
+        # seconds), so writers never do more than append to the log
+        self.checkpoint_size = checkpoint_size
+        self.checkpoint_lock = threading.RLock()
+        self.checkpointer: Optional[Checkpointer] = None
         
         # Create database directory if it doesn't exist
         os.makedirs(self.db_path, exist_ok=True)
+        self.wal = WriteAheadLog(os.path.join(self.db_path, 'database.wal'), sync=sync)
         
-        # Load existing database
-        self._load()
+        # With multiprocess=True several processes can open the same database:
+        # writers hold an fcntl lock on the directory, and every process tails
+        # the shared log (and notices checkpoints through a generation counter)
+        # to pick up the others' changes before it reads or writes
+        self.dirlock = DirectoryLock(os.path.join(self.db_path, 'LOCK')) if multiprocess else None
+        self.generation = 0
+        self.wal_offset = 0
         
-        # Save metadata
-        self._save_metadata()
+        # Load the catalog; table data is only read when a table is first used
+        with self._write_access(catch_up=False):
+            self._load()
+            if self.dirlock is not None:
+                self.generation = self.dirlock.generation()
+                self.wal_offset = self.wal.size()
+                if any(entry.get('storage') == 'paged' for entry in self.tables.entries.values()):
+                    raise ValueError("Paged tables can't be shared between processes")
+        
+        if checkpoint_interval:
+            self.checkpointer = Checkpointer(self, checkpoint_interval)
+            self.checkpointer.start()
+            # Whatever is still only in the log gets a snapshot at exit
+            atexit.register(self.close)
     
     # ============ TABLE OPERATIONS ============
     
-    def create_table(self, table_name: str, columns: Dict[str, str]) -> None:
-        """Create a new table"""
-        if table_name in self.tables:
-            raise ValueError(f"Table '{table_name}' already exists")
+    def create_table(self, table_name: str, columns: Dict[str, str],
+                     storage: str = 'row') -> None:
+        """Create a new table
         
+        storage='column' keeps each column in a typed array instead of a dict per
+        row, which takes far less memory for large tables. storage='paged' keeps
+        rows on disk in pages cached by the buffer pool, for tables bigger than memory.
+        """
         if not columns:
             raise ValueError("Table must have at least one column")
+        if storage == 'paged' and self.dirlock is not None:
+            raise ValueError("Paged tables can't be shared between processes")
         
-        self.tables[table_name] = Tbl(table_name, columns)
-        self._save()
-        self._save_metadata()
+        with self._write_access():
+            self._outside_transaction("create a table")
+            with self.lock.write():
+                if table_name in self.tables:
+                    raise ValueError(f"Table '{table_name}' already exists")
+                self.tables.add(Tbl(table_name, columns, storage))
+            try:
+                self._save([{'op': 'create_table', 'table': table_name, 'columns': columns,
+                             'storage': storage}])
+            except Exception:
+                with self.lock.write():
+                    self.tables.remove(table_name)
+                raise
+            self._save_metadata()
         print(f"✓ Tbl '{table_name}' created successfully")
         print(f"  Location: {self.db_path}")
     
     def drop_table(self, table_name: str) -> None:
         """Delete a table"""
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-        
-        del self.tables[table_name]
-        self._save()
-        self._save_metadata()
+        with self._write_access():
+            self._outside_transaction("drop a table")
+            self._require(table_name)
+            self._save([{'op': 'drop_table', 'table': table_name}])
+            with self.lock.write():
+                self.tables.remove(table_name)
+            self._save_metadata()
         print(f"✓ Table '{table_name}' dropped successfully")
     
     def list_tables(self) -> List[str]:
         """List all tables"""
-        return list(self.tables.keys())
+        self._sync()
+        with self.lock.read():
+            return list(self.tables.keys())
     
     def describe(self, table_name: str) -> Dict:
         """Show table structure"""
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-        
-        table = self.tables[table_name]
+        self._sync()
+        with self.lock.read():
+            self._require(table_name)
+            # Answered from the catalog, so describing a cold table doesn't load it
+            entry = self.tables.describe(table_name)
         return {
-            'name': table.name,
-            'columns': table.columns,
-            'row_count': table.count()
+            'name': table_name,
+            'columns': entry['columns'],
+            'storage': entry.get('storage', 'row'),
+            'row_count': entry.get('row_count', 0),
+            'indexes': entry.get('indexes', {})
         }
     
+    def create_index(self, table_name: str, column: str, kind: str = 'hash') -> None:
+        """Create an index on a column: 'hash' for equality, 'sorted' for ranges and ORDER BY"""
+        with self._write_access():
+            with self.lock.write():
+                self._writable(table_name).create_index(column, kind)
+            self._save([{'op': 'create_index', 'table': table_name, 'column': column,
+                         'kind': kind}])
+        print(f"✓ Index on '{table_name}.{column}' created successfully")
+    
+    def drop_index(self, table_name: str, column: str) -> None:
+        """Remove an index from a column"""
+        with self._write_access():
+            with self.lock.write():
+                self._writable(table_name).drop_index(column)
+            self._save([{'op': 'drop_index', 'table': table_name, 'column': column}])
+        print(f"✓ Index on '{table_name}.{column}' dropped successfully")
+    
     # ============ DATA OPERATIONS ============
     
     def insert(self, table_name: str, data: Dict[str, Any]) -> int:
         """Insert a row into table"""
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-        
-        row_id = self.tables[table_name].insert(data)
-        self._save()
+        with self.metrics.query('insert', table_name) as timer, self._write_access():
+            with self.lock.write():
+                table = self._writable(table_name)
+                # Encoded first, so a value the log can't hold never reaches the table
+                record = {'op': 'insert', 'table': table_name, 'id': table.next_id, 'data': data}
+                encoded = encode([record])
+                row_id = table.insert(data)
+            self._save([record], encoded)
+            timer.returned = 1
         return row_id
     
+    def insert_many(self, table_name: str, rows: Iterable[Dict[str, Any]],
+                    batch_size: Optional[int] = None) -> List[int]:
+        """Insert many rows, validating and persisting once per batch
+        
+        With batch_size set, rows are inserted and logged batch_size at a time,
+        so a long load is durable (and can checkpoint) partway through.
+        """
+        self._require(table_name)
+        rows = iter(rows)
+        ids = []
+        while True:
+            batch = list(islice(rows, batch_size)) if batch_size else list(rows)
+            if not batch:
+                break
+            
+            with self.metrics.query('insert_many', table_name, rows=len(batch)) as timer, \
+                    self._write_access():
+                with self.lock.write():
+                    table = self._writable(table_name)
+                    record = {'op': 'insert_many', 'table': table_name,
+                              'first_id': table.next_id, 'rows': batch}
+                    encoded = encode([record])
+                    batch_ids = table.insert_many(batch)
+                self._save([record], encoded)
+                timer.returned = len(batch_ids)
+            ids.extend(batch_ids)
+            if not batch_size:
+                break
+        return ids
+    
     def select(self, table_name: str, where: Optional[Dict] = None, 
-               limit: Optional[int] = None) -> List[Dict]:
-        """Query data from table"""
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
+               limit: Optional[int] = None, order_by: Optional[str] = None,
+               desc: bool = False) -> List[Dict]:
+        """Query data from table
+        
+        where maps columns to a value (equality) or to operators, e.g.
+        {'price': {'between': (10, 50)}, 'status': {'in': ['new', 'paid']}}
+        """
+        self._sync()
+        with self.metrics.query('select', table_name, where=where, limit=limit,
+                                order_by=order_by, desc=desc) as timer:
+            key = self.cache.key(table_name, where, limit, order_by, desc) if self.cache else None
+            if key is not None:
+                rows = self.cache.get(key)
+                if rows is not None:
+                    timer.returned = len(rows)
+                    return rows
+            
+            with self.lock.read():
+                rows = self._require(table_name).select(where=where, limit=limit,
+                                                        order_by=order_by, desc=desc,
+                                                        scan=timer.scan)
+            if key is not None:
+                self.cache.put(key, rows)
+            timer.returned = len(rows)
+        return rows
+    
+    def iter_select(self, table_name: str, where: Optional[Dict] = None,
+                    limit: Optional[int] = None, order_by: Optional[str] = None,
+                    desc: bool = False) -> Cursor:
+        """Query data lazily: rows are found only as the cursor is read
+        
+        In threadsafe mode the cursor reads from a snapshot taken when it is opened.
+        """
+        self._sync()
+        with self.lock.read():
+            return Cursor(self._require(table_name).iter_select(
+                where=where, limit=limit, order_by=order_by, desc=desc,
+                snapshot=self.threadsafe))
+    
+    def aggregate(self, table_name: str, group_by: Optional[List[str]] = None,
+                  aggs: Optional[Dict[str, Any]] = None,
+                  where: Optional[Dict] = None) -> List[Dict]:
+        """Aggregate rows without copying them out of the table
+        
+        aggs maps result names to (function, column), function being count, sum,
+        avg, min or max, e.g. {'n': ('count', '*'), 'revenue': ('sum', 'price')}.
+        Returns one dict per group (a single dict without group_by).
+        """
+        self._sync()
+        with self.metrics.query('aggregate', table_name, where=where,
+                                group_by=group_by) as timer, self.lock.read():
+            groups = self._require(table_name).aggregate(aggs or {'count': ('count', '*')},
+                                                         group_by, where, scan=timer.scan)
+            timer.returned = len(groups)
+        return groups
+    
+    def join(self, left: str, right: str, on: Tuple[str, str], how: str = 'inner',
+             where: Optional[Dict] = None) -> Cursor:
+        """Join two tables on left.on[0] == right.on[1], lazily
         
-        return self.tables[table_name].select(where=where, limit=limit)
+        Rows come back with qualified column names ('orders.total'); where may use
+        qualified or, when unambiguous, plain column names. how is 'inner' or 'left'.
+        """
+        if left == right:
+            raise ValueError("Joining a table with itself is not supported")
+        if how not in JOIN_TYPES:
+            raise ValueError(f"Unknown join type '{how}'. Use: {', '.join(JOIN_TYPES)}")
+        
+        self._sync()
+        with self.lock.read():
+            left_table, right_table = self._require(left), self._require(right)
+            for table, col in ((left_table, on[0]), (right_table, on[1])):
+                if col not in table.columns and col != '_id':
+                    raise ValueError(f"Column '{col}' does not exist in table '{table.name}'")
+            
+            return Cursor(hash_join(left_table, right_table, on, how, where,
+                                    snapshot=self.threadsafe))
     
     def update(self, table_name: str, data: Dict[str, Any], 
                where: Dict[str, Any]) -> int:
-        """Update rows in table"""
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
+        """Update rows in table
         
-        count = self.tables[table_name].update(data, where)
-        self._save()
-        return count
+        A value may be a callable computing it from the row, as in
+        db.update('items', {'stock': lambda row: row['stock'] - 1}, {'sku': 'A1'});
+        each row gets its own value, and those are what is logged.
+        """
+        with self.metrics.query('update', table_name, where=where) as timer, \
+                self._write_access():
+            # Callables can't be logged, only what they computed for each row
+            fixed = {col: value for col, value in data.items() if not callable(value)}
+            encode([fixed])
+            with self.lock.write():
+                ids, changes = self._writable(table_name).update_where(data, where,
+                                                                       scan=timer.scan)
+            if ids:
+                record = {'op': 'update', 'table': table_name, 'ids': ids, 'data': data}
+                if changes is not None:
+                    record['data'] = fixed
+                    record['changes'] = changes
+                self._save([record])
+            timer.returned = len(ids)
+        return len(ids)
     
     def delete(self, table_name: str, where: Dict[str, Any]) -> int:
         """Delete rows from table"""
+        with self.metrics.query('delete', table_name, where=where) as timer, \
+                self._write_access():
+            with self.lock.write():
+                table = self._writable(table_name)
+                ids = table.match_ids(where, scan=timer.scan)
+                count = table.delete_rows(ids)
+            if ids:
+                self._save([{'op': 'delete', 'table': table_name, 'ids': ids}])
+            timer.returned = count
+        return count
+    
+    @contextmanager
+    def transaction(self):
+        """Make a group of writes atomic: either all of them happen or none do
+            
+            with db.transaction():
+                db.update('accounts', {'balance': 50}, {'name': 'alice'})
+                db.insert('transfers', {'from': 'alice', 'amount': 50})
+        
+        The writes are logged as one record (and synced once) when the block
+        ends, and undone if it raises. Other threads wait for the block to end,
+        and other processes don't see its writes until it commits. Tables can't
+        be created or dropped inside a transaction; nested blocks join the outer one.
+        """
+        if self.txn is not None and self.txn_owner == threading.get_ident():
+            yield
+            return
+        
+        with self._write_access():
+            with self.lock.write():
+                self.txn, self.txn_tables = [], set()
+                self.txn_owner = threading.get_ident()
+                try:
+                    yield
+                except BaseException:
+                    self._rollback()
+                    raise
+                finally:
+                    records, self.txn, self.txn_owner = self.txn, None, None
+            if records:
+                self._save([{'op': 'transaction', 'records': records}])
+    
+    def _rollback(self) -> None:
+        """Undo the current transaction by re-reading the tables it changed from disk
+        
+        Their snapshots and the log hold exactly the committed state, so they
+        are unloaded and rebuilt from there on next use. Sealed segments a
+        checkpoint hasn't dropped yet are replayed too (records are idempotent,
+        so ones a snapshot already holds are harmless).
+        """
+        self._reload(self.txn_tables)
+    
+    def _reload(self, names: Iterable[str]) -> None:
+        """Throw away the in-memory state of tables; they are rebuilt from their snapshots and the log"""
+        names = set(names)
+        for table_name in names:
+            self.tables.unload(table_name)
+            if self.cache is not None:
+                self.cache.invalidate(table_name)
+        for record in self._expand(self.wal.records()):
+            if record['table'] in names:
+                self._apply(record)
+    
+    # ============ SQL ============
+    
+    def explain(self, table_name: str, where: Optional[Dict] = None,
+                limit: Optional[int] = None, order_by: Optional[str] = None,
+                desc: bool = False) -> Dict:
+        """Show how select() would find its rows: access path, estimated rows and cost"""
+        self._sync()
+        with self.lock.read():
+            plan = self._require(table_name).plan(where, order_by, desc, limit)
+        plan.pop('ids', None)
+        return plan
+    
+    def execute(self, sql: str) -> Any:
+        """Run one SQL statement
+        
+        Returns the rows for SELECT, the plan for EXPLAIN, the new row IDs for
+        INSERT and the number of rows changed for UPDATE and DELETE. Literals
+        are converted to the types of the columns they are compared with.
+        """
+        statement = parse(sql)
+        table_name = statement['table']
+        self._sync()
+        with self.lock.read():
+            columns = self._require(table_name).columns
+        
+        def check(names: Iterable[str], allow_id: bool = True) -> None:
+            for col in names:
+                if col not in columns and not (allow_id and col == '_id'):
+                    raise ValueError(f"Column '{col}' does not exist in table '{table_name}'")
+        
+        where = statement.get('where')
+        if where:
+            check(where)
+            where = coerce_where(where, columns)
+        
+        kind = statement['type']
+        if kind == 'select':
+            check(statement['columns'] or ())
+            if statement['order_by'] is not None:
+                check([statement['order_by']])
+            args = (table_name, where, statement['limit'], statement['order_by'],
+                    statement['desc'])
+            if statement['explain']:
+                return self.explain(*args)
+            rows = self.select(*args)
+            if statement['columns']:
+                rows = [{col: row.get(col) for col in statement['columns']} for row in rows]
+            return rows
+        
+        if kind == 'insert':
+            names = statement['columns'] or list(columns)
+            check(names, allow_id=False)
+            rows = []
+            for values in statement['rows']:
+                if len(values) != len(names):
+                    raise ValueError(f"Expected {len(names)} values but got {len(values)}")
+                rows.append({col: coerce(value, columns[col]) for col, value in zip(names, values)})
+            if len(rows) == 1:
+                return [self.insert(table_name, rows[0])]
+            return self.insert_many(table_name, rows)
+        
+        if kind == 'update':
+            check(statement['data'], allow_id=False)
+            data = {}
+            for col, value in statement['data'].items():
+                if isinstance(value, Expression):
+                    check(value.columns)
+                    data[col] = lambda row, compute=value, col_type=columns[col]: \
+                        coerce(compute(row), col_type)
+                else:
+                    data[col] = coerce(value, columns[col])
+            return self.update(table_name, data, where)
+        
+        return self.delete(table_name, where)
+    
+    # ============ PERSISTENCE ============
+    
+    def _require(self, table_name: str) -> Tbl:
+        """The table, or a ValueError if there is no such table"""
         if table_name not in self.tables:
             raise ValueError(f"Table '{table_name}' does not exist")
+        return self.tables[table_name]
+    
+    def _writable(self, table_name: str) -> Tbl:
+        """The table about to be written to (noted, for rollback, inside a transaction)"""
+        table = self._require(table_name)
+        if self.txn is not None:
+            self.txn_tables.add(table_name)
+        return table
+    
+    def _outside_transaction(self, action: str) -> None:
+        if self.txn is not None:
+            raise ValueError(f"Can't {action} inside a transaction")
+    
+    @staticmethod
+    def _expand(records: Iterable[Dict]) -> Iterator[Dict]:
+        """Row-level records, with committed transactions unpacked into theirs"""
+        for record in records:
+            if record['op'] == 'transaction':
+                yield from record['records']
+            else:
+                yield record
+    
+    @contextmanager
+    def _write_access(self, catch_up: bool = True):
+        """Become the only writer: in this process, and in every process sharing the database
         
-        count = self.tables[table_name].delete(where)
-        self._save()
-        return count
+        Another process may have written since we last looked, so catch up first.
+        The log is synced after the writer lock is released: writers queued
+        behind us append meanwhile, and the next fsync covers them all.
+        """
+        with self.writer:
+            if self.dirlock is None or self.dirlock.mode == 'exclusive':
+                yield
+            else:
+                with self.dirlock.exclusive():
+                    if catch_up:
+                        self._catch_up()
+                    yield
+            position = self.wal.written
+        if self.wal.sync and self.wal.synced < position:
+            with self.metrics.timer('log.sync'):
+                self.wal.sync_to(position)
     
-    # ============ PERSISTENCE ============
+    def _sync(self) -> None:
+        """Pick up what other processes wrote since we last looked (cheap when nothing changed)"""
+        if self.dirlock is None:
+            return
+        if self.dirlock.generation() == self.generation and self.wal.size() == self.wal_offset:
+            return
+        with self.writer:
+            if self.dirlock.mode is not None:
+                return
+            with self.dirlock.shared():
+                self._catch_up()
+    
+    def _catch_up(self) -> None:
+        """Apply other processes' log records (call with the directory lock held)"""
+        with self.lock.write():
+            generation = self.dirlock.generation()
+            if generation != self.generation:
+                # Someone checkpointed: everything up to it is in the snapshots now
+                metadata = self._read_metadata()
+                self.created = metadata.get('created', self.created)
+                self.tables.refresh(metadata.get('tables', {}))
+                if self.cache is not None:
+                    self.cache.clear()
+                self.generation = generation
+                self.wal_offset = 0
+                # The log we have open was sealed away; appends go to the new one
+                self.wal.close()
+            
+            records, self.wal_offset = self.wal.read_from(self.wal_offset)
+            for record in self._expand(records):
+                self._apply(record)
+                if record['table'] in self.tables:
+                    self.tables.dirty.add(record['table'])
+                if self.cache is not None:
+                    self.cache.invalidate(record['table'])
     
-    def _save(self) -> None:
-        """Save database to disk"""
-        db_file = os.path.join(self.db_path, 'database.pkl')
+    def _save(self, records: List[Dict], encoded: Optional[bytes] = None) -> None:
+        """Append row-level operations to the write-ahead log (synced by _write_access)
+        
+        The tables have already been changed. If the records can't be logged
+        (encoded, if given, is them already encoded) those tables are rebuilt
+        from disk and the error raised, so no unlogged change outlives the call.
+        """
+        names = {record['table'] for record in self._expand(records)}
+        for table_name in names:
+            self.tables.dirty.add(table_name)
+            if self.cache is not None:
+                self.cache.invalidate(table_name)
+        if self.txn is not None:
+            # Logged when the transaction commits (and rolled back if that fails)
+            self.txn.extend(records)
+            return
         try:
-            with open(db_file, 'wb') as f:
-                pickle.dump(self.tables, f)
-        except Exception as e:
-            print(f"Error saving database: {e}")
+            with self.metrics.timer('log.append') as timer:
+                written = timer.written = self.wal.append(
+                    encode(records) if encoded is None else encoded)
+        except Exception:
+            with self.lock.write():
+                self._reload(names)
+            raise
+        # Our own records don't need to be picked up again
+        self.wal_offset += written
+        
+        if self.wal.size() >= self.checkpoint_size:
+            if self.checkpointer is not None:
+                self.checkpointer.wake()
+            elif self.checkpoint_lock.acquire(blocking=False):
+                # (Skipped if another thread is already checkpointing)
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    # The write itself is logged; the next checkpoint tries again
+                    print(f"Error checkpointing database: {e}")
+                finally:
+                    self.checkpoint_lock.release()
+    
+    def checkpoint(self) -> None:
+        """Write fresh snapshots of the tables changed since the last checkpoint and drop the log they replace
+        
+        The log is sealed first and new writes go to a fresh segment. Each table
+        is then copied with writers held off and written to its binary table
+        file (tables/<name>.tbl, see tablefile.py) without them, so writers
+        wait at most for one table to be copied in memory. If a snapshot can't
+        be written the error is raised; the log is kept, so nothing is lost.
+        """
+        with self.checkpoint_lock, self.metrics.timer('checkpoint'):
+            # Other processes must not write while the log is switched over
+            with self._write_access() if self.dirlock is not None else nullcontext():
+                self._checkpoint()
+    
+    def _checkpoint(self) -> None:
+        with self._write_access():
+            self._outside_transaction("checkpoint")
+            names = self.tables.needs_checkpoint()
+            segment = self.wal.rotate()
+            self.wal_offset = 0
+        
+        frozen = {}
+        try:
+            for table_name in names:
+                with self._write_access():
+                    if table_name not in self.tables:
+                        continue
+                    frozen[table_name] = self.tables.freeze(table_name)
+                self.tables.write(table_name, frozen[table_name])
+            with self._write_access():
+                metadata = self._metadata()
+            self._write_metadata(metadata)
+        except Exception:
+            # The sealed log stays until a later checkpoint gets these tables written
+            with self._write_access():
+                self.tables.dirty.update(name for name in frozen if name in self.tables)
+            raise
+        
+        with self._write_access():
+            for table_name, table in frozen.items():
+                self.tables.after_write(table_name, table)
+            self.wal.drop_segments(segment)
+            if self.dirlock is not None:
+                self.generation = self.dirlock.bump()
+    
+    def close(self) -> None:
+        """Checkpoint and release the log and data files"""
+        if self.checkpointer is not None:
+            self.checkpointer.stop()
+            self.checkpointer = None
+            atexit.unregister(self.close)
+        try:
+            self.checkpoint()
+        finally:
+            # Nothing is lost if the checkpoint failed: the log is replayed on next open
+            with self._write_access():
+                with self.lock.write():
+                    self.tables.close()
+                self.wal.close()
+            if self.dirlock is not None:
+                self.dirlock.close()
     
     def _load(self) -> None:
-        """Load database from disk"""
-        db_file = os.path.join(self.db_path, 'database.pkl')
-        if os.path.exists(db_file):
+        """Load the catalog from metadata, then sort the log into per-table queues"""
+        metadata_file = os.path.join(self.db_path, 'metadata.json')
+        if os.path.exists(metadata_file):
+            try:
+                metadata = self._read_metadata()
+                self.created = metadata.get('created')
+                self.tables = TableCatalog(self.tables.directory, metadata.get('tables', {}),
+                                           self.buffer_pool, self.metrics, self.tables.compress,
+                                           self.parallel)
+            except Exception as e:
+                print(f"Error loading database: {e}")
+        
+        # Databases written before per-table files keep everything in one pickle
+        legacy_file = os.path.join(self.db_path, 'database.pkl')
+        if os.path.exists(legacy_file):
             try:
-                with open(db_file, 'rb') as f:
-                    self.tables = pickle.load(f)
+                with open(legacy_file, 'rb') as f:
+                    for table in pickle.load(f).values():
+                        self.tables.add(table)
             except Exception as e:
                 print(f"Error loading database: {e}")
-                self.tables = {}
+        
+        # Re-apply everything written since the last snapshot; row changes wait
+        # until their table is actually used
+        for record in self.wal.replay():
+            self._apply(record)
+        
+        if os.path.exists(legacy_file):
+            self.checkpoint()
+            os.remove(legacy_file)
+        elif not os.path.exists(metadata_file):
+            self._save_metadata()
+    
+    def _apply(self, record: Dict) -> None:
+        """Replay one log record (records are idempotent, so replaying twice is harmless)"""
+        op = record['op']
+        if op == 'transaction':
+            for inner in record['records']:
+                self._apply(inner)
+            return
+        table_name = record['table']
+        
+        if op == 'create_table':
+            # The log holds this table's whole history, so any older snapshot is stale
+            self.tables.remove(table_name)
+            self.tables.add(Tbl(table_name, record['columns'], record.get('storage', 'row')),
+                            fresh=True)
+        elif op == 'drop_table':
+            self.tables.remove(table_name)
+        elif table_name in self.tables:
+            self.tables.defer(table_name, record)
+    
+    def _read_metadata(self) -> Dict:
+        metadata_file = os.path.join(self.db_path, 'metadata.json')
+        if not os.path.exists(metadata_file):
+            return {}
+        with open(metadata_file, 'r') as f:
+            return json.load(f)
     
     def _save_metadata(self) -> None:
         """Save database metadata as JSON for easy inspection"""
+        self._write_metadata(self._metadata())
+    
+    def _metadata(self) -> Dict:
+        if self.created is None:
+            self.created = datetime.now().isoformat()
         metadata = {
             'database_name': self.db_name,
-            'created': datetime.now().isoformat(),
+            'created': self.created,
             'tables': {}
         }
         
-        for table_name, table in self.tables.items():
-            metadata['tables'][table_name] = {
-                'columns': table.columns,
-                'row_count': table.count()
-            }
-        
+        for table_name in self.tables:
+            metadata['tables'][table_name] = self.tables.describe(table_name)
+        return metadata
+    
+    def _write_metadata(self, metadata: Dict) -> None:
         metadata_file = os.path.join(self.db_path, 'metadata.json')
-        with open(metadata_file, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        with self.metrics.timer('metadata.write') as timer:
+            with atomic_open(metadata_file, 'w') as f:
+                json.dump(metadata, f, indent=2)
+                timer.written = f.tell()
     
     # ============ UTILITY ============
     
-    def export_table(self, table_name: str, filename: str) -> None:
-        """Export table to JSON file"""
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
+    def export_table(self, table_name: str, filename: str, format: Optional[str] = None) -> None:
+        """Export table to a JSON array or NDJSON file, streaming one row at a time
         
-        data = self.select(table_name)
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
-        print(f"✓ Exported {len(data)} rows to '{filename}'")
+        format is 'json' or 'ndjson'; by default it follows the file extension.
+        """
+        fmt = format or guess_format(filename)
+        self._sync()
+        with self.lock.read():
+            table = self._require(table_name)
+            rows = list(table.rows.values()) if self.threadsafe else table.rows.values()
+        with self.metrics.timer('export') as timer, open(filename, 'w') as f:
+            count = timer.returned = write_rows(f, rows, fmt)
+            timer.written = f.tell()
+        print(f"✓ Exported {count} rows to '{filename}'")
     
-    def import_table(self, table_name: str, filename: str) -> None:
-        """Import data from JSON file"""
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
+    def import_table(self, table_name: str, filename: str, batch_size: int = 10000,
+                     format: Optional[str] = None) -> None:
+        """Import data from a JSON array or NDJSON file, batch_size rows at a time
         
-        with open(filename, 'r') as f:
-            data = json.load(f)
+        The file is streamed, so memory use depends on batch_size, not file size.
+        format is 'json' or 'ndjson'; by default it is detected from the contents.
+        """
+        self._require(table_name)
         
-        count = 0
-        for row in data:
-            # Remove _id if present
-            row.pop('_id', None)
-            self.insert(table_name, row)
-            count += 1
+        def without_ids(rows):
+            for row in rows:
+                # Remove _id if present
+                row.pop('_id', None)
+                yield row
         
+        with open(filename, 'r') as f:
+            count = len(self.insert_many(table_name, without_ids(iter_rows(f, format)),
+                                         batch_size=batch_size))
         print(f"✓ Imported {count} rows into '{table_name}'")
     
+    def get_stats(self, reset: bool = False) -> Dict:
+        """Call counts, latency percentiles, rows scanned and returned and bytes written per operation
+        
+        Only collected with PyDBMS(metrics=True); reset=True starts the counts afresh.
+        Public calls are named after their method, internal steps are named
+        'log.append', 'log.sync', 'snapshot.write', 'metadata.write' and 'table.load'.
+        """
+        return self.metrics.snapshot(reset)
+    
     def get_database_info(self) -> Dict:
         """Get complete database information"""
+        self._sync()
+        with self.lock.read():
+            return self._database_info()
+    
+    def _database_info(self) -> Dict:
         return {
             'name': self.db_name,
             'path': self.db_path,
             'tables': list(self.tables.keys()),
             'total_tables': len(self.tables),
-            'total_rows': sum(table.count() for table in self.tables.values())
+            'total_rows': sum(self.tables.describe(name).get('row_count', 0)
+                              for name in self.tables),
+            'buffer_pool': self.buffer_pool.stats(),
+            'query_cache': self.cache.stats() if self.cache else None,
+            'checkpointer': self.checkpointer.stats() if self.checkpointer else None
         }
 
 # ============ MAIN ENTRY POINT ============
 
 if __name__ == '__main__':
-    cli = DBMSCLI()
-    cli.run()
\ No newline at end of file
+    import sys
+    
+    if sys.argv[1:2] == ['serve']:
+        # Imported here because server.py imports PyDBMS from this module
+        from server import main
+        main(sys.argv[2:])
+    else:
+        # Imported here because interactive.py imports PyDBMS from this module
+        from interactive import DBMSCLI
+        
+        cli = DBMSCLI()
+        cli.run()
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""
+WHERE clause handling for PyDBMS
+
+A WHERE clause is a dict of column -> condition. A plain value means equality,
+a dict maps operators to operands, e.g.
+    {'name': 'Laptop'}
+    {'price': {'>=': 10, '<': 50}}
+    {'price': {'between': (10, 50)}, 'status': {'in': ['new', 'paid']}}
+All conditions must hold for a row to match.
+"""
+
+import operator
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from storage import MISSING
+
+OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda value, options: value in options,
+}
+
+RANGE_OPERATORS = ('<', '<=', '>', '>=')
+
+
+def conditions(cond: Any) -> List[Tuple[str, Any]]:
+    """Split one column's condition into (operator, operand) pairs"""
+    if not isinstance(cond, dict):
+        return [('=', cond)]
+
+    pairs = []
+    for op, operand in cond.items():
+        op = op.lower()
+        if op == 'between':
+            low, high = operand
+            pairs.append(('>=', low))
+            pairs.append(('<=', high))
+        elif op == 'in':
+            pairs.append(('in', tuple(operand)))
+        elif op in OPERATORS:
+            pairs.append((op, operand))
+        else:
+            raise ValueError(f"Unknown operator '{op}'")
+    return pairs
+
+
+def compile_where(where: Optional[Dict],
+                  layout: Optional[Dict[str, int]] = None) -> Callable[[Any], bool]:
+    """Turn a WHERE dict into a row -> bool test
+
+    With a layout (column -> position) the test takes a stored row tuple
+    instead of a dict, MISSING in it counting as no value.
+    """
+    if not where:
+        return lambda row: True
+
+    tests = []
+    for col, cond in where.items():
+        for op, operand in conditions(cond):
+            check = (OPERATORS[op], operand, op in RANGE_OPERATORS)
+            if layout is None:
+                tests.append((col,) + check)
+            elif col in layout:
+                tests.append((layout[col],) + check)
+            elif not _holds(None, *check):
+                # A column the rows don't have is None in every one of them
+                return lambda row: False
+
+    if layout is None:
+        def test(row: Dict) -> bool:
+            for col, compare, operand, ordered in tests:
+                value = row.get(col)
+                if ordered:
+                    # Missing values and values of another type never satisfy a comparison
+                    if value is None:
+                        return False
+                    try:
+                        if not compare(value, operand):
+                            return False
+                    except TypeError:
+                        return False
+                elif not compare(value, operand):
+                    return False
+            return True
+    else:
+        missing = MISSING
+
+        def test(row: Tuple) -> bool:
+            for pos, compare, operand, ordered in tests:
+                value = row[pos]
+                if ordered:
+                    if value is None or value is missing:
+                        return False
+                    try:
+                        if not compare(value, operand):
+                            return False
+                    except TypeError:
+                        return False
+                elif not compare(None if value is missing else value, operand):
+                    return False
+            return True
+
+    return test
+
+
+def _holds(value: Any, compare: Callable, operand: Any, ordered: bool) -> bool:
+    """Whether one value satisfies one (operator, operand) pair"""
+    if ordered:
+        if value is None:
+            return False
+        try:
+            return compare(value, operand)
+        except TypeError:
+            return False
+    return compare(value, operand)
+
+
+def bounds(pairs: List[Tuple[str, Any]]) -> Tuple[Any, bool, Any, bool]:
+    """Collapse range pairs into (low, low_inclusive, high, high_inclusive), None meaning open"""
+    low, low_inc, high, high_inc = None, True, None, True
+    for op, operand in pairs:
+        if op == '=':
+            op_low = op_high = True
+        else:
+            op_low = op in ('>', '>=')
+            op_high = op in ('<', '<=')
+        inclusive = op in ('=', '<=', '>=')
+        if op_low and (low is None or operand > low or (operand == low and not inclusive)):
+            low, low_inc = operand, inclusive
+        if op_high and (high is None or operand < high or (operand == high and not inclusive)):
+            high, high_inc = operand, inclusive
+    return low, low_inc, high, high_inc
+
+
+def sort_key(column: str, layout: Optional[Dict[str, int]] = None) -> Callable[[Any], Tuple]:
+    """Sort key for ORDER BY that puts missing values last (on row tuples, given a layout)"""
+    if layout is not None:
+        pos = layout.get(column)
+
+        def key(row: Tuple) -> Tuple:
+            value = None if pos is None else row[pos]
+            return (True, 0) if value is None or value is MISSING else (False, value)
+        return key
+
+    def key(row: Dict) -> Tuple:
+        value = row.get(column)
+        return (True, 0) if value is None else (False, value)
+    return key
+
+
+# ============ LITERALS ============
+
+TRUE_WORDS = ('true', '1', 'yes')
+FALSE_WORDS = ('false', '0', 'no')
+
+
+def coerce(value: Any, col_type: str) -> Any:
+    """Convert a literal (often typed in as text) to a column's type; None stays None"""
+    if value is None:
+        return None
+    try:
+        if col_type == 'int':
+            if isinstance(value, float) and not value.is_integer():
+                raise ValueError
+            return int(value)
+        if col_type == 'float':
+            return float(value)
+        if col_type == 'bool':
+            if isinstance(value, str):
+                word = value.strip().lower()
+                if word not in TRUE_WORDS + FALSE_WORDS:
+                    raise ValueError
+                return word in TRUE_WORDS
+            return bool(value)
+        return value if isinstance(value, str) else str(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid value {value!r} for type {col_type}")
+
+
+def coerce_where(where: Optional[Dict], columns: Dict[str, str]) -> Optional[Dict]:
+    """Copy of a WHERE dict with every operand converted to its column's type"""
+    if not where:
+        return where
+
+    coerced = {}
+    for col, cond in where.items():
+        col_type = 'int' if col == '_id' else columns.get(col)
+        if col_type is None:
+            raise ValueError(f"Column '{col}' does not exist")
+        if not isinstance(cond, dict):
+            coerced[col] = coerce(cond, col_type)
+            continue
+        coerced[col] = {}
+        for op, operand in cond.items():
+            if op.lower() in ('in', 'between'):
+                operand = [coerce(value, col_type) for value in operand]
+            else:
+                operand = coerce(operand, col_type)
+            coerced[col][op] = operand
+    return coerced
+
+
+# ============ ESTIMATES ============
+
+# Fraction of rows a condition is assumed to keep when no index can tell
+SELECTIVITY = {'=': 0.1, '!=': 0.9, '<': 1 / 3, '<=': 1 / 3, '>': 1 / 3, '>=': 1 / 3}
+
+
+def selectivity(pairs: List[Tuple[str, Any]]) -> float:
+    """Guess the fraction of rows that satisfy all the pairs"""
+    fraction = 1.0
+    for op, operand in pairs:
+        if op == 'in':
+            fraction *= min(1.0, SELECTIVITY['='] * len(operand))
+        else:
+            fraction *= SELECTIVITY[op]
+    return fraction
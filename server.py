@@ -0,0 +1,197 @@
+"""
+Network server for PyDBMS
+
+    python pydbms.py serve [database] [--host HOST] [--port PORT] [--unix PATH]
+
+Serves one database over TCP (or a Unix socket) with asyncio, speaking the
+framed protocol in protocol.py. Requests run on a thread pool against a
+threadsafe PyDBMS, so a slow query on one connection doesn't hold up the
+others. Each connection's requests are answered in order, and a connection
+keeps reading new requests while earlier ones run.
+
+iter_select and join open a server-side cursor; the client pulls its rows
+with 'fetch' and the cursor is dropped when it runs out, on 'close_cursor',
+or when the connection closes. There is no authentication, so only listen
+on addresses you trust (the default is localhost).
+"""
+
+import argparse
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from typing import Any, Dict, List, Optional
+
+from cursor import Cursor
+from protocol import DEFAULT_PORT, HEADER, decode, encode, frame_size
+
+# PyDBMS methods a client may call; file import/export and close stay server-side
+OPERATIONS = {
+    'create_table', 'drop_table', 'list_tables', 'describe', 'create_index', 'drop_index',
+    'insert', 'insert_many', 'select', 'update', 'delete', 'aggregate', 'explain',
+    'execute', 'get_database_info', 'get_stats', 'checkpoint'
+}
+# Methods that return a Cursor, kept on the server and read with 'fetch'
+CURSOR_OPERATIONS = {'iter_select', 'join'}
+# Requests read ahead of the one running, per connection
+PIPELINE_DEPTH = 128
+
+
+class Session:
+    """Per-connection state: the open cursors"""
+
+    def __init__(self):
+        self.cursors: Dict[int, Cursor] = {}
+        self.ids = count(1)
+
+    def close(self) -> None:
+        for cursor in self.cursors.values():
+            cursor.close()
+        self.cursors.clear()
+
+
+class Server:
+    """Answers protocol requests against one PyDBMS"""
+
+    def __init__(self, db, workers: int = 8):
+        self.db = db
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='pydbms')
+
+    def call(self, session: Session, request: Dict[str, Any]) -> Any:
+        """Run one request (on a worker thread) and return its result"""
+        op = request.get('op')
+        args = request.get('args') or []
+        kwargs = request.get('kwargs') or {}
+
+        if op in OPERATIONS:
+            return getattr(self.db, op)(*args, **kwargs)
+        if op in CURSOR_OPERATIONS:
+            cursor_id = next(session.ids)
+            session.cursors[cursor_id] = getattr(self.db, op)(*args, **kwargs)
+            return cursor_id
+        if op == 'fetch':
+            cursor_id, size = args
+            cursor = session.cursors.get(cursor_id)
+            if cursor is None:
+                raise ValueError(f"Cursor {cursor_id} is not open")
+            rows = cursor.fetchmany(size)
+            if len(rows) < size:
+                del session.cursors[cursor_id]
+            return rows
+        if op == 'close_cursor':
+            cursor = session.cursors.pop(args[0], None)
+            if cursor is not None:
+                cursor.close()
+            return None
+        if op == 'ping':
+            return 'pong'
+        raise ValueError(f"Unknown operation '{op}'")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve one connection until the client hangs up"""
+        session = Session()
+        queue: asyncio.Queue = asyncio.Queue(PIPELINE_DEPTH)
+        responder = asyncio.ensure_future(self._respond(session, queue, writer))
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                payload = await reader.readexactly(frame_size(header))
+                await queue.put(decode(payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as e:
+            # Oversized or garbled frame: the stream can't be trusted any more
+            print(f"Dropping connection: {e}")
+        finally:
+            await queue.put(None)
+            await responder
+            writer.close()
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, session.close)
+
+    def _run(self, session: Session, requests: List[Dict[str, Any]]) -> List[bytes]:
+        """Answer a batch of requests (on a worker thread), in order, as response frames"""
+        frames = []
+        for request in requests:
+            response = {'id': request.get('id')}
+            try:
+                response['result'] = self.call(session, request)
+                response['ok'] = True
+            except Exception as e:
+                response.update(ok=False, error=type(e).__name__, message=str(e))
+            try:
+                frames.append(encode(response, lenient=True))
+            except ValueError as e:
+                frames.append(encode({'id': response['id'], 'ok': False,
+                                      'error': 'ValueError', 'message': str(e)}))
+        return frames
+
+    async def _respond(self, session: Session, queue: asyncio.Queue,
+                       writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Pipelined requests that have already arrived go to a worker together
+            requests = [await queue.get()]
+            while not queue.empty() and requests[-1] is not None:
+                requests.append(queue.get_nowait())
+            last = requests[-1] is None
+            if last:
+                requests.pop()
+            if requests:
+                frames = await loop.run_in_executor(self.executor, self._run, session, requests)
+                writer.write(b''.join(frames))
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+            if last:
+                return
+
+    async def serve(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT,
+                    path: Optional[str] = None) -> None:
+        """Accept connections until cancelled"""
+        if path:
+            if os.path.exists(path):
+                os.remove(path)
+            server = await asyncio.start_unix_server(self.handle, path)
+            where = path
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            where = ', '.join(f"{sock.getsockname()[0]}:{sock.getsockname()[1]}"
+                              for sock in server.sockets)
+        print(f"✓ Serving database '{self.db.db_name}' on {where}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+def main(argv=None) -> None:
+    """Entry point of `python pydbms.py serve`"""
+    # Imported here because pydbms.py imports this module to dispatch to main
+    from pydbms import PyDBMS
+
+    parser = argparse.ArgumentParser(prog='pydbms.py serve',
+                                     description='Serve a PyDBMS database over the network')
+    parser.add_argument('database', nargs='?', default='default')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, default=8, help='threads running requests')
+    parser.add_argument('--metrics', action='store_true', help='time every operation (get_stats)')
+    parser.add_argument('--slow-query-log', metavar='FILE', help='log calls slower than --slow-query-ms')
+    parser.add_argument('--slow-query-ms', type=float, default=100.0)
+    args = parser.parse_args(argv)
+
+    # Background checkpoints keep snapshot writing off the request path
+    db = PyDBMS(args.database, threadsafe=True, checkpoint_interval=5.0, metrics=args.metrics,
+                slow_query_log=args.slow_query_log, slow_query_ms=args.slow_query_ms)
+    server = Server(db, args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print("\nShutting down")
+    finally:
+        server.close()
+        db.close()
@@ -0,0 +1,291 @@
+"""
+SQL front-end for PyDBMS
+
+Parses a small SQL dialect into statement dicts that map straight onto the
+PyDBMS API:
+    SELECT * | col, ... FROM t [WHERE ...] [ORDER BY col [ASC|DESC]] [LIMIT n]
+    INSERT INTO t [(col, ...)] VALUES (v, ...)[, (v, ...) ...]
+    UPDATE t SET col = expr[, ...] [WHERE ...]
+    DELETE FROM t [WHERE ...]
+    EXPLAIN SELECT ...
+WHERE takes conditions joined by AND: col op value (op is =, !=, <>, <, <=,
+>, >=), col IN (v, ...), col BETWEEN a AND b and col IS [NOT] NULL.
+Values are numbers, 'quoted strings', TRUE, FALSE or NULL. A SET expression is
+a value, a column, or two of those joined by +, -, * or / (SET stock = stock - 1);
+it is computed per row, and is NULL where either side is.
+"""
+
+import operator
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+      | '(?P<string>(?:[^']|'')*)'
+      | "(?P<quoted>(?:[^"]|"")*)"
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<symbol><=|>=|!=|<>|[=<>(),*;+\-/])
+    )""", re.VERBOSE)
+
+KEYWORDS = {
+    'select', 'from', 'where', 'and', 'or', 'order', 'by', 'asc', 'desc', 'limit',
+    'insert', 'into', 'values', 'update', 'set', 'delete', 'explain',
+    'in', 'between', 'is', 'not', 'null', 'true', 'false'
+}
+
+COMPARISONS = {'=': '=', '!=': '!=', '<>': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+ARITHMETIC = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv}
+
+
+def tokenize(text: str) -> List[Tuple[str, Any]]:
+    """Split SQL text into (kind, value) tokens; kind is keyword, name, value or symbol"""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"Unexpected character {text[pos:].strip()[:1]!r} at position {pos}")
+        pos = match.end()
+        if match.group('number') is not None:
+            number = match.group('number')
+            value = float(number) if any(c in number for c in '.eE') else int(number)
+            tokens.append(('value', value))
+        elif match.group('string') is not None:
+            tokens.append(('value', match.group('string').replace("''", "'")))
+        elif match.group('quoted') is not None:
+            tokens.append(('name', match.group('quoted').replace('""', '"')))
+        elif match.group('name') is not None:
+            word = match.group('name')
+            if word.lower() in KEYWORDS:
+                tokens.append(('keyword', word.lower()))
+            else:
+                tokens.append(('name', word))
+        elif match.group('symbol') is not None:
+            tokens.append(('symbol', match.group('symbol')))
+    return tokens
+
+
+class Expression:
+    """A SET expression, callable on a row to compute the column's new value
+
+    Each side is a ('name', column) or ('value', literal) token.
+    """
+
+    def __init__(self, left: Tuple[str, Any], op: Optional[str] = None,
+                 right: Optional[Tuple[str, Any]] = None):
+        self.left = left
+        self.op = op
+        self.right = right
+
+    @property
+    def columns(self) -> List[str]:
+        """Columns the expression reads"""
+        return [value for kind, value in (self.left, self.right or ('value', None))
+                if kind == 'name']
+
+    def __call__(self, row: Dict[str, Any]) -> Any:
+        left = row.get(self.left[1]) if self.left[0] == 'name' else self.left[1]
+        if self.op is None:
+            return left
+        right = row.get(self.right[1]) if self.right[0] == 'name' else self.right[1]
+        if left is None or right is None:
+            return None
+        try:
+            return ARITHMETIC[self.op](left, right)
+        except (TypeError, ZeroDivisionError) as e:
+            raise ValueError(f"Can't compute {self} for row {row.get('_id')}: {e}")
+
+    def __repr__(self) -> str:
+        sides = [self.left] if self.op is None else [self.left, self.op, self.right]
+        return ' '.join(side if isinstance(side, str) else
+                        side[1] if side[0] == 'name' else repr(side[1]) for side in sides)
+
+
+class Parser:
+    """Recursive-descent parser over the token list of one statement"""
+
+    def __init__(self, text: str):
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    # ---- token helpers ----
+
+    def peek(self) -> Tuple[Optional[str], Any]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def accept(self, kind: str, value: Any = None) -> bool:
+        """Consume the next token if it matches"""
+        tok_kind, tok_value = self.peek()
+        if tok_kind == kind and (value is None or tok_value == value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, kind: str, value: Any = None) -> Any:
+        """Consume the next token, which must match, and return its value"""
+        tok_kind, tok_value = self.peek()
+        if tok_kind != kind or (value is not None and tok_value != value):
+            wanted = value.upper() if kind == 'keyword' else (value or kind)
+            found = 'end of statement' if tok_kind is None else repr(tok_value)
+            raise ValueError(f"Expected {wanted} but found {found}")
+        self.pos += 1
+        return tok_value
+
+    def name(self) -> str:
+        return self.expect('name')
+
+    def literal(self) -> Any:
+        if self.accept('keyword', 'null'):
+            return None
+        if self.accept('keyword', 'true'):
+            return True
+        if self.accept('keyword', 'false'):
+            return False
+        return self.expect('value')
+
+    def literal_list(self) -> List[Any]:
+        self.expect('symbol', '(')
+        values = [self.literal()]
+        while self.accept('symbol', ','):
+            values.append(self.literal())
+        self.expect('symbol', ')')
+        return values
+
+    # ---- statements ----
+
+    def parse(self) -> Dict:
+        """Parse the whole text as one statement"""
+        explain = self.accept('keyword', 'explain')
+        kind, word = self.peek()
+        if kind != 'keyword' or word not in ('select', 'insert', 'update', 'delete'):
+            raise ValueError("Expected SELECT, INSERT, UPDATE or DELETE")
+        if explain and word != 'select':
+            raise ValueError("EXPLAIN only supports SELECT")
+
+        statement = getattr(self, word)()
+        self.accept('symbol', ';')
+        if self.peek()[0] is not None:
+            raise ValueError(f"Unexpected {self.peek()[1]!r} after end of statement")
+        statement['explain'] = explain
+        return statement
+
+    def select(self) -> Dict:
+        self.expect('keyword', 'select')
+        columns = None
+        if not self.accept('symbol', '*'):
+            columns = [self.name()]
+            while self.accept('symbol', ','):
+                columns.append(self.name())
+        self.expect('keyword', 'from')
+        statement = {'type': 'select', 'table': self.name(), 'columns': columns,
+                     'where': self.where(), 'order_by': None, 'desc': False, 'limit': None}
+
+        if self.accept('keyword', 'order'):
+            self.expect('keyword', 'by')
+            statement['order_by'] = self.name()
+            if self.accept('keyword', 'desc'):
+                statement['desc'] = True
+            else:
+                self.accept('keyword', 'asc')
+        if self.accept('keyword', 'limit'):
+            limit = self.expect('value')
+            if not isinstance(limit, int) or limit < 0:
+                raise ValueError("LIMIT must be a non-negative integer")
+            statement['limit'] = limit
+        return statement
+
+    def insert(self) -> Dict:
+        self.expect('keyword', 'insert')
+        self.expect('keyword', 'into')
+        table = self.name()
+        columns = None
+        if self.accept('symbol', '('):
+            columns = [self.name()]
+            while self.accept('symbol', ','):
+                columns.append(self.name())
+            self.expect('symbol', ')')
+        self.expect('keyword', 'values')
+        rows = [self.literal_list()]
+        while self.accept('symbol', ','):
+            rows.append(self.literal_list())
+        return {'type': 'insert', 'table': table, 'columns': columns, 'rows': rows}
+
+    def update(self) -> Dict:
+        self.expect('keyword', 'update')
+        table = self.name()
+        self.expect('keyword', 'set')
+        data = {}
+        while True:
+            col = self.name()
+            self.expect('symbol', '=')
+            data[col] = self.expression()
+            if not self.accept('symbol', ','):
+                break
+        return {'type': 'update', 'table': table, 'data': data, 'where': self.where()}
+
+    def expression(self) -> Any:
+        """A SET value: a literal as is, anything reading a column as an Expression"""
+        left = self.operand()
+        kind, value = self.peek()
+        if kind == 'symbol' and value in ARITHMETIC:
+            self.pos += 1
+            return Expression(left, value, self.operand())
+        if kind == 'value' and isinstance(value, (int, float)) and value < 0:
+            # "stock-1" reads as stock followed by the number -1
+            self.pos += 1
+            return Expression(left, '-', ('value', -value))
+        if left[0] == 'name':
+            return Expression(left)
+        return left[1]
+
+    def operand(self) -> Tuple[str, Any]:
+        if self.peek()[0] == 'name':
+            return 'name', self.name()
+        return 'value', self.literal()
+
+    def delete(self) -> Dict:
+        self.expect('keyword', 'delete')
+        self.expect('keyword', 'from')
+        return {'type': 'delete', 'table': self.name(), 'where': self.where()}
+
+    # ---- WHERE ----
+
+    def where(self) -> Optional[Dict]:
+        """WHERE conditions as a PyDBMS WHERE dict (None when there is no WHERE)"""
+        if not self.accept('keyword', 'where'):
+            return None
+        where: Dict[str, Dict] = {}
+        while True:
+            col, op, operand = self.condition()
+            ops = where.setdefault(col, {})
+            if op in ops:
+                raise ValueError(f"Condition '{col} {op}' appears more than once")
+            ops[op] = operand
+            if self.accept('keyword', 'or'):
+                raise ValueError("OR is not supported; conditions can only be joined with AND")
+            if not self.accept('keyword', 'and'):
+                return where
+
+    def condition(self) -> Tuple[str, str, Any]:
+        col = self.name()
+        if self.accept('keyword', 'is'):
+            negate = self.accept('keyword', 'not')
+            self.expect('keyword', 'null')
+            return col, '!=' if negate else '=', None
+        if self.accept('keyword', 'in'):
+            return col, 'in', self.literal_list()
+        if self.accept('keyword', 'between'):
+            low = self.literal()
+            self.expect('keyword', 'and')
+            return col, 'between', [low, self.literal()]
+        symbol = self.expect('symbol')
+        if symbol not in COMPARISONS:
+            raise ValueError(f"Unknown operator {symbol!r}")
+        return col, COMPARISONS[symbol], self.literal()
+
+
+def parse(text: str) -> Dict:
+    """Parse one SQL statement into a statement dict"""
+    return Parser(text).parse()
@@ -0,0 +1,730 @@
+"""
+Storage engines for Tbl
+
+A store maps row IDs to rows. Tbl only talks to it through get/put/patch/remove,
+values() and the usual len/in/[] operators, so engines can be swapped per table.
+Queries go through records(), layout and to_rows(), so they can filter rows in
+whatever form the engine keeps them and build dicts only for the results.
+"""
+
+import copy
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, compress, repeat
+from operator import add, is_
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+class _Missing:
+    """Type of MISSING, pickled by name so that it stays the one sentinel"""
+
+    __slots__ = ()
+
+    def __reduce__(self) -> str:
+        return 'MISSING'
+
+    def __repr__(self) -> str:
+        return 'MISSING'
+
+
+# Stands for a column a row has no value for at all (in stored row tuples and
+# in the value lists of dump())
+MISSING = _Missing()
+
+
+class RowStore(dict):
+    """The classic engine: one row per row ID, kept as a tuple
+
+    A row is stored as (_id, value, value, ...) in column order (see layout),
+    with MISSING for a column the row has no key for, so no column names are
+    repeated per row. Reads hand out fresh dicts; queries can work on the
+    tuples themselves through records() and layout, and build dicts only for
+    the rows they return.
+    """
+
+    kind = 'row'
+
+    def __init__(self, columns: Optional[Dict[str, str]] = None, rows: Optional[Dict] = None):
+        super().__init__()
+        self._set_layout(['_id'] + list(columns or {}))
+        for row_id, row in (rows or {}).items():
+            dict.__setitem__(self, row_id, self._record(row_id, row))
+
+    def _set_layout(self, names: List[str]) -> None:
+        self.names = names
+        # Position of each column (and _id) in a stored tuple
+        self.layout = {name: pos for pos, name in enumerate(names)}
+        # Converters written out for this layout, as namedtuple does: an
+        # unrolled tuple or dict display beats zip() and map() by a few times
+        gets = ''.join(f", data.get({name!r}, MISSING)" for name in names[1:])
+        fields = ', '.join(f"{name!r}: record[{pos}]" for pos, name in enumerate(names))
+        self._record = eval(f"lambda row_id, data: (row_id{gets},)", {'MISSING': MISSING})
+        self._build = eval(f"lambda record: {{{fields}}}")
+
+    def _row(self, record: Tuple) -> Dict:
+        row = self._build(record)
+        if MISSING in record:
+            for name in compress(self.names, map(is_, record, repeat(MISSING))):
+                del row[name]
+        return row
+
+    # ---- mapping protocol used by Tbl, in dicts ----
+
+    def __getitem__(self, row_id: int) -> Dict:
+        return self._row(dict.__getitem__(self, row_id))
+
+    def get(self, row_id: int, default: Any = None) -> Optional[Dict]:
+        record = dict.get(self, row_id)
+        return default if record is None else self._row(record)
+
+    def values(self) -> Iterator[Dict]:
+        return map(self._row, dict.values(self))
+
+    def items(self) -> Iterator[Tuple[int, Dict]]:
+        return zip(dict.keys(self), self.values())
+
+    def __reduce__(self) -> Tuple:
+        # Pickle the stored tuples, not the dicts items() hands out
+        return RowStore, (dict.fromkeys(self.names[1:]),), None, None, iter(dict.items(self))
+
+    # ---- stored tuples ----
+
+    def records(self, ids: Optional[Iterable[int]] = None) -> Iterable[Tuple]:
+        """Stored tuples of every row, or of the given IDs (skipping ones that are gone)"""
+        if ids is None:
+            return dict.values(self)
+        return filter(None, map(dict.get, repeat(self), ids))
+
+    def to_rows(self, records: Iterable[Tuple]) -> Iterator[Dict]:
+        """Dicts of stored tuples"""
+        return map(self._row, records)
+
+    def by_position(self) -> List[Tuple]:
+        """Every stored tuple in scan order, for splitting a scan by position"""
+        return list(dict.values(self))
+
+    # ---- writes ----
+
+    def put(self, row_id: int, data: Dict[str, Any]) -> Dict:
+        """Store a new row (or replace an existing one) and return it"""
+        dict.__setitem__(self, row_id, self._record(row_id, data))
+        return {'_id': row_id, **data}
+
+    def put_many(self, first_id: int, batch: List[Dict[str, Any]]) -> List[Dict]:
+        """Store rows under consecutive IDs starting at first_id"""
+        ids = range(first_id, first_id + len(batch))
+        dict.update(self, zip(ids, map(self._record, ids, batch)))
+        return [{'_id': row_id, **data} for row_id, data in zip(ids, batch)]
+
+    def patch(self, row_id: int, data: Dict[str, Any]) -> Dict:
+        """Change some columns of a row and return the updated row
+
+        The tuple is replaced, never changed, so one handed out earlier (to a
+        snapshot or a cursor) keeps showing the old version.
+        """
+        record = self._record(row_id, {**self[row_id], **data})
+        dict.__setitem__(self, row_id, record)
+        return self._row(record)
+
+    def remove(self, row_id: int) -> Optional[Dict]:
+        """Delete a row, returning it (or None if it wasn't there)"""
+        record = self.pop(row_id, None)
+        return None if record is None else self._row(record)
+
+    def copy(self) -> 'RowStore':
+        """Copy to snapshot from while this store keeps changing
+
+        Tuples can't change, so sharing them is safe.
+        """
+        clone = RowStore.__new__(RowStore)
+        clone.__dict__.update(self.__dict__)
+        dict.update(clone, self)
+        return clone
+
+    def dump(self, columns: List[str]) -> Tuple[Dict[str, Any], Dict[str, List]]:
+        """Engine state and per-column value lists (plus '_id') to write a snapshot from
+
+        A row without a key for a column gets MISSING there, so that None and
+        absent values come back the same way they went in.
+        """
+        lists = dict.fromkeys(self.names, [])
+        lists.update(zip(self.names, map(list, zip(*dict.values(self)))))
+        return {}, lists
+
+    @classmethod
+    def restore(cls, columns: Dict[str, str], state: Dict[str, Any],
+                lists: Dict[str, List]) -> 'RowStore':
+        """Rebuild a store from what dump() returned"""
+        store = cls(columns)
+        dict.update(store, zip(lists['_id'], zip(*[lists[name] for name in store.names])))
+        return store
+
+    def vacuum(self) -> None:
+        """Nothing to reclaim: deleted dicts are freed right away"""
+
+    def attach(self, path: str, pool: Any) -> None:
+        """Nothing to open: rows live in memory"""
+
+    def flush(self) -> None:
+        """Nothing to write back: rows live in memory"""
+
+    def after_checkpoint(self, snapshot: Any) -> None:
+        """Nothing to clean up once a snapshot is written"""
+
+    def close(self) -> None:
+        """Nothing to release"""
+
+    def destroy(self) -> None:
+        """Nothing on disk besides the snapshot"""
+
+
+# ============ COLUMNAR ENGINE ============
+
+# BIT_TABLES[n] maps a byte to its bit n, for Bitmap.to_flags
+BIT_TABLES = [bytes((byte >> bit) & 1 for byte in range(256)) for bit in range(8)]
+
+
+class Bitmap:
+    """Growable bit-packed array of flags"""
+
+    def __init__(self):
+        self.bits = bytearray()
+        self.size = 0
+
+    @classmethod
+    def from_flags(cls, flags: Iterable) -> 'Bitmap':
+        """Bitmap of a whole sequence of flags at once
+
+        The flags become one byte each; every eighth byte, read as a big integer,
+        is then one bit of each packed byte, so the packing runs at C speed.
+        """
+        flags = bytes(map(bool, flags))
+        size = len(flags)
+        flags += bytes(-size % 8)
+        packed = 0
+        for bit in range(8):
+            packed |= int.from_bytes(flags[bit::8], 'little') << bit
+        bitmap = cls()
+        bitmap.bits = bytearray(packed.to_bytes(len(flags) // 8, 'little'))
+        bitmap.size = size
+        return bitmap
+
+    @classmethod
+    def from_bytes(cls, bits: bytes, size: int) -> 'Bitmap':
+        bitmap = cls()
+        bitmap.bits = bytearray(bits)
+        bitmap.size = size
+        return bitmap
+
+    def to_flags(self) -> bytes:
+        """One byte (0 or 1) per position, the reverse of from_flags"""
+        flags = bytearray(len(self.bits) * 8)
+        for bit in range(8):
+            flags[bit::8] = self.bits.translate(BIT_TABLES[bit])
+        return bytes(flags[:self.size])
+
+    def append(self, flag: bool) -> None:
+        if self.size % 8 == 0:
+            self.bits.append(0)
+        self.size += 1
+        if flag:
+            self.set(self.size - 1, True)
+
+    def get(self, pos: int) -> bool:
+        return bool(self.bits[pos >> 3] & (1 << (pos & 7)))
+
+    def set(self, pos: int, flag: bool) -> None:
+        if flag:
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        else:
+            self.bits[pos >> 3] &= ~(1 << (pos & 7)) & 0xFF
+
+    def insert(self, pos: int, flag: bool) -> None:
+        flags = [self.get(i) for i in range(pos, self.size)]
+        self.truncate(pos)
+        self.append(flag)
+        for old in flags:
+            self.append(old)
+
+    def truncate(self, size: int) -> None:
+        self.size = size
+        del self.bits[(size + 7) >> 3:]
+        if size % 8:
+            self.bits[-1] &= (1 << (size % 8)) - 1
+
+
+def _kept_bits(bitmap: Bitmap, live: bytes) -> bytes:
+    """Packed bits of a bitmap at the positions flagged in live"""
+    return bytes(Bitmap.from_flags(compress(bitmap.to_flags(), live)).bits)
+
+
+class NumberColumn:
+    """int or float values in an array with a null bitmap"""
+
+    # Names of what dump() returns
+    PARTS = ('values', 'nulls')
+
+    def __init__(self, typecode: str):
+        self.values = array(typecode)
+        self.nulls = Bitmap()
+
+    def coerce(self, name: str, value: Any) -> Any:
+        if value is None:
+            return None
+        if self.values.typecode == 'q':
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError(f"Column '{name}' expects int, got {value!r}")
+            if not -2 ** 63 <= value < 2 ** 63:
+                raise ValueError(f"Value {value} is out of range for column '{name}'")
+            return value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Column '{name}' expects float, got {value!r}")
+        return float(value)
+
+    def append(self, value: Any) -> None:
+        self.values.append(0 if value is None else value)
+        self.nulls.append(value is None)
+
+    def insert(self, pos: int, value: Any) -> None:
+        self.values.insert(pos, 0 if value is None else value)
+        self.nulls.insert(pos, value is None)
+
+    def get(self, pos: int) -> Any:
+        return None if self.nulls.get(pos) else self.values[pos]
+
+    def set(self, pos: int, value: Any) -> None:
+        self.values[pos] = 0 if value is None else value
+        self.nulls.set(pos, value is None)
+
+    def compact(self, keep: array) -> None:
+        old_values, old_nulls = self.values, self.nulls
+        self.values = array(old_values.typecode, (old_values[pos] for pos in keep))
+        self.nulls = Bitmap()
+        for pos in keep:
+            self.nulls.append(old_nulls.get(pos))
+
+    def dump(self, live: Optional[bytes] = None) -> Dict[str, Any]:
+        """Parts to write a snapshot from, keeping only the positions flagged in live"""
+        if live is None:
+            return {'values': self.values, 'nulls': bytes(self.nulls.bits)}
+        return {'values': array(self.values.typecode, compress(self.values, live)),
+                'nulls': _kept_bits(self.nulls, live)}
+
+    def restore(self, parts: Dict[str, Any], size: int) -> None:
+        """Take over the parts dump() returned"""
+        self.values = array(self.values.typecode, parts['values'])
+        self.nulls = Bitmap.from_bytes(parts['nulls'], size)
+
+
+class BoolColumn:
+    """bool values packed one bit per row, plus a null bitmap"""
+
+    # Names of what dump() returns
+    PARTS = ('values', 'nulls')
+
+    def __init__(self):
+        self.values = Bitmap()
+        self.nulls = Bitmap()
+
+    def coerce(self, name: str, value: Any) -> Any:
+        if value is None or isinstance(value, bool):
+            return value
+        if isinstance(value, int) and value in (0, 1):
+            return bool(value)
+        raise ValueError(f"Column '{name}' expects bool, got {value!r}")
+
+    def append(self, value: Any) -> None:
+        self.values.append(bool(value))
+        self.nulls.append(value is None)
+
+    def insert(self, pos: int, value: Any) -> None:
+        self.values.insert(pos, bool(value))
+        self.nulls.insert(pos, value is None)
+
+    def get(self, pos: int) -> Any:
+        return None if self.nulls.get(pos) else self.values.get(pos)
+
+    def set(self, pos: int, value: Any) -> None:
+        self.values.set(pos, bool(value))
+        self.nulls.set(pos, value is None)
+
+    def compact(self, keep: array) -> None:
+        old_values, old_nulls = self.values, self.nulls
+        self.values, self.nulls = Bitmap(), Bitmap()
+        for pos in keep:
+            self.values.append(old_values.get(pos))
+            self.nulls.append(old_nulls.get(pos))
+
+    def dump(self, live: Optional[bytes] = None) -> Dict[str, Any]:
+        """Parts to write a snapshot from, keeping only the positions flagged in live"""
+        if live is None:
+            return {'values': bytes(self.values.bits), 'nulls': bytes(self.nulls.bits)}
+        return {'values': _kept_bits(self.values, live), 'nulls': _kept_bits(self.nulls, live)}
+
+    def restore(self, parts: Dict[str, Any], size: int) -> None:
+        """Take over the parts dump() returned"""
+        self.values = Bitmap.from_bytes(parts['values'], size)
+        self.nulls = Bitmap.from_bytes(parts['nulls'], size)
+
+
+class StrColumn:
+    """UTF-8 strings in one shared buffer, located by offset and length (-1 = null)"""
+
+    # Names of what dump() returns
+    PARTS = ('buffer', 'offsets', 'lengths')
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array('q')
+        self.lengths = array('i')
+
+    def coerce(self, name: str, value: Any) -> Any:
+        if value is None or isinstance(value, str):
+            return value
+        raise ValueError(f"Column '{name}' expects str, got {value!r}")
+
+    def _place(self, value: Optional[str]):
+        if value is None:
+            return 0, -1
+        encoded = value.encode('utf-8')
+        offset = len(self.buffer)
+        self.buffer += encoded
+        return offset, len(encoded)
+
+    def append(self, value: Any) -> None:
+        offset, length = self._place(value)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+
+    def insert(self, pos: int, value: Any) -> None:
+        offset, length = self._place(value)
+        self.offsets.insert(pos, offset)
+        self.lengths.insert(pos, length)
+
+    def get(self, pos: int) -> Any:
+        length = self.lengths[pos]
+        if length < 0:
+            return None
+        offset = self.offsets[pos]
+        return self.buffer[offset:offset + length].decode('utf-8')
+
+    def set(self, pos: int, value: Any) -> None:
+        # The old bytes stay in the buffer until the next vacuum
+        self.offsets[pos], self.lengths[pos] = self._place(value)
+
+    def compact(self, keep: array) -> None:
+        buffer = self.buffer
+        self.buffer = bytearray()
+        self.lengths = array('i', (self.lengths[pos] for pos in keep))
+        for pos, length in zip(keep, self.lengths):
+            offset = self.offsets[pos]
+            self.buffer += buffer[offset:offset + max(length, 0)]
+        self.offsets = self._packed_offsets()
+
+    def _packed_offsets(self, lengths: Optional[array] = None) -> array:
+        """Where each string starts when the strings are back to back in row order"""
+        lengths = self.lengths if lengths is None else lengths
+        # (Nulls have length -1 and take no bytes)
+        if -1 in lengths:
+            lengths = map(max, lengths, repeat(0))
+        offsets = array('q', accumulate(lengths, initial=0))
+        offsets.pop()
+        return offsets
+
+    def dump(self, live: Optional[bytes] = None) -> Dict[str, Any]:
+        """Parts to write a snapshot from, keeping only the positions flagged in live
+
+        The strings are written back to back in row order; stale bytes left by
+        updates are dropped on the way. The offsets are written too, although
+        they follow from the lengths, since loading them is quicker than adding
+        the lengths up again.
+        """
+        offsets, lengths = self.offsets, self.lengths
+        if live is not None:
+            offsets = array('q', compress(offsets, live))
+            lengths = array('i', compress(lengths, live))
+        elif self.offsets == self._packed_offsets():
+            return {'buffer': bytes(self.buffer), 'offsets': offsets, 'lengths': lengths}
+        ends = map(add, offsets, map(max, lengths, repeat(0)))
+        buffer = b''.join(map(self.buffer.__getitem__, map(slice, offsets, ends)))
+        return {'buffer': buffer, 'offsets': self._packed_offsets(lengths), 'lengths': lengths}
+
+    def restore(self, parts: Dict[str, Any], size: int) -> None:
+        """Take over the parts dump() returned (older snapshots have no offsets)"""
+        self.buffer = bytearray(parts['buffer'])
+        self.lengths = array('i', parts['lengths'])
+        if 'offsets' in parts:
+            self.offsets = array('q', parts['offsets'])
+        else:
+            self.offsets = self._packed_offsets()
+
+
+COLUMN_TYPES = {
+    'int': lambda: NumberColumn('q'),
+    'float': lambda: NumberColumn('d'),
+    'bool': BoolColumn,
+    'str': StrColumn,
+}
+
+
+# Turns tombstone flags into live flags
+LIVE = bytes.maketrans(b'\x00\x01', b'\x01\x00')
+
+
+class DenseStore:
+    """Bookkeeping shared by engines that address rows by position
+
+    Row IDs live in a dense sorted array, and deleted positions are marked in a
+    tombstone bitmap until vacuum(). Subclasses say how to build the row at a position.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.dead = Bitmap()
+        self.dead_count = 0
+
+    def _position(self, row_id: int) -> int:
+        """Position of a live row, or -1"""
+        try:
+            pos = bisect_left(self.ids, row_id)
+        except TypeError:
+            return -1
+        if pos < len(self.ids) and self.ids[pos] == row_id and not self.dead.get(pos):
+            return pos
+        return -1
+
+    def _materialize(self, pos: int) -> Dict:
+        raise NotImplementedError
+
+    def _live_positions(self) -> array:
+        return array('q', (pos for pos in range(len(self.ids)) if not self.dead.get(pos)))
+
+    def _reset_tombstones(self) -> None:
+        self.dead = Bitmap.from_flags(bytes(len(self.ids)))
+        self.dead_count = 0
+
+    def _live(self, values: array) -> array:
+        """Per-position values with the tombstoned positions left out"""
+        if not self.dead_count:
+            return values
+        return array(values.typecode, compress(values, self.dead.to_flags().translate(LIVE)))
+
+    # ---- mapping protocol used by Tbl ----
+
+    def __len__(self) -> int:
+        return len(self.ids) - self.dead_count
+
+    def __contains__(self, row_id: int) -> bool:
+        return self._position(row_id) >= 0
+
+    def __getitem__(self, row_id: int) -> Dict:
+        pos = self._position(row_id)
+        if pos < 0:
+            raise KeyError(row_id)
+        return self._materialize(pos)
+
+    def __iter__(self) -> Iterator[int]:
+        for pos, row_id in enumerate(self.ids):
+            if not self.dead.get(pos):
+                yield row_id
+
+    def get(self, row_id: int, default: Any = None) -> Optional[Dict]:
+        pos = self._position(row_id)
+        return default if pos < 0 else self._materialize(pos)
+
+    def values(self) -> Iterator[Dict]:
+        for pos in range(len(self.ids)):
+            if not self.dead.get(pos):
+                yield self._materialize(pos)
+
+    # ---- records: rows are built as dicts already ----
+
+    layout = None
+
+    def records(self, ids: Optional[Iterable[int]] = None) -> Iterable[Dict]:
+        """Every row, or the rows of the given IDs (skipping ones that are gone)"""
+        if ids is None:
+            return self.values()
+        return filter(None, map(self.get, ids))
+
+    def to_rows(self, records: Iterable[Dict]) -> Iterable[Dict]:
+        return records
+
+    def by_position(self) -> 'Positions':
+        """Rows in scan order, for splitting a scan by position"""
+        return Positions(self)
+
+    def remove(self, row_id: int) -> Optional[Dict]:
+        """Tombstone a row, returning it (or None if it wasn't there)"""
+        pos = self._position(row_id)
+        if pos < 0:
+            return None
+        row = self._materialize(pos)
+        self.dead.set(pos, True)
+        self.dead_count += 1
+
+        # Reclaim space once most of the table is tombstones
+        if self.dead_count > 1024 and self.dead_count > len(self):
+            self.vacuum()
+        return row
+
+    def copy(self) -> 'DenseStore':
+        """Copy to snapshot from while this store keeps changing"""
+        clone = copy.copy(self)
+        clone.ids = self.ids[:]
+        clone.dead = copy.deepcopy(self.dead)
+        return clone
+
+    def vacuum(self) -> None:
+        raise NotImplementedError
+
+    def attach(self, path: str, pool: Any) -> None:
+        """Nothing to open by default"""
+
+    def flush(self) -> None:
+        """Nothing to write back by default"""
+
+    def after_checkpoint(self, snapshot: Any) -> None:
+        """Nothing to clean up by default"""
+
+    def close(self) -> None:
+        """Nothing to release by default"""
+
+    def destroy(self) -> None:
+        """Nothing on disk by default besides the snapshot"""
+
+
+class Positions:
+    """Rows of a dense store by position (None where tombstoned), built as they are read"""
+
+    def __init__(self, store: DenseStore):
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.store.ids)
+
+    def __getitem__(self, key: Any) -> Any:
+        if isinstance(key, slice):
+            return map(self.__getitem__, range(*key.indices(len(self))))
+        return None if self.store.dead.get(key) else self.store._materialize(key)
+
+
+class ColumnStore(DenseStore):
+    """Typed columnar engine: one packed container per column instead of a dict per row
+
+    A row's position in the ID array indexes every column.
+    """
+
+    kind = 'column'
+
+    def __init__(self, columns: Dict[str, str], rows: Optional[Dict] = None):
+        for col, col_type in columns.items():
+            if col_type not in COLUMN_TYPES:
+                raise ValueError(f"Column '{col}' has type '{col_type}', columnar storage supports: "
+                                 f"{', '.join(COLUMN_TYPES)}")
+        super().__init__()
+        self.data = {col: COLUMN_TYPES[col_type]() for col, col_type in columns.items()}
+        for row_id, row in (rows or {}).items():
+            self.put(row_id, {k: v for k, v in row.items() if k != '_id'})
+
+    def _materialize(self, pos: int) -> Dict:
+        row = {'_id': self.ids[pos]}
+        for col, column in self.data.items():
+            value = column.get(pos)
+            if value is not None:
+                row[col] = value
+        return row
+
+    def _coerce(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {col: self.data[col].coerce(col, value) for col, value in data.items()}
+
+    # ---- writes ----
+
+    def put(self, row_id: int, data: Dict[str, Any]) -> Dict:
+        """Store a new row (or replace an existing one) and return it"""
+        values = self._coerce(data)
+        row = [values.get(col) for col in self.data]
+
+        pos = bisect_left(self.ids, row_id)
+        if pos < len(self.ids) and self.ids[pos] == row_id:
+            # Replaying a row we already hold: overwrite (and revive) it in place
+            if self.dead.get(pos):
+                self.dead.set(pos, False)
+                self.dead_count -= 1
+            for column, value in zip(self.data.values(), row):
+                column.set(pos, value)
+        elif pos == len(self.ids):
+            self.ids.append(row_id)
+            self.dead.append(False)
+            for column, value in zip(self.data.values(), row):
+                column.append(value)
+        else:
+            # Only happens when replaying the log over a vacuumed snapshot
+            self.ids.insert(pos, row_id)
+            self.dead.insert(pos, False)
+            for column, value in zip(self.data.values(), row):
+                column.insert(pos, value)
+        return self._materialize(pos)
+
+    def put_many(self, first_id: int, batch: List[Dict[str, Any]]) -> List[Dict]:
+        """Store rows under consecutive IDs starting at first_id, all or nothing"""
+        # Type-check the whole batch before touching any column
+        coerced = [self._coerce(data) for data in batch]
+        if not self.ids or first_id > self.ids[-1]:
+            self.ids.extend(range(first_id, first_id + len(batch)))
+            for _ in batch:
+                self.dead.append(False)
+            for col, column in self.data.items():
+                for values in coerced:
+                    column.append(values.get(col))
+            start = len(self.ids) - len(batch)
+            return [self._materialize(pos) for pos in range(start, len(self.ids))]
+        return [self.put(row_id, data) for row_id, data in enumerate(coerced, first_id)]
+
+    def copy(self) -> 'ColumnStore':
+        clone = super().copy()
+        clone.data = copy.deepcopy(self.data)
+        return clone
+
+    def dump(self, columns: List[str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Engine state and the parts of every column (plus '_id') to write a snapshot from
+
+        Parts are the columns' own arrays, named '<column>.<part>', with
+        tombstoned positions left out.
+        """
+        live = self.dead.to_flags().translate(LIVE) if self.dead_count else None
+        lists = {'_id': self._live(self.ids)}
+        for col, column in self.data.items():
+            for part, data in column.dump(live).items():
+                lists[f"{col}.{part}"] = data
+        return {}, lists
+
+    @classmethod
+    def restore(cls, columns: Dict[str, str], state: Dict[str, Any],
+                lists: Dict[str, Any]) -> 'ColumnStore':
+        """Rebuild a store from what dump() returned"""
+        store = cls(columns)
+        store.ids = array('q', lists['_id'])
+        store._reset_tombstones()
+        for col, column in store.data.items():
+            # Exact names: a prefix would also take in parts of a column named '<col>.x'
+            names = {part: f"{col}.{part}" for part in column.PARTS}
+            parts = {part: lists[name] for part, name in names.items() if name in lists}
+            column.restore(parts, len(store.ids))
+        return store
+
+    def patch(self, row_id: int, data: Dict[str, Any]) -> Dict:
+        """Change some columns of a row and return the updated row"""
+        pos = self._position(row_id)
+        if pos < 0:
+            raise KeyError(row_id)
+        for col, value in self._coerce(data).items():
+            self.data[col].set(pos, value)
+        return self._materialize(pos)
+
+    def vacuum(self) -> None:
+        """Drop tombstoned rows and unreferenced string bytes"""
+        keep = self._live_positions()
+        self.ids = array('q', (self.ids[pos] for pos in keep))
+        for column in self.data.values():
+            column.compact(keep)
+        self._reset_tombstones()
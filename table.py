@@ -1,54 +1,455 @@
-from typing import Any, Dict, List, Optional
+import heapq
+import math
+from itertools import islice, repeat
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aggregate import aggregate, parse_aggs
+from index import INDEX_TYPES
+from query import compile_where, conditions, selectivity, sort_key
+from pager import PagedStore
+from storage import MISSING, ColumnStore, RowStore
+import vector
+
+STORAGE_TYPES = {'row': RowStore, 'column': ColumnStore, 'paged': PagedStore}
+
+# Planner costs, relative to reading one row in a full scan
+FETCH_COST = 2.0
+SORT_COST = 0.1
 
 class Tbl:
     """Represents a database tbl"""
-    def __init__(meow, name: str, columns: Dict[str, str]):
+    def __init__(meow, name: str, columns: Dict[str, str], storage: str = 'row'):
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown storage '{storage}'. Use: {', '.join(STORAGE_TYPES)}")
         meow.name = name
         meow.columns = columns
-        meow.rows = {}
+        meow.rows = STORAGE_TYPES[storage](columns)
         meow.next_id = 1
+        meow.indexes = {}
+        # Set by PyDBMS(parallel_workers=...) to split big scans across processes
+        meow.parallel = None
+    
+    def __setstate__(self, state: Dict) -> None:
+        # Tables pickled before indexes/storage engines existed
+        state.setdefault('indexes', {})
+        state.setdefault('parallel', None)
+        rows = state['rows']
+        if isinstance(rows, dict) and not hasattr(rows, 'layout'):
+            # A plain dict, or a RowStore from before rows were stored as tuples
+            state['rows'] = RowStore(state['columns'], rows=dict(dict.items(rows)))
+        self.__dict__.update(state)
     
-    def insert(self, data: Dict[str, Any]) -> int:
-        """Insert a row and return its ID"""
+    def copy(self) -> 'Tbl':
+        """Copy to snapshot from while this table keeps changing"""
+        clone = Tbl.__new__(Tbl)
+        clone.__dict__.update(self.__dict__)
+        clone.columns = dict(self.columns)
+        clone.rows = self.rows.copy()
+        clone.indexes = {col: index.copy() for col, index in self.indexes.items()}
+        return clone
+    
+    @property
+    def storage(self) -> str:
+        """Name of the storage engine holding the rows"""
+        return self.rows.kind
+    
+    def insert(self, data: Dict[str, Any], row_id: Optional[int] = None) -> int:
+        """Insert a row and return its ID (row_id is only passed when replaying the log)"""
         # Validate columns
         for col in data.keys():
             if col not in self.columns:
                 raise ValueError(f"Column '{col}' does not exist in table '{self.name}'")
         
-        row_idx = self.next_id
-        self.rows[row_idx] = {'_id': row_idx, **data}
-        self.next_id += 1
+        self._check_indexes([data])
+        
+        row_idx = self.next_id if row_id is None else row_id
+        old = self.rows.get(row_idx)
+        if old is not None:
+            self._unindex(old)
+        
+        row = self.rows.put(row_idx, data)
+        try:
+            self._index(row)
+        except Exception:
+            # Leave no stored row behind that the indexes don't know about
+            self._unindex(row)
+            self.rows.remove(row_idx)
+            raise
+        self.next_id = max(self.next_id, row_idx + 1)
         return row_idx
     
-    def select(self, where: Optional[Dict] = None, limit: Optional[int] = None) -> List[Dict]:
-        """Query rows with optional filtering"""
-        results = list(self.rows.values())
+    def insert_many(self, batch: List[Dict[str, Any]], first_id: Optional[int] = None) -> List[int]:
+        """Insert a batch of rows under consecutive IDs and return them"""
+        # Validate columns once for the whole batch
+        used = set()
+        for data in batch:
+            used.update(data.keys())
+        for col in used:
+            if col not in self.columns:
+                raise ValueError(f"Column '{col}' does not exist in table '{self.name}'")
+        
+        if not batch:
+            return []
+        self._check_indexes(batch)
+        
+        first = self.next_id if first_id is None else first_id
+        if first_id is not None:
+            # Replaying the log: clear out any rows this batch overwrites
+            for row_id in range(first, first + len(batch)):
+                old = self.rows.get(row_id)
+                if old is not None:
+                    self._unindex(old)
+        
+        rows = self.rows.put_many(first, batch)
+        try:
+            for index in self.indexes.values():
+                index.add_many(rows)
+        except Exception:
+            for row in rows:
+                self._unindex(row)
+                self.rows.remove(row['_id'])
+            raise
+        self.next_id = max(self.next_id, first + len(batch))
+        return list(range(first, first + len(batch)))
+    
+    def iter_select(self, where: Optional[Dict] = None, limit: Optional[int] = None,
+                    order_by: Optional[str] = None, desc: bool = False,
+                    snapshot: bool = False, scan: Optional[Callable] = None) -> Iterator[Dict]:
+        """Lazily yield matching rows, stopping as soon as LIMIT rows are out
+        
+        With snapshot=True the candidate rows are pinned before returning, so the
+        results don't change if the table is written to while they are read.
+        scan, if given, wraps the candidate rows before filtering (to count them).
+        """
+        return self.rows.to_rows(self._records(where, limit, order_by, desc, snapshot, scan))
+    
+    def _records(self, where: Optional[Dict] = None, limit: Optional[int] = None,
+                 order_by: Optional[str] = None, desc: bool = False,
+                 snapshot: bool = False, scan: Optional[Callable] = None) -> Iterator:
+        """iter_select on the store's own records (see RowStore.records)
+        
+        Rows are filtered, ordered and limited as stored, so only the rows that
+        come out ever need turning into dicts.
+        """
+        if order_by is not None and order_by not in self.columns and order_by != '_id':
+            raise ValueError(f"Column '{order_by}' does not exist in table '{self.name}'")
         
-        # Apply WHERE filter
-        if where:
-            results = [row for row in results 
-                      if all(row.get(k) == v for k, v in where.items())]
+        layout = self.rows.layout
+        plan = self.plan(where, order_by, desc, limit)
+        # A LIMIT without ORDER BY stays on the plain scan below: that one stops early
+        whole = where and plan['access'] == 'full_scan' and not (limit and order_by is None)
+        found = vector.prefilter(self.rows, where) if whole else None
+        if found is not None:
+            # Checked a column at a time (see vector.py); what's left is checked per row
+            results, rest = found
+            if scan is not None:
+                scan(range(len(self.rows)))
+            results = iter(results)
+            if rest:
+                results = filter(compile_where(rest, layout), results)
+            ordered = plan['sort'] == 'none'
+        elif whole and self._splits(plan):
+            # Filtered by worker processes (see parallel.py), which hand back pinned rows
+            if scan is not None:
+                scan(range(len(self.rows)))
+            results = iter(self.parallel.filter(self.rows, where))
+            ordered = plan['sort'] == 'none'
+        else:
+            results, ordered = self._access(plan)
+            if scan is not None:
+                results = scan(results)
+            if snapshot:
+                # Stored rows are never changed in place, so holding on to them is enough
+                results = list(results)
+            
+            # Apply WHERE filter
+            if where:
+                results = filter(compile_where(where, layout), results)
+        
+        # Apply ORDER BY unless an index already produced the right order.
+        # Sorting has to see every row, but with a LIMIT a heap keeps only the top few
+        if order_by is not None and not ordered:
+            key = sort_key(order_by, layout)
+            try:
+                if limit:
+                    pick = heapq.nlargest if desc else heapq.nsmallest
+                    results = iter(pick(limit, results, key=key))
+                else:
+                    results = iter(sorted(results, key=key, reverse=desc))
+            except TypeError:
+                raise ValueError(f"Column '{order_by}' holds values that can't be ordered")
         
         # Apply LIMIT
         if limit:
-            results = results[:limit]
+            results = islice(results, limit)
         
         return results
     
+    def select(self, where: Optional[Dict] = None, limit: Optional[int] = None,
+               order_by: Optional[str] = None, desc: bool = False,
+               scan: Optional[Callable] = None) -> List[Dict]:
+        """Query rows with optional filtering and ordering"""
+        return list(self.iter_select(where, limit, order_by, desc, scan=scan))
+    
+    def aggregate(self, aggs: Dict[str, Any], group_by: Optional[List[str]] = None,
+                  where: Optional[Dict] = None, scan: Optional[Callable] = None) -> List[Dict]:
+        """Compute aggregates per group in a single streaming pass over matching rows"""
+        group_by = list(group_by or [])
+        specs = parse_aggs(aggs)
+        for col in group_by + [column for _, _, column in specs if column is not None]:
+            if col not in self.columns and col != '_id':
+                raise ValueError(f"Column '{col}' does not exist in table '{self.name}'")
+        if self._splits(self.plan(where)):
+            if scan is not None:
+                scan(range(len(self.rows)))
+            return self.parallel.aggregate(self.rows, where, group_by, specs)
+        return aggregate(self._records(where, scan=scan), group_by, specs, self.rows.layout)
+    
     def update(self, data: Dict[str, Any], where: Dict[str, Any]) -> int:
         """Update rows matcching WHERE clause"""
-        matching = self.select(where=where)
-        for row in matching:
-            self.rows[row['_id']].update(data)
-        return len(matching)
+        return len(self.update_where(data, where)[0])
     
     def delete(self, where: Dict[str, Any]) -> int:
         """Delete rows matching WHERE clause"""
-        matching1 = self.select(where=where)
-        for row in matching1:
-            del self.rows[row['_id']]
-        return len(matching1)
+        return self.delete_rows(self.match_ids(where))
+    
+    def match_ids(self, where: Optional[Dict] = None,
+                  scan: Optional[Callable] = None) -> List[int]:
+        """Return the IDs of rows matching WHERE clause"""
+        key = '_id' if self.rows.layout is None else self.rows.layout['_id']
+        return [record[key] for record in self._records(where, scan=scan)]
+    
+    def update_where(self, data: Dict[str, Any], where: Dict[str, Any],
+                     scan: Optional[Callable] = None) -> Tuple[List[int], Optional[List[Dict]]]:
+        """Update matching rows as the scan finds them
+        
+        A value in data may be a callable, given the row and returning its new
+        value (e.g. lambda row: row['stock'] - 1). Returns the IDs of the rows
+        changed and, when any value was computed, the computed values of each
+        (None otherwise). If a callable fails, rows already changed are put back.
+        """
+        touched = [col for col in data if col in self.indexes]
+        computed = {col: value for col, value in data.items() if callable(value)}
+        ids, changes = [], []
+        # Old values of the rows changed so far, to put back if a callable fails
+        undo = []
+        absent = None if self.rows.layout is None else MISSING
+        try:
+            for row in self.iter_select(where, scan=scan):
+                values = data
+                if computed:
+                    undo.append((row['_id'], {col: row.get(col, absent) for col in data}))
+                    changed = {col: compute(row) for col, compute in computed.items()}
+                    changes.append(changed)
+                    values = {**data, **changed}
+                self._patch(row, values, touched)
+                ids.append(row['_id'])
+        except Exception:
+            for row_id, old in reversed(undo):
+                self._patch(self.rows.get(row_id), old, touched)
+            raise
+        return ids, changes if computed else None
+    
+    def update_rows(self, ids: List[int], data: Dict[str, Any],
+                    changes: Optional[List[Dict]] = None) -> int:
+        """Apply data to the given row IDs, skipping ones that are gone
+        
+        changes, if given, holds each row's computed values (see update_where).
+        """
+        columns = [*data, *(changes[0] if changes else ())]
+        touched = [col for col in columns if col in self.indexes]
+        count = 0
+        for row_id, changed in zip(ids, changes or repeat(None)):
+            row = self.rows.get(row_id)
+            if row is not None:
+                self._patch(row, data if changed is None else {**data, **changed}, touched)
+                count += 1
+        return count
+    
+    def _patch(self, row: Dict, data: Dict[str, Any], touched: List[str]) -> None:
+        """Write data into one row, moving its entries in the indexes on touched columns"""
+        row_id = row['_id']
+        for col in touched:
+            self.indexes[col].check([data[col]])
+        for col in touched:
+            self.indexes[col].remove(row.get(col), row_id)
+        row = self.rows.patch(row_id, data)
+        for col in touched:
+            self.indexes[col].add(row.get(col), row_id)
+    
+    def delete_rows(self, ids: List[int]) -> int:
+        """Delete the given row IDs, skipping ones that are gone"""
+        count = 0
+        for row_id in ids:
+            row = self.rows.remove(row_id)
+            if row is not None:
+                self._unindex(row)
+                count += 1
+        return count
     
     def count(self) -> int:
         """Return number of rows"""
         return len(self.rows)
+    
+    def apply(self, record: Dict) -> None:
+        """Replay one row-level log record (records are idempotent, so replaying twice is harmless)"""
+        op = record['op']
+        if op == 'insert':
+            self.insert(record['data'], row_id=record['id'])
+        elif op == 'insert_many':
+            self.insert_many(record['rows'], first_id=record['first_id'])
+        elif op == 'update':
+            self.update_rows(record['ids'], record['data'], record.get('changes'))
+        elif op == 'delete':
+            self.delete_rows(record['ids'])
+        elif op == 'create_index':
+            if record['column'] not in self.indexes:
+                self.create_index(record['column'], record.get('kind', 'hash'))
+        elif op == 'drop_index':
+            self.indexes.pop(record['column'], None)
+    
+    def vacuum(self) -> None:
+        """Reclaim space left behind by deleted and updated rows"""
+        self.rows.vacuum()
+    
+    # ============ INDEXES ============
+    
+    def create_index(self, column: str, kind: str = 'hash') -> None:
+        """Build a 'hash' (equality) or 'sorted' (range and ORDER BY) index on column"""
+        if column not in self.columns:
+            raise ValueError(f"Column '{column}' does not exist in table '{self.name}'")
+        if column in self.indexes:
+            raise ValueError(f"Column '{column}' is already indexed")
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{kind}'. Use: {', '.join(INDEX_TYPES)}")
+        
+        index = INDEX_TYPES[kind](column)
+        index.build(self.rows.values())
+        self.indexes[column] = index
+    
+    def drop_index(self, column: str) -> None:
+        """Remove the index on column"""
+        if column not in self.indexes:
+            raise ValueError(f"Column '{column}' has no index")
+        del self.indexes[column]
+    
+    def _check_indexes(self, batch: List[Dict]) -> None:
+        """Make sure every index can take the values of rows about to be stored"""
+        for col, index in self.indexes.items():
+            index.check(data.get(col) for data in batch)
+    
+    def _index(self, row: Dict) -> None:
+        for col, index in self.indexes.items():
+            index.add(row.get(col), row['_id'])
+    
+    def _unindex(self, row: Dict) -> None:
+        for col, index in self.indexes.items():
+            index.remove(row.get(col), row['_id'])
+    
+    # ============ PLANNING ============
+    
+    def plan(self, where: Optional[Dict] = None, order_by: Optional[str] = None,
+             desc: bool = False, limit: Optional[int] = None) -> Dict:
+        """Pick the cheapest way to find a query's rows and estimate how many come back
+        
+        The candidates are a full scan, a direct _id lookup, a lookup in any index
+        on a WHERE column and a walk of a sorted index on the ORDER BY column.
+        """
+        total = len(self.rows)
+        pairs = {col: conditions(cond) for col, cond in (where or {}).items()}
+        
+        # Row IDs each indexed (or _id) condition matches, in ID order
+        lookups = {}
+        for col, col_pairs in pairs.items():
+            if col == '_id':
+                ids = self._id_search(col_pairs)
+            elif col in self.indexes:
+                ids = self.indexes[col].search(col_pairs)
+            else:
+                continue
+            if ids is not None:
+                lookups[col] = ids
+        
+        def estimate(columns: Iterable[str], rows: int) -> int:
+            # Lookups give exact fractions, other conditions fall back to guesses
+            fraction = 1.0
+            for col in columns:
+                if col in lookups:
+                    fraction *= len(lookups[col]) / total if total else 0.0
+                else:
+                    fraction *= selectivity(pairs[col])
+            return int(math.ceil(rows * fraction))
+        
+        def candidate(access: str, column: Optional[str], ids: Optional[List[int]],
+                      rows_read: int, matches: int, ordered: bool) -> Dict:
+            sort = 'none'
+            cost = rows_read * (1.0 if access == 'full_scan' else FETCH_COST)
+            if order_by is not None and not ordered:
+                sort = 'top-n heap' if limit else 'full sort'
+                cost += matches * math.log2(min(limit or matches, matches) + 1) * SORT_COST
+            return {
+                'table': self.name,
+                'access': access,
+                'column': column,
+                'index': self.indexes[column].kind if column in self.indexes else None,
+                'ids': ids,
+                'rows_read': rows_read,
+                'estimated_rows': min(matches, limit) if limit else matches,
+                'sort': sort,
+                'order_by': order_by,
+                'desc': desc,
+                'limit': limit,
+                'cost': round(cost, 1)
+            }
+        
+        in_id_order = order_by in (None, '_id') and not desc
+        candidates = [candidate('full_scan', None, None, total,
+                                estimate(pairs, total), in_id_order)]
+        
+        for col, ids in lookups.items():
+            access = 'id_lookup' if col == '_id' else 'index_lookup'
+            ordered = in_id_order
+            if order_by == col and access == 'index_lookup' and self.indexes[col].kind == 'sorted':
+                # Range results come back in value order already
+                ids, ordered = list(reversed(ids)) if desc else ids, True
+            else:
+                ids = sorted(ids)
+            rest = [other for other in pairs if other != col]
+            candidates.append(candidate(access, col, ids, len(ids),
+                                        estimate(rest, len(ids)), ordered))
+        
+        index = self.indexes.get(order_by)
+        if index is not None and index.kind == 'sorted':
+            matches = estimate(pairs, total)
+            # With a LIMIT the walk stops once enough matching rows have turned up
+            rows_read = total
+            if limit and matches:
+                rows_read = min(total, int(math.ceil(limit * total / matches)))
+            candidates.append(candidate('index_order', order_by, None, rows_read, matches, True))
+        
+        return min(candidates, key=lambda plan: plan['cost'])
+    
+    def _id_search(self, pairs: List[Tuple[str, Any]]) -> Optional[List[int]]:
+        """Row IDs named by '=' or 'in' conditions on _id, or None for anything else"""
+        for op, operand in pairs:
+            if op == '=':
+                return [operand] if operand in self.rows else []
+            if op == 'in':
+                return [row_id for row_id in set(operand) if row_id in self.rows]
+        return None
+    
+    def _splits(self, plan: Dict) -> bool:
+        """Whether a scan planned as plan is split across processes (see parallel.py)"""
+        return self.parallel is not None and self.parallel.applies(self, plan)
+    
+    def _access(self, plan: Dict) -> Tuple[Iterable, bool]:
+        """Rows that could match the query, found the way the plan says
+        
+        Also reports whether the rows already come out in ORDER BY order.
+        """
+        ordered = plan['sort'] == 'none'
+        if plan['access'] == 'full_scan':
+            return self.rows.records(), ordered
+        if plan['access'] == 'index_order':
+            return self.rows.records(self.indexes[plan['column']].ordered(plan['desc'])), True
+        return self.rows.records(plan['ids']), ordered
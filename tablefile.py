@@ -0,0 +1,247 @@
+"""
+Binary snapshot files for tables
+
+A snapshot (tables/<name>.tbl) is a small JSON header followed by one block
+per column. Each block stores its column in the most compact encoding that
+fits what the column actually holds:
+
+    array            a column store's own typed array, little-endian
+    bytes            a column store's own bitmap or string buffer
+    int64, float64   packed little-endian arrays
+    bool             one byte per value
+    dict             the distinct strings once, plus a 1- or 2-byte code per row
+                     (str columns where values repeat)
+    str              the strings joined by NUL bytes
+    json             anything else, as a JSON array
+
+Indexes are stored the same way (a sorted index as its values and row IDs in
+order), so loading a table doesn't rebuild them.
+
+Only values are stored; rows without one (None, or no key at all in a row
+table) are marked in a state byte per row, kept only for blocks that need it.
+Blocks are zlib-compressed when that makes them smaller, and every block (and
+the header) carries a CRC-32 checked on load, so a damaged snapshot is refused
+instead of turning into wrong rows. Nothing is unpickled when reading one.
+"""
+
+import gc
+import json
+import struct
+import sys
+import zlib
+from array import array
+from itertools import compress, repeat
+from operator import is_
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+from index import INDEX_TYPES
+from storage import MISSING
+from table import STORAGE_TYPES, Tbl
+
+MAGIC = b'PYDBTBL\n'
+FORMAT_VERSION = 1
+# Magic, format version and header length, then the header and its CRC-32
+PREFIX = struct.Struct('<8sHI')
+CRC = struct.Struct('<I')
+# Fast compression: snapshots are written far more often than space is short
+COMPRESS_LEVEL = 1
+# Strings are dictionary-encoded when at most this many are distinct and each repeats
+MAX_DICTIONARY = 65536
+
+# State bytes of rows in a block that has any rows without a value
+VALUE, NULL, ABSENT = 0, 1, 2
+IS_VALUE = bytes([1] + [0] * 255)
+INT64_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+
+def _pack(typecode: str, values: List) -> bytes:
+    packed = array(typecode, values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack(typecode: str, data: bytes) -> List:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tolist()
+
+
+def _encode(values: Any) -> Tuple[Dict[str, Any], bytes]:
+    """Block description and payload for one column's values (or an array or bytes as is)"""
+    meta: Dict[str, Any] = {}
+    if isinstance(values, array):
+        meta.update(encoding='array', typecode=values.typecode, itemsize=values.itemsize)
+        if sys.byteorder == 'big':
+            values = array(values.typecode, values)
+            values.byteswap()
+        return meta, values.tobytes()
+    if isinstance(values, (bytes, bytearray)):
+        meta['encoding'] = 'bytes'
+        return meta, bytes(values)
+    states = b''
+    if None in values or MISSING in values:
+        if MISSING in values:
+            states = bytes(NULL if value is None else ABSENT if value is MISSING else VALUE
+                           for value in values)
+        else:
+            states = bytes(map(is_, values, repeat(None)))
+        values = list(compress(values, states.translate(IS_VALUE)))
+        meta['states'] = len(states)
+
+    kinds = set(map(type, values))
+    if kinds == {int} and INT64_RANGE[0] <= min(values) and max(values) <= INT64_RANGE[1]:
+        meta['encoding'], data = 'int64', _pack('q', values)
+    elif kinds == {float}:
+        meta['encoding'], data = 'float64', _pack('d', values)
+    elif kinds == {bool}:
+        meta['encoding'], data = 'bool', bytes(values)
+    elif kinds == {str}:
+        distinct = set(values)
+        if len(distinct) <= MAX_DICTIONARY and len(distinct) * 2 <= len(values):
+            dictionary = sorted(distinct)
+            codes = {value: code for code, value in enumerate(dictionary)}
+            typecode = 'B' if len(dictionary) <= 256 else 'H'
+            words = json.dumps(dictionary, separators=(',', ':')).encode('utf-8')
+            meta['encoding'], meta['codes'], meta['dictionary_length'] = 'dict', typecode, len(words)
+            data = words + _pack(typecode, [codes[value] for value in values])
+        elif not any('\0' in value for value in values):
+            meta['encoding'] = 'str'
+            data = '\0'.join(values).encode('utf-8', 'surrogatepass')
+        else:
+            meta['encoding'] = 'json'
+            data = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    else:
+        meta['encoding'] = 'json'
+        data = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return meta, states + data
+
+
+def _decode(meta: Dict[str, Any], payload: bytes) -> Any:
+    """Values of one column from its block, with None or MISSING where rows have none"""
+    if meta['encoding'] == 'array':
+        values = array(meta['typecode'])
+        if values.itemsize != meta['itemsize']:
+            raise ValueError(f"Block '{meta['name']}' holds {meta['itemsize']}-byte items; "
+                             f"'{meta['typecode']}' arrays are {values.itemsize} bytes here")
+        values.frombytes(payload)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+    if meta['encoding'] == 'bytes':
+        return payload
+    count = meta.get('states', 0)
+    states, payload = payload[:count], payload[count:]
+
+    encoding = meta['encoding']
+    if encoding == 'int64':
+        values = _unpack('q', payload)
+    elif encoding == 'float64':
+        values = _unpack('d', payload)
+    elif encoding == 'bool':
+        values = list(map(bool, payload))
+    elif encoding == 'dict':
+        split = meta['dictionary_length']
+        dictionary = json.loads(payload[:split])
+        values = list(map(dictionary.__getitem__, _unpack(meta['codes'], payload[split:])))
+    elif encoding == 'str':
+        values = payload.decode('utf-8', 'surrogatepass').split('\0')
+    elif encoding == 'json':
+        values = json.loads(payload)
+    else:
+        raise ValueError(f"Unknown block encoding '{encoding}'")
+
+    if not states:
+        return values
+    # Each state picks where the row's value comes from
+    sources = (iter(values), repeat(None), repeat(MISSING))
+    return list(map(next, map(sources.__getitem__, states)))
+
+
+def write_table(f: IO[bytes], table: Tbl, compress: bool = True) -> None:
+    """Write a table, with its indexes, as a snapshot file"""
+    state, lists = table.rows.dump(list(table.columns))
+    blocks, payloads = [], []
+
+    def add(name: str, values: Any, index: Optional[str] = None) -> None:
+        meta, payload = _encode(values)
+        if compress:
+            packed = zlib.compress(payload, COMPRESS_LEVEL)
+            if len(packed) < len(payload):
+                payload, meta['zlib'] = packed, True
+        meta.update(name=name, length=len(payload), crc32=zlib.crc32(payload))
+        if index is not None:
+            meta['index'] = index
+        blocks.append(meta)
+        payloads.append(payload)
+
+    for name, values in lists.items():
+        add(name, values)
+    for col, index in table.indexes.items():
+        for name, values in index.dump().items():
+            add(name, values, col)
+
+    header = json.dumps({
+        'name': table.name,
+        'columns': table.columns,
+        'storage': table.storage,
+        'next_id': table.next_id,
+        'indexes': {col: index.kind for col, index in table.indexes.items()},
+        'rows': len(lists['_id']),
+        'engine': state,
+        'blocks': blocks
+    }, separators=(',', ':')).encode('utf-8')
+    f.write(PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+    f.write(header)
+    f.write(CRC.pack(zlib.crc32(header)))
+    for payload in payloads:
+        f.write(payload)
+
+
+def read_table(f: IO[bytes]) -> Tbl:
+    """Read a snapshot file back into a table (a paged one still needs attaching to its data file)"""
+    # Loading creates a tuple per row and index entry and nothing that can form a
+    # cycle, so collector passes triggered on the way would only cost time
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _read_table(f)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _read_table(f: IO[bytes]) -> Tbl:
+    prefix = f.read(PREFIX.size)
+    if len(prefix) < PREFIX.size or prefix[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a PyDBMS table file")
+    _, version, length = PREFIX.unpack(prefix)
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Table file is format version {version}, newer than this PyDBMS "
+                         f"reads ({FORMAT_VERSION})")
+    header = f.read(length)
+    checksum = f.read(CRC.size)
+    if len(checksum) < CRC.size or CRC.unpack(checksum)[0] != zlib.crc32(header):
+        raise ValueError("Table file is damaged: its header fails the checksum")
+    header = json.loads(header)
+
+    lists: Dict[str, Any] = {}
+    index_lists: Dict[str, Dict[str, List]] = {col: {} for col in header['indexes']}
+    for meta in header['blocks']:
+        payload = f.read(meta['length'])
+        if len(payload) < meta['length'] or zlib.crc32(payload) != meta['crc32']:
+            raise ValueError(f"Table file of '{header['name']}' is damaged: "
+                             f"block '{meta['name']}' fails the checksum")
+        if meta.get('zlib'):
+            payload = zlib.decompress(payload)
+        target = lists if 'index' not in meta else index_lists[meta['index']]
+        target[meta['name']] = _decode(meta, payload)
+
+    table = Tbl(header['name'], header['columns'], header['storage'])
+    table.rows = STORAGE_TYPES[header['storage']].restore(table.columns, header['engine'], lists)
+    table.next_id = header['next_id']
+    for col, kind in header['indexes'].items():
+        table.indexes[col] = INDEX_TYPES[kind].restore(col, index_lists[col])
+    return table
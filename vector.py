@@ -0,0 +1,172 @@
+"""
+Column-at-a-time WHERE evaluation for columnar tables
+
+A full scan of a column table checks its conditions on int, float, bool and
+_id columns a whole column at a time, straight on the packed arrays
+ColumnStore keeps, instead of building a dict per row and testing that. With
+NumPy installed every condition is one vectorised comparison producing a
+boolean mask, taken over a read-only view of the array rather than a copy.
+Without it the comparisons run through map() at C speed, and the masks are
+byte strings ANDed together as big integers. Only rows passing every mask are
+built; conditions left over (on str columns, or with operands a column's type
+can't compare exactly) are checked on those rows as usual.
+
+Row and paged tables keep the per-row scan. Their rows are tuples of values of
+any type, already tested without building dicts, and pulling a column out of
+them costs as much as testing the rows.
+"""
+
+from itertools import compress, repeat
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from query import OPERATORS, RANGE_OPERATORS, conditions
+from storage import LIVE, BoolColumn, ColumnStore, NumberColumn
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+INT64_RANGE = (-2 ** 63, 2 ** 63 - 1)
+# Ints a float64 holds exactly
+FLOAT_EXACT = 2 ** 53
+
+
+def _comparable(kind: str, operand: Any) -> bool:
+    """Whether a column of kind compares with operand the same way Python does"""
+    if operand is None or isinstance(operand, bool):
+        return True
+    if isinstance(operand, int):
+        if kind == 'float':
+            return -FLOAT_EXACT <= operand <= FLOAT_EXACT
+        return INT64_RANGE[0] <= operand <= INT64_RANGE[1]
+    return isinstance(operand, float) and kind == 'float'
+
+
+def split_where(store, where: Dict) -> Tuple[List[Tuple[str, str, Any]], Dict]:
+    """(column, operator, operand) triples to check a column at a time, and the rest of where"""
+    kinds = {'_id': 'int'}
+    for col, column in store.data.items():
+        if isinstance(column, NumberColumn):
+            kinds[col] = 'int' if column.values.typecode == 'q' else 'float'
+        elif isinstance(column, BoolColumn):
+            kinds[col] = 'bool'
+
+    triples, rest = [], {}
+    for col, cond in where.items():
+        pairs = conditions(cond)
+        kind = kinds.get(col)
+        if kind is not None and all(_comparable(kind, value)
+                                    for op, operand in pairs
+                                    for value in (operand if op == 'in' else (operand,))):
+            triples.extend((col, op, operand) for op, operand in pairs)
+        else:
+            rest[col] = cond
+    return triples, rest
+
+
+def prefilter(store, where: Dict) -> Optional[Tuple[List[Dict], Dict]]:
+    """Rows of a full scan passing the column-at-a-time part of where, and the rest of where
+
+    None when store isn't a ColumnStore or no condition can be checked that way.
+    """
+    if not isinstance(store, ColumnStore):
+        return None
+    triples, rest = split_where(store, where)
+    if not triples:
+        return None
+    return list(map(store._materialize, positions(store, triples))), rest
+
+
+def positions(store, triples: List[Tuple[str, str, Any]]) -> List[int]:
+    """Positions of the live rows of a ColumnStore passing every triple"""
+    if numpy is not None:
+        return _numpy_positions(store, triples)
+    return _python_positions(store, triples)
+
+
+# ============ NUMPY ============
+
+def _numpy_view(buffer, dtype):
+    """A read-only ndarray over buffer, sharing its memory
+
+    The buffer can't grow while the view is alive, so views only live as long
+    as one condition's test (writers wait for the query under the table lock).
+    """
+    view = numpy.frombuffer(buffer, dtype)
+    view.flags.writeable = False
+    return view
+
+
+def _numpy_flags(bitmap, size: int):
+    bits = _numpy_view(bitmap.bits, numpy.uint8)
+    return numpy.unpackbits(bits, count=size, bitorder='little').view(bool)
+
+
+def _numpy_column(store, col: str, size: int):
+    """Values and null mask of a column as NumPy arrays"""
+    if col == '_id':
+        return _numpy_view(store.ids, numpy.int64), numpy.zeros(size, bool)
+    column = store.data[col]
+    if isinstance(column, BoolColumn):
+        return _numpy_flags(column.values, size), _numpy_flags(column.nulls, size)
+    dtype = numpy.int64 if column.values.typecode == 'q' else numpy.float64
+    return _numpy_view(column.values, dtype), _numpy_flags(column.nulls, size)
+
+
+def _numpy_test(values, nulls, op: str, operand: Any):
+    if op == 'in':
+        hits = numpy.isin(values, [value for value in operand if value is not None])
+        return hits | nulls if None in operand else hits & ~nulls
+    if operand is None:
+        # Only '=' finds the nulls; no comparison with None ever holds
+        if op in RANGE_OPERATORS:
+            return numpy.zeros(len(values), bool)
+        return nulls if op == '=' else ~nulls
+    hits = OPERATORS[op](values, operand)
+    # A null never equals anything, so it always differs
+    return hits | nulls if op == '!=' else hits & ~nulls
+
+
+def _numpy_positions(store, triples: List[Tuple[str, str, Any]]) -> List[int]:
+    size = len(store.ids)
+    mask = ~_numpy_flags(store.dead, size)
+    for col, op, operand in triples:
+        mask &= _numpy_test(*_numpy_column(store, col, size), op, operand)
+    return numpy.flatnonzero(mask).tolist()
+
+
+# ============ PURE PYTHON ============
+
+def _python_column(store, col: str) -> Tuple[Iterable, bytes]:
+    """Values and null flags of a column (one byte per row)"""
+    if col == '_id':
+        return store.ids, bytes(len(store.ids))
+    column = store.data[col]
+    values = column.values.to_flags() if isinstance(column, BoolColumn) else column.values
+    return values, column.nulls.to_flags()
+
+
+def _python_test(values: Iterable, nulls: bytes, op: str, operand: Any) -> int:
+    """Flags of the rows passing one condition, as a big integer"""
+    if op == 'in':
+        hits = bytes(map(set(value for value in operand if value is not None).__contains__,
+                         values))
+    elif operand is None:
+        if op in RANGE_OPERATORS:
+            return 0
+        return int.from_bytes(nulls if op == '=' else nulls.translate(LIVE), 'little')
+    else:
+        hits = bytes(map(OPERATORS[op], values, repeat(operand)))
+    hits, nulls = int.from_bytes(hits, 'little'), int.from_bytes(nulls, 'little')
+    if op == '!=' or (op == 'in' and None in operand):
+        return hits | nulls
+    return hits & ~nulls
+
+
+def _python_positions(store, triples: List[Tuple[str, str, Any]]) -> List[int]:
+    size = len(store.ids)
+    mask = int.from_bytes(store.dead.to_flags().translate(LIVE), 'little')
+    for col, op, operand in triples:
+        mask &= _python_test(*_python_column(store, col), op, operand)
+    return list(compress(range(size), mask.to_bytes(size, 'little')))
@@ -0,0 +1,239 @@
+"""
+Write-ahead log for PyDBMS
+Every write appends one JSON line per row-level operation instead of rewriting the database
+
+Appending and syncing are separate steps so that writers can append one
+after another and then share a single fsync (group commit).
+
+A checkpoint seals the log as a numbered segment (database.wal.1, ...) and
+carries on in a fresh one, so writers keep appending while snapshots are
+written. Sealed segments are deleted once the snapshots are on disk.
+"""
+
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import IO, Dict, Iterator, List, Tuple
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = 'wb') -> Iterator[IO]:
+    """Write a file under a temporary name and swap it in once it is safely on disk
+
+    A crash leaves either the old file or the new one, never a half-written mix.
+    """
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # Make the rename itself durable
+    try:
+        fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    except OSError:  # Directories can't be opened on Windows
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def encode(records: List[Dict]) -> bytes:
+    """Log lines for records, or a ValueError if they hold a value JSON can't"""
+    try:
+        return ''.join(json.dumps(record, separators=(',', ':')) + '\n'
+                       for record in records).encode('utf-8')
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Can't log this write: {e} (values must be str, int, float, bool, "
+                         f"None, or lists and dicts of them)")
+
+
+class WriteAheadLog:
+    """Append-only log of row-level operations"""
+
+    def __init__(self, path: str, sync: bool = True):
+        self.path = path
+        self.sync = sync
+        self._file = None
+        # Bytes appended and bytes known to be on disk since the log was opened.
+        # Both only grow (truncating counts as syncing), so they order every write
+        self.written = 0
+        self.synced = 0
+        self._sync_lock = threading.Lock()
+
+    def append(self, data: bytes) -> int:
+        """Append encoded records (see encode) without syncing; returns the number of bytes written
+
+        If the write fails, whatever part of it reached the file is cut off
+        again, so the next append doesn't follow a torn line. Callers must not
+        append from several threads at once.
+        """
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        start = os.fstat(self._file.fileno()).st_size
+        try:
+            self._file.write(data)
+            self._file.flush()
+        except BaseException:
+            self._discard_from(start)
+            raise
+        self.written += len(data)
+        return len(data)
+
+    def _discard_from(self, size: int) -> None:
+        """Drop a failed append: reopen the log on its next use, cut back to size"""
+        file, self._file = self._file, None
+        try:
+            file.close()
+        except OSError:
+            pass  # Flushing the rest failed too; it is cut off below
+        try:
+            with open(self.path, 'r+b') as f:
+                f.truncate(size)
+        except OSError:
+            pass  # Replay still drops a torn last line
+
+    def sync_to(self, position: int) -> None:
+        """Make sure everything appended up to position (a value of self.written) is on disk
+
+        Threads arriving while an fsync is running wait for it and then share
+        the next one, so a burst of commits costs a couple of fsyncs, not one each.
+        """
+        if not self.sync or self.synced >= position:
+            return
+        with self._sync_lock:
+            if self.synced >= position:
+                # Covered by the fsync we were waiting on
+                return
+            target = self.written
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+            self.synced = max(self.synced, target)
+
+    # ---- segments ----
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        """(number, path) of every sealed segment, oldest first"""
+        directory, name = os.path.split(self.path)
+        pattern = re.compile(re.escape(name) + r'\.(\d+)')
+        segments = []
+        for entry in os.listdir(directory or '.'):
+            match = pattern.fullmatch(entry)
+            if match:
+                segments.append((int(match.group(1)), os.path.join(directory, entry)))
+        return sorted(segments)
+
+    def rotate(self) -> int:
+        """Seal the log as a new segment and start an empty one; returns the segment's number
+
+        Callers must not append meanwhile.
+        """
+        with self._sync_lock:
+            # Writers still waiting on sync_to() would fsync the new file, not this one
+            if self._file is not None and self.sync and self.synced < self.written:
+                os.fsync(self._file.fileno())
+            self.synced = self.written
+            self._close()
+            number = max((number for number, _ in self._segments()), default=0) + 1
+            if os.path.exists(self.path):
+                os.replace(self.path, f"{self.path}.{number}")
+            return number
+
+    def drop_segments(self, upto: int) -> None:
+        """Delete sealed segments up to and including number upto"""
+        for number, path in self._segments():
+            if number <= upto:
+                os.remove(path)
+
+    # ---- reading ----
+
+    def replay(self) -> Iterator[Dict]:
+        """Yield every complete record, oldest segment first, dropping a torn tail left by a crash"""
+        for _, path in self._segments():
+            yield from self._read(path)
+        yield from self._read(self.path, truncate=True)
+
+    def records(self) -> Iterator[Dict]:
+        """Every complete record in every segment, leaving the files untouched"""
+        for _, path in self._segments():
+            yield from self._read(path)
+        yield from self._read(self.path)
+
+    def _read(self, path: str, truncate: bool = False) -> Iterator[Dict]:
+        if not os.path.exists(path):
+            return
+
+        good_end = 0
+        torn = False
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    torn = True
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    torn = True
+                    break
+                good_end += len(line)
+                yield record
+
+        # Cut the half-written record off so new appends start on a clean line
+        if torn and truncate:
+            with open(path, 'r+b') as f:
+                f.truncate(good_end)
+
+    def read_from(self, offset: int) -> Tuple[List[Dict], int]:
+        """Complete records written to the current segment after offset, and the offset just past them
+
+        Unlike replay() this never truncates: a partial last line may be a record
+        another process is still writing.
+        """
+        records = []
+        if not os.path.exists(self.path):
+            return records, offset
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                offset += len(line)
+        return records, offset
+
+    def size(self) -> int:
+        """Size of the current segment in bytes (including what other processes appended)"""
+        file = self._file
+        if file is not None:
+            try:
+                return os.fstat(file.fileno()).st_size
+            except (ValueError, OSError):
+                pass  # Closed by a rotation meanwhile
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:  # Not created yet, or just sealed by another process
+            return 0
+
+    def close(self) -> None:
+        """Sync and close the underlying file handle"""
+        with self._sync_lock:
+            if self._file is not None and self.sync and self.synced < self.written:
+                os.fsync(self._file.fileno())
+            self.synced = self.written
+            self._close()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None